@@ -18,6 +18,7 @@ from app.controllers.chat_controller import chat_bp
 from app.models import user
 from app.models import chat_session
 from app.models import message
+from app.models import message_validation
 
 from app.core.config import Config
 
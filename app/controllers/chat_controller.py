@@ -1,17 +1,30 @@
 # app/controllers/chat_controller.py
 
+import json
+import uuid
 from datetime import datetime
 
-from flask import Blueprint, request, jsonify, session, flash, render_template
+import pytz
+from flask import Blueprint, request, jsonify, session, flash, render_template, Response, stream_with_context
 from flask_login import login_required, current_user
 
+from app.core.config import Config
 from app.core.database import SessionLocal  # Import SessionLocal để lấy db_session_factory
+from app.rag.async_runner import run_coroutine_sync
 from app.repositories.implementations.sqlalchemy_chat_repository import SQLAlchemyChatRepository
 from app.services.chat_service import ChatService
 from app.services.chatbot_service import ChatbotService  # <-- Vẫn cần import ChatbotService ở đây
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/')
 CURRENT_SESSION_ID_KEY = 'current_chat_session_id'
+GUEST_CONVERSATION_ID_KEY = 'guest_conversation_id'
+
+
+def get_guest_conversation_id() -> str:
+    """Khoa bo nho hoi thoai cho khach (khong co chat session trong DB), luu trong flask.session"""
+    if GUEST_CONVERSATION_ID_KEY not in session:
+        session[GUEST_CONVERSATION_ID_KEY] = uuid.uuid4().hex
+    return f"guest:{session[GUEST_CONVERSATION_ID_KEY]}"
 
 
 @chat_bp.route('/', methods=['GET'])
@@ -207,7 +220,8 @@ def send_message_authenticated(user_id):
             result_dict = chat_service_instance.process_user_message(  # Đổi tên biến để rõ ràng hơn
                 user_id=user_id,
                 user_message=user_input,
-                session_id=current_session_id
+                session_id=current_session_id,
+                collections=_get_collections_from_request()
             )
 
             # Kiểm tra định dạng trả về từ ChatService.process_user_message
@@ -247,6 +261,103 @@ def send_message_authenticated(user_id):
         return jsonify({"error": "Hệ thống trò chuyện tạm thời không sẵn sàng."}), 500
 
 
+def _sse_event(data: dict, event: str = None) -> str:
+    """Dinh dang mot Server-Sent Event."""
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
+
+
+def _sse_response(token_generator) -> Response:
+    """Boc generator token thanh response text/event-stream: moi token mot event, ket thuc bang event 'done'."""
+
+    def event_stream():
+        try:
+            for token in token_generator:
+                if token:
+                    yield _sse_event({'token': token})
+            vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
+            yield _sse_event({'bot_timestamp': datetime.now(vietnam_tz).isoformat()}, event='done')
+        except Exception as e:
+            print(f"ERROR: Error while streaming bot response: {e}")
+            yield _sse_event({'error': "Lỗi khi xử lý tin nhắn."}, event='error')
+
+    return Response(stream_with_context(event_stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _get_user_input_from_request():
+    request_data = request.get_json(silent=True)
+    return request_data.get('user_input') if request_data else None
+
+
+def _get_collections_from_request():
+    """Optional subset of collections to search: a JSON list or a comma-separated string (None = all collections)"""
+    request_data = request.get_json(silent=True)
+    collections = request_data.get('collections') if request_data else None
+    if isinstance(collections, str):
+        collections = collections.split(',')
+    if not isinstance(collections, list):
+        return None
+    return [str(name).strip() for name in collections if str(name).strip()] or None
+
+
+@chat_bp.route('/stream_message', methods=['POST'])
+def stream_message():
+    """Streaming version of /send_message: returns the bot response token by token as Server-Sent Events"""
+    user_input = _get_user_input_from_request()
+    if not user_input:
+        print("WARNING: Received empty user input in /stream_message.")
+        return jsonify({"error": "Input tin nhắn không được rỗng."}), 400
+
+    if not current_user.is_authenticated:
+        # Guest user - stream phản hồi nhưng không lưu lịch sử
+        chatbot_service_instance = ChatbotService()
+        rag_chain = chatbot_service_instance.get_rag_chain_instance()
+        if rag_chain is None:
+            print("ERROR: RAG Chain không thể khởi tạo cho guest user.")
+            return _sse_response(iter(["Hệ thống chatbot hiện không khả dụng. Vui lòng thử lại sau."]))
+
+        if chatbot_service_instance.get_chatbot_info()['type'] == 'Advanced RAG':
+            return _sse_response(rag_chain.stream(user_input, conversation_id=get_guest_conversation_id(),
+                                                  collections=_get_collections_from_request()))
+        return _sse_response(rag_chain.stream({"question": user_input}))
+
+    user_id = current_user.id
+    try:
+        db_session_factory = SessionLocal
+        if db_session_factory is None:
+            print("ERROR: SessionLocal factory is None in chat.stream_message.")
+            raise Exception("SessionLocal factory is None.")
+
+        chat_repo_instance = SQLAlchemyChatRepository(db_session_factory=db_session_factory)
+        chat_service_instance = ChatService(
+            chat_repository=chat_repo_instance,
+            chatbot_service=ChatbotService()
+        )
+    except Exception as e:
+        print(f"ERROR: stream_message: Error manually creating dependencies: {e}")
+        return jsonify({"error": "Lỗi nội bộ khi chuẩn bị dịch vụ."}), 500
+
+    current_session_id = session.get(CURRENT_SESSION_ID_KEY)
+    try:
+        used_session_id, token_generator = chat_service_instance.stream_user_message(
+            user_id=user_id,
+            user_message=user_input,
+            session_id=current_session_id,
+            collections=_get_collections_from_request()
+        )
+    except Exception as e:
+        print(f"ERROR: Error during ChatService.stream_user_message: {e}")
+        return jsonify({"error": "Lỗi khi xử lý tin nhắn."}), 500
+
+    # Cập nhật session trước khi bắt đầu stream (cookie được gửi cùng header)
+    if current_session_id != used_session_id:
+        session[CURRENT_SESSION_ID_KEY] = used_session_id
+        print(f"Updated current_chat_session_id in flask.session: {used_session_id}")
+
+    return _sse_response(token_generator)
+
+
 @chat_bp.route('/new_session', methods=['POST'])
 def new_session():
     # Chỉ user đã đăng nhập mới có thể tạo session mới
@@ -327,7 +438,7 @@ def reset_conversation():
         try:
             # Chỉ reset conversation memory trong chatbot service
             chatbot_service_instance = ChatbotService()
-            chatbot_service_instance.reset_conversation()
+            chatbot_service_instance.reset_conversation(get_guest_conversation_id())
             
             return jsonify({
                 "success": True,
@@ -341,8 +452,7 @@ def reset_conversation():
 
     try:
         # Clear the current session from Flask session
-        if CURRENT_SESSION_ID_KEY in session:
-            del session[CURRENT_SESSION_ID_KEY]
+        previous_session_id = session.pop(CURRENT_SESSION_ID_KEY, None)
 
         # Create dependencies
         db_session_factory = SessionLocal
@@ -358,8 +468,9 @@ def reset_conversation():
             chatbot_service=chatbot_service_instance
         )
 
-        # Reset conversation memory in the chatbot service
-        chatbot_service_instance.reset_conversation()
+        # Reset conversation memory of the previous session in the chatbot service
+        if previous_session_id is not None:
+            chatbot_service_instance.reset_conversation(previous_session_id)
 
         # Create a new chat session
         new_chat_session = chat_service_instance.create_new_chat_session(user_id=user_id)
@@ -493,7 +604,13 @@ def send_message_guest():
             # Kiểm tra loại RAG và gọi phù hợp
             chatbot_info = chatbot_service_instance.get_chatbot_info()
             if chatbot_info['type'] == 'Advanced RAG':
-                response = rag_chain.invoke(user_input)
+                if Config.RAG_ASYNC_PIPELINE_ENABLED:
+                    response = run_coroutine_sync(
+                        rag_chain.ainvoke(user_input, conversation_id=get_guest_conversation_id(),
+                                          collections=_get_collections_from_request()))
+                else:
+                    response = rag_chain.invoke(user_input, conversation_id=get_guest_conversation_id(),
+                                                collections=_get_collections_from_request())
             else:
                 response = rag_chain.invoke({"question": user_input})
             
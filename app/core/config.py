@@ -20,12 +20,134 @@ class Config:
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
     DATA_DIRECTORY = os.environ.get('DATA_DIRECTORY') or 'data'
     VECTOR_DB_PATH = os.path.join(BASE_DIR, 'data', 'chroma_db')
+    # Moi lan build chi muc (Chroma + BM25 + NumPy) duoc ghi vao INDEX_SNAPSHOT_ROOT/<version>/ va cong bo qua file CURRENT;
+    # VECTOR_DB_PATH, BM25_INDEX_PATH va NUMPY_INDEX_PATH chi con dung cho chi muc cu (truoc khi co snapshot)
+    INDEX_SNAPSHOT_ROOT = os.path.join(BASE_DIR, 'data', 'index_snapshots')
+    INDEX_SNAPSHOTS_KEEP = int(os.environ.get('INDEX_SNAPSHOTS_KEEP') or 3)
+    # Chu ky (giay) worker kiem tra file CURRENT de chuyen sang snapshot moi
+    INDEX_VERSION_CHECK_SECONDS = float(os.environ.get('INDEX_VERSION_CHECK_SECONDS') or 2)
+    # Sau khi chuyen snapshot, Chroma client cua snapshot cu duoc dong sau khoang nay (cho truy van dang chay xong)
+    INDEX_CLIENT_RELEASE_DELAY_SECONDS = float(os.environ.get('INDEX_CLIENT_RELEASE_DELAY_SECONDS') or 30)
+    # Cac collection (corpus theo khoa / nhom tai lieu), moi collection co snapshot rieng va duoc build lai doc lap:
+    # python process_document.py --collection <ten> --data-dir <thu muc>. Collection dau tien la collection chinh.
+    DEFAULT_COLLECTION_NAME = 'document_collection'
+    VECTOR_COLLECTIONS = [name.strip() for name in
+                          (os.environ.get('VECTOR_COLLECTIONS') or DEFAULT_COLLECTION_NAME).split(',') if name.strip()]
+    # So thread toi da khi truy van song song nhieu collection
+    COLLECTION_FANOUT_WORKERS = int(os.environ.get('COLLECTION_FANOUT_WORKERS') or 4)
     TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    # OCR trang PDF: anh trang duoc render theo OCR_DPI (grayscale neu bat) va OCR song song tren OCR_WORKERS process
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS') or os.cpu_count() or 1)
+    OCR_DPI = int(os.environ.get('OCR_DPI') or 300)
+    OCR_GRAYSCALE = (os.environ.get('OCR_GRAYSCALE') or 'true').lower() == 'true'
+    OCR_LANG = os.environ.get('OCR_LANG') or 'vie'
+    # Che do phan tich trang cua Tesseract (--psm): 3 = tu dong, 4 = mot cot, 6 = mot khoi van ban
+    OCR_TESSERACT_PSM = int(os.environ.get('OCR_TESSERACT_PSM') or 3)
+    OCR_TESSERACT_OEM = int(os.environ.get('OCR_TESSERACT_OEM') or 1)
+    # Lay text layer cua PDF (PyMuPDF) truoc; chi OCR trang co text layer rong hoac loi font
+    # (it hon PDF_TEXT_LAYER_MIN_CHARS ky tu hoac ty le ky tu hop le duoi PDF_TEXT_LAYER_MIN_QUALITY)
+    PDF_TEXT_LAYER_ENABLED = (os.environ.get('PDF_TEXT_LAYER_ENABLED') or 'true').lower() == 'true'
+    PDF_TEXT_LAYER_MIN_CHARS = int(os.environ.get('PDF_TEXT_LAYER_MIN_CHARS') or 20)
+    PDF_TEXT_LAYER_MIN_QUALITY = float(os.environ.get('PDF_TEXT_LAYER_MIN_QUALITY') or 0.9)
 
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
     GEMINI_MODEL_NAME = 'gemini-2.0-flash'
 
     SENTENCE_TRANSFORMER_MODEL_NAME = 'distiluse-base-multilingual-cased-v2'
+    # Backend embedding tren CPU: 'torch' (fp32), 'torch-int8' (quantize dong) hoac 'onnx' (ONNX Runtime)
+    # Kiem tra do lech so voi vector da luu bang: python embedding_parity_check.py --backend <backend>
+    EMBEDDING_BACKEND = (os.environ.get('EMBEDDING_BACKEND') or 'torch').lower()
+    # File ONNX trong repo model (vi du onnx/model_qint8_avx512_vnni.onnx); de trong de dung onnx/model.onnx
+    EMBEDDING_ONNX_FILE_NAME = os.environ.get('EMBEDDING_ONNX_FILE_NAME')
+
+    # Gom cac yeu cau embed truy van dong thoi thanh mot lo (cho toi da EMBEDDING_BATCH_MAX_WAIT_MS)
+    EMBEDDING_BATCHING_ENABLED = (os.environ.get('EMBEDDING_BATCHING_ENABLED') or 'true').lower() == 'true'
+    EMBEDDING_BATCH_MAX_SIZE = int(os.environ.get('EMBEDDING_BATCH_MAX_SIZE') or 32)
+    EMBEDDING_BATCH_MAX_WAIT_MS = float(os.environ.get('EMBEDDING_BATCH_MAX_WAIT_MS') or 5)
+    # Dia chi embedding server dung chung cho nhieu worker (vi du 127.0.0.1:6390); de trong de embed trong process.
+    # Server nhan du lieu pickle: bat buoc dat EMBEDDING_SERVER_AUTHKEY (bi mat) va chi nghe tren loopback,
+    # tru khi dat EMBEDDING_SERVER_ALLOW_REMOTE=true
+    EMBEDDING_SERVER_ADDRESS = os.environ.get('EMBEDDING_SERVER_ADDRESS')
+    EMBEDDING_SERVER_AUTHKEY = os.environ.get('EMBEDDING_SERVER_AUTHKEY')
+    EMBEDDING_SERVER_ALLOW_REMOTE = (os.environ.get('EMBEDDING_SERVER_ALLOW_REMOTE') or 'false').lower() == 'true'
+    # Server loi: worker embed bang model trong process va thu lai server sau khoang cho nay (gap doi moi lan loi)
+    EMBEDDING_SERVER_RETRY_SECONDS = float(os.environ.get('EMBEDDING_SERVER_RETRY_SECONDS') or 5)
+
+    # Cache LRU query text -> vector trong VectorStoreManager; float16 giam mot nua bo nho moi vector
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE') or 2000)
+    QUERY_EMBEDDING_CACHE_FLOAT16 = (os.environ.get('QUERY_EMBEDDING_CACHE_FLOAT16') or 'false').lower() == 'true'
+
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
+    # So process chuyen doi tai lieu (docling/OCR) song song khi ingest; 1 = xu ly tuan tu trong process chinh
+    INGESTION_WORKERS = int(os.environ.get('INGESTION_WORKERS') or os.cpu_count() or 1)
+    # Cache van ban da chuyen doi (docling theo hash file, OCR theo hash anh trang); vuot CONVERSION_CACHE_MAX_MB
+    # thi xoa entry it dung nhat. Bo qua cache: python process_document.py --no-cache
+    CONVERSION_CACHE_ENABLED = (os.environ.get('CONVERSION_CACHE_ENABLED') or 'true').lower() == 'true'
+    CONVERSION_CACHE_DIR = os.environ.get('CONVERSION_CACHE_DIR') or os.path.join(BASE_DIR, 'data', 'conversion_cache')
+    CONVERSION_CACHE_MAX_MB = int(os.environ.get('CONVERSION_CACHE_MAX_MB') or 1024)
+
+    # Ghep ket qua tim kiem cua cac truy van con: 'rrf' (reciprocal rank fusion) hoac 'score' (do tuong dong cosine)
+    RETRIEVAL_FUSION_METHOD = (os.environ.get('RETRIEVAL_FUSION_METHOD') or 'rrf').lower()
+    RETRIEVAL_RRF_K = int(os.environ.get('RETRIEVAL_RRF_K') or 60)
+    RETRIEVAL_MIN_SIMILARITY = float(os.environ.get('RETRIEVAL_MIN_SIMILARITY') or 0.2)
+    RETRIEVAL_TOP_K = int(os.environ.get('RETRIEVAL_TOP_K') or 6)
+
+    # Tham so collection Chroma khi build chi muc (embedding da chuan hoa nen 'cosine'/'ip' la metric tu nhien)
+    # Chon tham so bang: python hnsw_sweep.py (recall@k so voi tim kiem chinh xac, do tre p50/p99)
+    HNSW_SPACE = (os.environ.get('HNSW_SPACE') or 'cosine').lower()
+    HNSW_M = int(os.environ.get('HNSW_M') or 16)
+    HNSW_EF_CONSTRUCTION = int(os.environ.get('HNSW_EF_CONSTRUCTION') or 100)
+    HNSW_EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH') or 100)
+
+    # Backend tim kiem vector: 'chroma' (HNSW) hoac 'numpy' (tim kiem chinh xac tren ma tran .npy memory-map)
+    # So sanh do tre va recall: python benchmark_vector_backends.py
+    VECTOR_BACKEND = (os.environ.get('VECTOR_BACKEND') or 'chroma').lower()
+    # Chi muc cu (truoc khi co snapshot), van duoc dung cung VECTOR_DB_PATH khi chua co file CURRENT
+    NUMPY_INDEX_PATH = os.path.join(BASE_DIR, 'data', 'numpy_index')
+    NUMPY_INDEX_DTYPE = (os.environ.get('NUMPY_INDEX_DTYPE') or 'float32').lower()
+
+    # Chi muc BM25 (tim kiem tu vung) chay cung voi truy van Chroma, ket qua duoc ghep bang fusion o tren
+    BM25_ENABLED = (os.environ.get('BM25_ENABLED') or 'true').lower() == 'true'
+    BM25_INDEX_PATH = os.path.join(BASE_DIR, 'data', 'bm25_index')
+    BM25_TOP_K = int(os.environ.get('BM25_TOP_K') or 10)
+    BM25_WEIGHT = float(os.environ.get('BM25_WEIGHT') or 1.0)
+
+    # Bo dinh tuyen nguon: chon cac file nguon ung vien tu cau hoi (ten file + tu khoa dac trung cua tung file)
+    # va gioi han tim kiem trong cac file do bang bo loc metadata (where) cua Chroma
+    SOURCE_ROUTER_ENABLED = (os.environ.get('SOURCE_ROUTER_ENABLED') or 'true').lower() == 'true'
+    # Diem toi thieu cua file tot nhat de loc (duoi nguong: tim kiem tren moi file)
+    SOURCE_ROUTER_MIN_SCORE = float(os.environ.get('SOURCE_ROUTER_MIN_SCORE') or 2.0)
+    # Giu cac file co diem >= ti le nay * diem cao nhat
+    SOURCE_ROUTER_RELATIVE_SCORE = float(os.environ.get('SOURCE_ROUTER_RELATIVE_SCORE') or 0.5)
+    SOURCE_ROUTER_TERMS_PER_SOURCE = int(os.environ.get('SOURCE_ROUTER_TERMS_PER_SOURCE') or 50)
+
+    # Ngan sach token cho context trong prompt RAG (uoc luong theo so ky tu / CONTEXT_CHARS_PER_TOKEN)
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET') or 3000)
+    CONTEXT_CHARS_PER_TOKEN = float(os.environ.get('CONTEXT_CHARS_PER_TOKEN') or 3.0)
+    # So ky tu trung toi thieu de noi hai chunk lien ke cua cung mot file
+    CONTEXT_MIN_OVERLAP_CHARS = int(os.environ.get('CONTEXT_MIN_OVERLAP_CHARS') or 40)
+
+    RESPONSE_VALIDATION_SAMPLE_RATE = float(os.environ.get('RESPONSE_VALIDATION_SAMPLE_RATE') or 1.0)
+    RESPONSE_VALIDATION_QUEUE_SIZE = int(os.environ.get('RESPONSE_VALIDATION_QUEUE_SIZE') or 100)
+
+    SEMANTIC_CACHE_ENABLED = (os.environ.get('SEMANTIC_CACHE_ENABLED') or 'true').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD') or 0.95)
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES') or 500)
+    SEMANTIC_CACHE_TTL_SECONDS = int(os.environ.get('SEMANTIC_CACHE_TTL_SECONDS') or 24 * 3600)
+
+    # 'full': mo rong cau hoi + tra loi + xac thuc (3 lan goi LLM); 'lean': 1 lan goi LLM tra ve cau tra loi kem do tin cay
+    RAG_PIPELINE_MODE = (os.environ.get('RAG_PIPELINE_MODE') or 'full').lower()
+
+    # Dung AdvancedRAGChain.ainvoke (mo rong cau hoi song song voi tim kiem) cho /send_message
+    RAG_ASYNC_PIPELINE_ENABLED = (os.environ.get('RAG_ASYNC_PIPELINE_ENABLED') or 'true').lower() == 'true'
+
+    CONVERSATION_MEMORY_WINDOW = int(os.environ.get('CONVERSATION_MEMORY_WINDOW') or 6)
+    CONVERSATION_MEMORY_MAX_SESSIONS = int(os.environ.get('CONVERSATION_MEMORY_MAX_SESSIONS') or 5000)
+
+    QUERY_EXPANSION_CACHE_SIZE = int(os.environ.get('QUERY_EXPANSION_CACHE_SIZE') or 1000)
+    # Duong dan file JSON de luu cache giua cac lan khoi dong; de trong de chi cache trong bo nho
+    QUERY_EXPANSION_CACHE_FILE = os.environ.get('QUERY_EXPANSION_CACHE_FILE')
+    # File cache duoc ghi nen, gom cac thay doi trong khoang nay thanh mot lan ghi
+    QUERY_EXPANSION_CACHE_FLUSH_SECONDS = float(os.environ.get('QUERY_EXPANSION_CACHE_FLUSH_SECONDS') or 5)
 
@@ -54,6 +54,7 @@ def init_db():
         from app.models import user
         from app.models import chat_session
         from app.models import message
+        from app.models import message_validation
 
         Base.metadata.create_all(bind=engine, checkfirst=True)
         logger.info("Database tables created or already exist.")
@@ -23,5 +23,8 @@ class Message(Base):
 
     chat_session = relationship("ChatSession", back_populates="messages")
 
+    validation = relationship("MessageValidation", back_populates="message", uselist=False,
+                              cascade="all, delete-orphan")
+
     def __repr__(self):
         return f"<Message id={self.id} session_id={self.session_id} sender={self.sender_type} timestamp={self.timestamp}>"
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, Boolean
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.core.database import Base
+
+
+class MessageValidation(Base):
+    """Quality scores produced by the background response validator for a bot message."""
+    __tablename__ = 'message_validations'
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    message_id = Column(Integer, ForeignKey('messages.id'), nullable=False, unique=True, index=True)
+
+    accuracy = Column(Integer, nullable=True)
+    relevance = Column(Integer, nullable=True)
+    completeness = Column(Integer, nullable=True)
+    clarity = Column(Integer, nullable=True)
+    helpfulness = Column(Integer, nullable=True)
+
+    total_score = Column(Integer, nullable=False)
+
+    quality_level = Column(String(20), nullable=False)
+
+    feedback = Column(Text, nullable=True)
+
+    should_improve = Column(Boolean, default=False, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    message = relationship("Message", back_populates="validation")
+
+    def __repr__(self):
+        return f"<MessageValidation id={self.id} message_id={self.message_id} total={self.total_score} level={self.quality_level}>"
@@ -4,38 +4,95 @@
 Advanced RAG Chain với các tính năng nâng cao:
 - Query expansion (mở rộng câu hỏi)
 - Hybrid search (tìm kiếm kết hợp) 
-- Conversation context (ngữ cảnh hội thoại)
-- Response validation (xác thực phản hồi)
+- Conversation context (ngữ cảnh hội thoại riêng theo từng phiên chat)
+- Response validation (xác thực phản hồi, chạy nền ngoài luồng request)
 - Quality scoring (đánh giá chất lượng)
+- Semantic cache (trả lời lại câu hỏi gần nghĩa đã gặp)
+- Streaming (trả phản hồi theo từng token)
+- Async pipeline (ainvoke, tìm kiếm câu hỏi gốc song song với mở rộng câu hỏi)
+- Lean mode (một lần gọi LLM: trả lời kèm độ tin cậy tự đánh giá)
+- Source routing (giới hạn tìm kiếm trong các file nguồn phù hợp với câu hỏi bằng bộ lọc metadata)
+- Nhiều collection (tìm song song trên mọi collection hoặc tập con `collections` do request chỉ định)
 """
 
+import asyncio
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Hashable, Iterator, Optional
 
 from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel, Field
 
 from app.core.config import Config
-from app.rag.document_processor import get_embedding_model
+from app.rag.context_packer import pack_context
+from app.rag.conversation_memory import ConversationMemoryStore
+from app.rag.embedding_batcher import get_query_embedder
+from app.rag.metadata_filter import build_source_filter
+from app.rag.query_expansion_cache import QueryExpansionCache
+from app.rag.response_validation_worker import ResponseValidationWorker
+from app.rag.retrieval_fusion import fuse_retrieval_results
+from app.rag.semantic_cache import SemanticAnswerCache
 from app.rag.vector_storage_manager import VectorStoreManager
 
 
+# Khóa hội thoại dùng khi caller không truyền conversation_id (ví dụ script test)
+DEFAULT_CONVERSATION_ID = "default"
+
+# Các chế độ pipeline: "full" = mở rộng câu hỏi + trả lời + xác thực (3 lần gọi LLM),
+# "lean" = viết lại câu hỏi cục bộ + một lần gọi LLM trả về câu trả lời kèm độ tin cậy
+PIPELINE_MODE_FULL = "full"
+PIPELINE_MODE_LEAN = "lean"
+
+# Cụm từ hỏi/đệm tiếng Việt bị loại khi viết lại câu hỏi cục bộ (lean mode)
+QUESTION_FILLER_PHRASES = [
+    "cho em hỏi", "cho mình hỏi", "cho tôi hỏi", "xin hỏi", "em muốn hỏi", "mình muốn hỏi", "tôi muốn hỏi",
+    "như thế nào", "thế nào", "là gì", "là bao nhiêu", "bao nhiêu", "bao lâu", "ra sao", "có phải",
+    "được không", "không ạ", "có không", "vậy", "ạ", "nhé", "với", "gì",
+]
+
+
+class LeanRAGAnswer(BaseModel):
+    """Output có cấu trúc của lean mode: câu trả lời và độ tin cậy tự đánh giá"""
+    answer: str = Field(description="Câu trả lời đầy đủ cho người dùng, định dạng như phản hồi thông thường")
+    confidence: int = Field(description="Độ tin cậy 0-10 rằng câu trả lời đúng và được tài liệu hỗ trợ")
+    feedback: str = Field(default="", description="Nhận xét ngắn về mức độ tài liệu hỗ trợ câu trả lời")
+
+
 class AdvancedRAGChain:
-    def __init__(self):
-        """Khởi tạo Advanced RAG Chain với các component thông minh"""
+    def __init__(self, history_loader: Optional[Callable[[Hashable, int], List[BaseMessage]]] = None):
+        """
+        Khởi tạo Advanced RAG Chain với các component thông minh.
+        history_loader(conversation_id, limit) dùng để nạp lại lịch sử từ DB khi phiên không có trong bộ nhớ.
+        """
         self.llm = None
         self.vector_store_manager = None
         self.retriever_func = None
-        self.conversation_history: List[BaseMessage] = []
-        self.max_history_length = 6
+        self.batch_retriever_func = None
+        self.lexical_retriever_func = None
+        self.answer_cache = None
+        self.lean_chain = None
+        self.pipeline_mode = Config.RAG_PIPELINE_MODE
+        if self.pipeline_mode not in (PIPELINE_MODE_FULL, PIPELINE_MODE_LEAN):
+            print(f"WARNING: RAG_PIPELINE_MODE '{self.pipeline_mode}' không hợp lệ, dùng '{PIPELINE_MODE_FULL}'.")
+            self.pipeline_mode = PIPELINE_MODE_FULL
+
+        # Lịch sử hội thoại riêng cho từng phiên chat (chain là singleton dùng chung cho mọi người dùng)
+        self.memory_store = ConversationMemoryStore(history_loader=history_loader)
 
         # Templates cho các chức năng khác nhau
         self.query_expansion_template = self._create_query_expansion_template()
         self.main_rag_template = self._create_main_rag_template()
         self.response_validator_template = self._create_response_validator_template()
+        self.lean_rag_template = self._create_lean_rag_template()
+
+        # Xác thực phản hồi chạy trên thread nền, không chặn request
+        self.validation_worker = ResponseValidationWorker(self._validate_response)
+
+        # Cache kết quả mở rộng câu hỏi
+        self.expansion_cache = QueryExpansionCache()
 
         self._initialize_components()
 
@@ -60,7 +117,7 @@ class AdvancedRAGChain:
         if vectorstore_collection is None:
             raise ValueError("Không thể tải VectorStore Collection")
 
-        embeddings = get_embedding_model()
+        embeddings = get_query_embedder()
         if embeddings is None:
             raise ValueError("Không thể lấy Embedding Model")
 
@@ -71,6 +128,23 @@ class AdvancedRAGChain:
         if self.retriever_func is None:
             raise ValueError("Không thể tạo Retriever function")
 
+        self.batch_retriever_func = self.vector_store_manager.get_batch_retriever_from_collection(
+            vectorstore_collection, embeddings
+        )
+
+        if self.batch_retriever_func is None:
+            raise ValueError("Không thể tạo Batch Retriever function")
+
+        # BM25 chạy cùng truy vấn Chroma (None nếu bị tắt trong Config)
+        self.lexical_retriever_func = self.vector_store_manager.get_lexical_retriever()
+
+        if Config.SEMANTIC_CACHE_ENABLED:
+            self.answer_cache = SemanticAnswerCache(embeddings, vector_store_manager=self.vector_store_manager)
+
+        # Lean mode: một lần gọi LLM với structured output (câu trả lời + độ tin cậy)
+        self.lean_chain = self.lean_rag_template | self.llm.with_structured_output(LeanRAGAnswer)
+        print(f"Chế độ pipeline: {self.pipeline_mode}")
+
         print("--- Advanced RAG Chain đã sẵn sàng ---")
 
     def _create_query_expansion_template(self) -> ChatPromptTemplate:
@@ -119,6 +193,36 @@ class AdvancedRAGChain:
             ("user", "{question}")
         ])
 
+    def _create_lean_rag_template(self) -> ChatPromptTemplate:
+        """Template cho lean mode: trả lời và tự đánh giá độ tin cậy trong cùng một lần gọi"""
+        return ChatPromptTemplate.from_messages([
+            ("system", """Bạn là trợ lý AI thông minh chuyên tư vấn về quy chế và nội quy nhà trường.
+
+            NGUYÊN TẮC TRẢ LỜI:
+            1. Phân tích câu hỏi trong ngữ cảnh hội thoại
+            2. Sử dụng thông tin từ tài liệu và lịch sử trò chuyện
+            3. Trả lời một cách tự nhiên, thân thiện
+            4. Cung cấp thông tin chính xác và hữu ích
+            5. Nếu thông tin không đầy đủ, thành thật thừa nhận
+            6. Không trả lời thông tin không liên quan đến nhà trường
+            
+            CẤU TRÚC PHẢN HỒI:
+            - Câu trả lời ngắn gọn đầu tiên
+            - Thông tin chi tiết có cấu trúc
+            - Ví dụ minh họa (nếu có)
+            - Gợi ý bổ sung (nếu phù hợp)
+            
+            Sau khi trả lời, hãy tự đánh giá độ tin cậy (0-10) dựa trên mức độ tài liệu
+            tham khảo hỗ trợ trực tiếp câu trả lời, kèm một nhận xét ngắn.
+            
+            Lịch sử hội thoại:
+            {conversation_history}
+            
+            Thông tin tham khảo từ tài liệu:
+            {context}"""),
+            ("user", "{question}")
+        ])
+
     def _create_response_validator_template(self) -> ChatPromptTemplate:
         """Template để xác thực chất lượng phản hồi"""
         return ChatPromptTemplate.from_messages([
@@ -141,10 +245,16 @@ class AdvancedRAGChain:
             Ngữ cảnh tài liệu: {context}""")
         ])
 
-    def _expand_query(self, question: str) -> Dict[str, str]:
+    def _expand_query(self, question: str, history: List[BaseMessage]) -> Dict[str, str]:
         """Mở rộng câu hỏi để tìm kiếm hiệu quả hơn"""
         try:
-            conversation_context = self._format_conversation_history()
+            conversation_context = self._format_conversation_history(history)
+
+            cached_expansion = self.expansion_cache.get(question, conversation_context)
+            if cached_expansion is not None:
+                print("Query expansion cache HIT.")
+                cached_expansion["original_question"] = question
+                return cached_expansion
 
             expansion_chain = self.query_expansion_template | self.llm | StrOutputParser()
 
@@ -153,82 +263,220 @@ class AdvancedRAGChain:
                 "conversation_context": conversation_context
             })
 
-            # Parse kết quả
-            keywords = ""
-            related_questions = ""
-            main_topic = ""
+            expansion = self._parse_expansion_result(expansion_result, question)
+            self.expansion_cache.put(question, conversation_context, expansion)
+            return expansion
 
-            for line in expansion_result.split('\n'):
-                if line.startswith('KEYWORDS:'):
-                    keywords = line.replace('KEYWORDS:', '').strip()
-                elif line.startswith('RELATED_QUESTIONS:'):
-                    related_questions = line.replace('RELATED_QUESTIONS:', '').strip()
-                elif line.startswith('MAIN_TOPIC:'):
-                    main_topic = line.replace('MAIN_TOPIC:', '').strip()
+        except Exception as e:
+            print(f"ERROR trong query expansion: {e}")
+            return self._fallback_expansion(question)
 
-            return {
-                "keywords": keywords,
-                "related_questions": related_questions,
-                "main_topic": main_topic,
-                "original_question": question
-            }
+    async def _aexpand_query(self, question: str, history: List[BaseMessage]) -> Dict[str, str]:
+        """Phiên bản async của _expand_query (gọi LLM bằng ainvoke)"""
+        try:
+            conversation_context = self._format_conversation_history(history)
+
+            cached_expansion = self.expansion_cache.get(question, conversation_context)
+            if cached_expansion is not None:
+                print("Query expansion cache HIT.")
+                cached_expansion["original_question"] = question
+                return cached_expansion
+
+            expansion_chain = self.query_expansion_template | self.llm | StrOutputParser()
+
+            expansion_result = await expansion_chain.ainvoke({
+                "question": question,
+                "conversation_context": conversation_context
+            })
+
+            expansion = self._parse_expansion_result(expansion_result, question)
+            self.expansion_cache.put(question, conversation_context, expansion)
+            return expansion
 
         except Exception as e:
             print(f"ERROR trong query expansion: {e}")
-            return {
-                "keywords": question,
-                "related_questions": question,
-                "main_topic": "general",
-                "original_question": question
-            }
+            return self._fallback_expansion(question)
+
+    def _parse_expansion_result(self, expansion_result: str, question: str) -> Dict[str, str]:
+        """Parse kết quả mở rộng câu hỏi từ LLM"""
+        keywords = ""
+        related_questions = ""
+        main_topic = ""
+
+        for line in expansion_result.split('\n'):
+            if line.startswith('KEYWORDS:'):
+                keywords = line.replace('KEYWORDS:', '').strip()
+            elif line.startswith('RELATED_QUESTIONS:'):
+                related_questions = line.replace('RELATED_QUESTIONS:', '').strip()
+            elif line.startswith('MAIN_TOPIC:'):
+                main_topic = line.replace('MAIN_TOPIC:', '').strip()
+
+        return {
+            "keywords": keywords,
+            "related_questions": related_questions,
+            "main_topic": main_topic,
+            "original_question": question
+        }
+
+    def _fallback_expansion(self, question: str) -> Dict[str, str]:
+        return {
+            "keywords": question,
+            "related_questions": question,
+            "main_topic": "general",
+            "original_question": question
+        }
+
+    def _build_expanded_sub_queries(self, query_info: Dict[str, str]) -> List[tuple]:
+        """Các truy vấn con từ kết quả mở rộng (từ khóa, câu hỏi liên quan) kèm trọng số khi ghép kết quả"""
+        sub_queries = []
+
+        if query_info["keywords"]:
+            sub_queries.append((query_info["keywords"], 1.0))
+
+        if query_info["related_questions"]:
+            for related_q in query_info["related_questions"].split("|")[:2]:
+                if related_q.strip():
+                    sub_queries.append((related_q.strip(), 0.7))
+
+        return sub_queries
+
+    def _merge_retrieval_results(self, results: List[tuple], top_k: int = None) -> List[Document]:
+        """
+        Ghép kết quả (docs, trọng số) của các truy vấn con theo chunk id bằng RRF hoặc score fusion,
+        loại chunk dưới ngưỡng tương đồng tối thiểu và giới hạn số lượng
+        """
+        return fuse_retrieval_results(
+            results,
+            top_k=top_k if top_k is not None else Config.RETRIEVAL_TOP_K,
+            method=Config.RETRIEVAL_FUSION_METHOD,
+            rrf_k=Config.RETRIEVAL_RRF_K,
+            min_similarity=Config.RETRIEVAL_MIN_SIMILARITY
+        )
 
-    def _hybrid_search(self, query_info: Dict[str, str], top_k: int = 8) -> List[Document]:
+    def _route_sources(self, question: str, collections: Optional[List[str]] = None) -> Optional[dict]:
+        """Bộ lọc where giới hạn tìm kiếm trong các file nguồn ứng viên của câu hỏi (None = tìm trên mọi file)"""
+        try:
+            source_router = self.vector_store_manager.get_source_router(collections)
+            if source_router is None:
+                return None
+            candidates = source_router.route(question)
+            if candidates:
+                print(f"Source router: giới hạn tìm kiếm trong {candidates}")
+            return build_source_filter(candidates or [])
+        except Exception as e:
+            print(f"ERROR trong source routing: {e}")
+            return None
+
+    def _retrieve_ranked_lists(self, sub_queries: List[tuple], where: Optional[dict] = None,
+                               collections: Optional[List[str]] = None) -> List[tuple]:
+        """
+        Tìm kiếm vector (một lần embed + một lần truy vấn mỗi collection) và BM25 cho các truy vấn con,
+        trả về list (docs, trọng số) để ghép.
+        where: bộ lọc metadata; nếu lọc không còn kết quả nào thì tìm lại trên mọi file.
+        collections: tập con collection cần tìm (None = mọi collection).
+        """
+        queries = [query for query, _ in sub_queries]
+        ranked_lists = [(docs, weight) for (_, weight), docs in
+                        zip(sub_queries, self.batch_retriever_func(queries, where=where, collections=collections))]
+
+        if self.lexical_retriever_func is not None:
+            lexical_results = self.lexical_retriever_func(queries, where=where, collections=collections)
+            ranked_lists += [(docs, weight * Config.BM25_WEIGHT)
+                             for (_, weight), docs in zip(sub_queries, lexical_results)]
+
+        if where and not any(docs for docs, _ in ranked_lists):
+            print("Bộ lọc nguồn không có kết quả, tìm lại trên mọi file.")
+            return self._retrieve_ranked_lists(sub_queries, collections=collections)
+
+        return ranked_lists
+
+    def _hybrid_search(self, query_info: Dict[str, str], top_k: int = None,
+                       collections: Optional[List[str]] = None) -> List[Document]:
         """Tìm kiếm kết hợp với nhiều chiến lược"""
-        all_docs = []
+        try:
+            # Gom tất cả truy vấn con (câu hỏi gốc, từ khóa, câu hỏi liên quan)
+            sub_queries = [(query_info["original_question"], 1.0)] + self._build_expanded_sub_queries(query_info)
+            where = self._route_sources(query_info["original_question"], collections)
+
+            return self._merge_retrieval_results(self._retrieve_ranked_lists(sub_queries, where, collections), top_k)
 
+        except Exception as e:
+            print(f"ERROR trong hybrid search: {e}")
+            # Fallback về tìm kiếm đơn giản
+            return self.retriever_func(query_info["original_question"], collections=collections)
+
+    def _rewrite_query_locally(self, question: str) -> str:
+        """Viết lại câu hỏi không cần LLM: bỏ dấu câu và cụm từ hỏi/đệm, giữ lại từ mang nội dung"""
+        rewritten = re.sub(r'[^\w\s]', ' ', question.lower())
+        for phrase in QUESTION_FILLER_PHRASES:
+            rewritten = re.sub(rf'(?<!\w){re.escape(phrase)}(?!\w)', ' ', rewritten)
+        return re.sub(r'\s+', ' ', rewritten).strip()
+
+    def _build_lean_sub_queries(self, question: str) -> List[tuple]:
+        """Truy vấn con của lean mode: câu hỏi gốc và bản viết lại cục bộ (nếu khác), kèm trọng số"""
+        sub_queries = [(question, 1.0)]
+        rewritten = self._rewrite_query_locally(question)
+        if rewritten and rewritten != question.lower().strip():
+            sub_queries.append((rewritten, 1.0))
+        return sub_queries
+
+    def _lean_search(self, question: str, top_k: int = None,
+                     collections: Optional[List[str]] = None) -> List[Document]:
+        """Tìm kiếm của lean mode: một lần embed + một lần truy vấn cho câu hỏi gốc và bản viết lại"""
         try:
-            # Tìm kiếm với câu hỏi gốc
-            original_docs = self.retriever_func(query_info["original_question"])
-            all_docs.extend(original_docs[:3])
+            sub_queries = self._build_lean_sub_queries(question)
+            where = self._route_sources(question, collections)
+            return self._merge_retrieval_results(self._retrieve_ranked_lists(sub_queries, where, collections), top_k)
+        except Exception as e:
+            print(f"ERROR trong lean search: {e}")
+            return self.retriever_func(question, collections=collections)
 
-            # Tìm kiếm với từ khóa
-            if query_info["keywords"]:
-                keyword_docs = self.retriever_func(query_info["keywords"])
-                all_docs.extend(keyword_docs[:3])
+    async def _aexpand_and_search(self, question: str, history: List[BaseMessage], top_k: int = None,
+                                  collections: Optional[List[str]] = None) -> List[Document]:
+        """
+        Mở rộng câu hỏi và tìm kiếm song song (speculative retrieval):
+        tìm kiếm với câu hỏi gốc chạy trên thread trong khi LLM đang mở rộng câu hỏi,
+        kết quả tìm kiếm với truy vấn mở rộng được ghép vào khi có.
+        Source routing (có thể phải build router lần đầu) cũng chạy trên thread, không chặn event loop.
+        """
+        route_task = asyncio.create_task(asyncio.to_thread(self._route_sources, question, collections))
 
-            # Tìm kiếm với câu hỏi liên quan
-            if query_info["related_questions"]:
-                for related_q in query_info["related_questions"].split("|")[:2]:
-                    related_docs = self.retriever_func(related_q.strip())
-                    all_docs.extend(related_docs[:2])
+        async def retrieve_original() -> List[tuple]:
+            return await asyncio.to_thread(self._retrieve_ranked_lists, [(question, 1.0)], await route_task,
+                                           collections)
 
-            # Loại bỏ trùng lặp và giới hạn số lượng
-            unique_docs = []
-            seen_content = set()
+        original_task = asyncio.create_task(retrieve_original())
 
-            for doc in all_docs:
-                content_hash = hash(doc.page_content[:200])  # Hash 200 ký tự đầu
-                if content_hash not in seen_content:
-                    seen_content.add(content_hash)
-                    unique_docs.append(doc)
+        try:
+            query_info = await self._aexpand_query(question, history)
+            print(f"Keywords: {query_info['keywords']}")
+            print(f"Main topic: {query_info['main_topic']}")
 
-                if len(unique_docs) >= top_k:
-                    break
+            expanded_sub_queries = self._build_expanded_sub_queries(query_info)
+            expanded_ranked_lists = []
+            if expanded_sub_queries:
+                expanded_ranked_lists = await asyncio.to_thread(self._retrieve_ranked_lists, expanded_sub_queries,
+                                                                await route_task, collections)
 
-            return unique_docs
+            original_ranked_lists = await original_task
+
+            return self._merge_retrieval_results(original_ranked_lists + expanded_ranked_lists, top_k)
 
         except Exception as e:
-            print(f"ERROR trong hybrid search: {e}")
+            print(f"ERROR trong async hybrid search: {e}")
             # Fallback về tìm kiếm đơn giản
-            return self.retriever_func(query_info["original_question"])
+            if not original_task.done():
+                original_task.cancel()
+            return await asyncio.to_thread(self.retriever_func, question, collections=collections)
 
-    def _format_conversation_history(self) -> str:
+    def _format_conversation_history(self, history: List[BaseMessage]) -> str:
         """Format lịch sử hội thoại"""
-        if not self.conversation_history:
+        if not history:
             return "Chưa có lịch sử hội thoại."
 
         formatted = []
-        for i, message in enumerate(self.conversation_history[-6:]):  # Lấy 6 tin nhắn gần nhất
+        # Lấy các tin nhắn gần nhất theo cửa sổ bộ nhớ hội thoại (Config.CONVERSATION_MEMORY_WINDOW)
+        for i, message in enumerate(history[-self.memory_store.window:]):
             if isinstance(message, HumanMessage):
                 formatted.append(f"Người dùng: {message.content}")
             elif isinstance(message, AIMessage):
@@ -302,85 +550,297 @@ class AdvancedRAGChain:
             return 'poor'
 
     def _format_docs(self, docs: List[Document]) -> str:
-        """Format documents thành context"""
+        """Format documents thành context (nối chunk chồng lấn, bỏ lặp, giới hạn theo ngân sách token)"""
         if not docs:
             return "Không tìm thấy thông tin liên quan."
 
         context_parts = []
-        for i, doc in enumerate(docs, 1):
+        for i, doc in enumerate(pack_context(docs), 1):
             # Lấy thông tin metadata nếu có
-            source = doc.metadata.get('source', f'Tài liệu {i}')
-            page = doc.metadata.get('page', '')
+            source = doc.metadata.get('source') or doc.metadata.get('source_file', f'Tài liệu {i}')
+            page = doc.metadata.get('page') or doc.metadata.get('page_number', '')
             page_info = f" (trang {page})" if page else ""
 
             context_parts.append(f"--- Nguồn {i}: {source}{page_info} ---\n{doc.page_content}\n")
 
         return "\n".join(context_parts)
 
-    def add_to_conversation_history(self, message: BaseMessage):
-        """Thêm tin nhắn vào lịch sử hội thoại"""
-        self.conversation_history.append(message)
-
-        # Giới hạn độ dài lịch sử
-        if len(self.conversation_history) > self.max_history_length:
-            self.conversation_history = self.conversation_history[-self.max_history_length:]
-
-    def invoke(self, question: str) -> str:
-        """Xử lý câu hỏi với Advanced RAG Pipeline"""
+    def add_to_conversation_history(self, message: BaseMessage, conversation_id: Hashable = DEFAULT_CONVERSATION_ID):
+        """Thêm tin nhắn vào lịch sử hội thoại của phiên (độ dài được giới hạn bởi memory store)"""
+        self.memory_store.append(conversation_id, message)
+
+    def reset_conversation_history(self, conversation_id: Hashable = DEFAULT_CONVERSATION_ID):
+        """Xóa lịch sử hội thoại của một phiên"""
+        self.memory_store.reset(conversation_id)
+
+    def schedule_validation(self, question: str, response: str, context: str,
+                            on_validated: Optional[Callable[[Dict[str, Any]], None]] = None) -> bool:
+        """
+        Đưa phản hồi vào hàng đợi xác thực nền (theo tỉ lệ lấy mẫu cấu hình).
+        Không có on_validated (không có tin nhắn để lưu điểm, ví dụ khách) thì bỏ qua:
+        kết quả chỉ được ghi log nên không đáng một lần gọi LLM.
+        """
+        if on_validated is None:
+            return False
+        return self.validation_worker.submit(question, response, context, on_validated)
+
+    def _lookup_cached_answer(self, question: str, conversation_id: Hashable,
+                              collections: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Bước 0: Lấy lịch sử của phiên và tra semantic cache.
+        Chỉ tra và lưu cache cho câu hỏi độc lập (chưa có lịch sử): câu hỏi nối tiếp phụ thuộc ngữ cảnh
+        không được trả lời bằng câu trả lời đã lưu của một câu hỏi khác.
+        Request chỉ định tập con collection không dùng cache (câu trả lời đã lưu có thể đến từ collection khác).
+        """
+        history = self.memory_store.get(conversation_id)
+        prepared = {
+            "conversation_id": conversation_id,
+            "collections": collections,
+            "history": history,
+            "is_standalone": not history and not collections,
+            "question_vector": None,
+            "cached_response": None,
+        }
+        if self.answer_cache is not None and prepared["is_standalone"]:
+            try:
+                prepared["question_vector"] = self.answer_cache.embed(question)
+                prepared["cached_response"] = self.answer_cache.lookup(question, prepared["question_vector"])
+            except Exception as e:
+                print(f"ERROR: Loi khi embed cau hoi cho semantic cache: {e}. Bo qua cache.")
+        return prepared
+
+    def _build_prompt_input(self, question: str, docs: List[Document], prepared: Dict[str, Any]):
+        """Bước 3: Chuẩn bị input cho phản hồi chính"""
+        print("Bước 3: Tạo phản hồi...")
+        context = self._format_docs(docs)
+        prepared["context"] = context
+        prepared["prompt_input"] = {
+            "question": question,
+            "context": context,
+            "conversation_history": self._format_conversation_history(prepared["history"])
+        }
+
+    def _prepare_generation(self, question: str, conversation_id: Hashable,
+                            collections: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Các bước trước khi sinh phản hồi: tra semantic cache, mở rộng câu hỏi, tìm kiếm và dựng input cho prompt.
+        Nếu cache hit, trả về "cached_response" và bỏ qua các bước còn lại.
+        """
+        prepared = self._lookup_cached_answer(question, conversation_id, collections)
+        if prepared["cached_response"] is not None:
+            return prepared
+
+        if self.pipeline_mode == PIPELINE_MODE_LEAN:
+            # Lean mode: không gọi LLM để mở rộng câu hỏi
+            print("Bước 1+2 (lean): Tìm kiếm với câu hỏi gốc và bản viết lại cục bộ...")
+            docs = self._lean_search(question, collections=collections)
+            print(f"Tìm thấy {len(docs)} tài liệu liên quan")
+            self._build_prompt_input(question, docs, prepared)
+            return prepared
+
+        # Bước 1: Mở rộng câu hỏi
+        print("Bước 1: Mở rộng câu hỏi...")
+        query_info = self._expand_query(question, prepared["history"])
+        print(f"Keywords: {query_info['keywords']}")
+        print(f"Main topic: {query_info['main_topic']}")
+
+        # Bước 2: Tìm kiếm kết hợp
+        print("Bước 2: Tìm kiếm tài liệu...")
+        docs = self._hybrid_search(query_info, collections=collections)
+        print(f"Tìm thấy {len(docs)} tài liệu liên quan")
+
+        self._build_prompt_input(question, docs, prepared)
+        return prepared
+
+    async def _aprepare_generation(self, question: str, conversation_id: Hashable,
+                                   collections: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Phiên bản async của _prepare_generation: mở rộng câu hỏi và tìm kiếm câu hỏi gốc chạy chồng lên nhau"""
+        prepared = await asyncio.to_thread(self._lookup_cached_answer, question, conversation_id, collections)
+        if prepared["cached_response"] is not None:
+            return prepared
+
+        if self.pipeline_mode == PIPELINE_MODE_LEAN:
+            print("Bước 1+2 (lean): Tìm kiếm với câu hỏi gốc và bản viết lại cục bộ...")
+            docs = await asyncio.to_thread(self._lean_search, question, None, collections)
+            print(f"Tìm thấy {len(docs)} tài liệu liên quan")
+            self._build_prompt_input(question, docs, prepared)
+            return prepared
+
+        # Bước 1 + 2: Mở rộng câu hỏi song song với tìm kiếm câu hỏi gốc
+        print("Bước 1+2: Mở rộng câu hỏi và tìm kiếm tài liệu (song song)...")
+        docs = await self._aexpand_and_search(question, prepared["history"], collections=collections)
+        print(f"Tìm thấy {len(docs)} tài liệu liên quan")
+
+        self._build_prompt_input(question, docs, prepared)
+        return prepared
+
+    def _self_assessment_to_validation(self, lean_answer: LeanRAGAnswer) -> Dict[str, Any]:
+        """Chuyển độ tin cậy tự đánh giá (0-10) sang cùng định dạng kết quả với _validate_response (thang 50)"""
+        confidence = max(0, min(10, int(lean_answer.confidence)))
+        total_score = confidence * 5
+        return {
+            'scores': {},
+            'total_score': total_score,
+            'feedback': lean_answer.feedback,
+            'should_improve': confidence < 5,
+            'quality_level': self._get_quality_level(total_score)
+        }
+
+    def _generate(self, prepared: Dict[str, Any]) -> tuple:
+        """Bước 3: Gọi LLM sinh phản hồi. Trả về (phản hồi, kết quả tự đánh giá hoặc None)"""
+        if self.pipeline_mode == PIPELINE_MODE_LEAN:
+            lean_answer = self.lean_chain.invoke(prepared["prompt_input"])
+            return lean_answer.answer, self._self_assessment_to_validation(lean_answer)
+
+        main_chain = self.main_rag_template | self.llm | StrOutputParser()
+        return main_chain.invoke(prepared["prompt_input"]), None
+
+    async def _agenerate(self, prepared: Dict[str, Any]) -> tuple:
+        """Phiên bản async của _generate"""
+        if self.pipeline_mode == PIPELINE_MODE_LEAN:
+            lean_answer = await self.lean_chain.ainvoke(prepared["prompt_input"])
+            return lean_answer.answer, self._self_assessment_to_validation(lean_answer)
+
+        main_chain = self.main_rag_template | self.llm | StrOutputParser()
+        return await main_chain.ainvoke(prepared["prompt_input"]), None
+
+    def _finalize_generation(self, question: str, response: str, prepared: Dict[str, Any]):
+        """Bước 4: Cập nhật lịch sử hội thoại và semantic cache sau khi có phản hồi đầy đủ"""
+        self.memory_store.append(prepared["conversation_id"], HumanMessage(content=question), AIMessage(content=response))
+
+        if self.answer_cache is not None and prepared["is_standalone"] and prepared["cached_response"] is None:
+            self.answer_cache.store(question, response, prepared["question_vector"])
+
+    def _error_result(self, error: Exception) -> Dict[str, Any]:
+        return {
+            "response": f"Xin lỗi, đã xảy ra lỗi khi xử lý câu hỏi của bạn. Vui lòng thử lại hoặc diễn đạt câu hỏi khác. Lỗi: {str(error)}",
+            "context": "",
+            "success": False,
+            "cached": False,
+            "self_assessment": None
+        }
+
+    def invoke_with_details(self, question: str, conversation_id: Hashable = DEFAULT_CONVERSATION_ID,
+                            collections: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Xử lý câu hỏi với Advanced RAG Pipeline.
+        Trả về phản hồi kèm context đã dùng để caller có thể lên lịch xác thực nền sau khi lưu tin nhắn.
+        collections: chỉ tìm trong tập con collection này (None = mọi collection trong Config.VECTOR_COLLECTIONS).
+        """
         print(f"\n--- ADVANCED RAG PROCESSING: '{question}' ---")
 
         try:
-            # Bước 1: Mở rộng câu hỏi
-            print("Bước 1: Mở rộng câu hỏi...")
-            query_info = self._expand_query(question)
-            print(f"Keywords: {query_info['keywords']}")
-            print(f"Main topic: {query_info['main_topic']}")
+            prepared = self._prepare_generation(question, conversation_id, collections)
+            if prepared["cached_response"] is not None:
+                self._finalize_generation(question, prepared["cached_response"], prepared)
+                print("--- ADVANCED RAG PROCESSING COMPLETED (semantic cache) ---\n")
+                return {"response": prepared["cached_response"], "context": "", "success": True, "cached": True,
+                        "self_assessment": None}
 
-            # Bước 2: Tìm kiếm kết hợp
-            print("Bước 2: Tìm kiếm tài liệu...")
-            docs = self._hybrid_search(query_info)
-            print(f"Tìm thấy {len(docs)} tài liệu liên quan")
+            response, self_assessment = self._generate(prepared)
 
-            # Bước 3: Tạo phản hồi chính
-            print("Bước 3: Tạo phản hồi...")
-            context = self._format_docs(docs)
-            conversation_history = self._format_conversation_history()
+            self._finalize_generation(question, response, prepared)
 
-            main_chain = self.main_rag_template | self.llm | StrOutputParser()
+            print("--- ADVANCED RAG PROCESSING COMPLETED ---\n")
+            return {"response": response, "context": prepared["context"], "success": True, "cached": False,
+                    "self_assessment": self_assessment}
 
-            response = main_chain.invoke({
-                "question": question,
-                "context": context,
-                "conversation_history": conversation_history
-            })
+        except Exception as e:
+            print(f"ERROR trong Advanced RAG processing: {e}")
+            # Fallback về basic response
+            return self._error_result(e)
 
-            # Bước 4: Xác thực chất lượng phản hồi
-            print("Bước 4: Xác thực chất lượng...")
-            validation = self._validate_response(question, response, context)
-            print(f"Quality level: {validation['quality_level']} (Score: {validation['total_score']}/50)")
+    async def ainvoke_with_details(self, question: str, conversation_id: Hashable = DEFAULT_CONVERSATION_ID,
+                                   collections: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Phiên bản async của invoke_with_details (LLM gọi bằng ainvoke, retriever chạy trên thread)"""
+        print(f"\n--- ADVANCED RAG PROCESSING (async): '{question}' ---")
 
-            # Bước 5: Cập nhật lịch sử hội thoại
-            self.add_to_conversation_history(HumanMessage(content=question))
-            self.add_to_conversation_history(AIMessage(content=response))
+        try:
+            prepared = await self._aprepare_generation(question, conversation_id, collections)
+            if prepared["cached_response"] is not None:
+                self._finalize_generation(question, prepared["cached_response"], prepared)
+                print("--- ADVANCED RAG PROCESSING COMPLETED (semantic cache) ---\n")
+                return {"response": prepared["cached_response"], "context": "", "success": True, "cached": True,
+                        "self_assessment": None}
+
+            response, self_assessment = await self._agenerate(prepared)
 
-            # Thêm thông tin debug nếu cần
-            if validation['quality_level'] == 'poor':
-                print(f"WARNING: Low quality response - {validation['feedback']}")
+            await asyncio.to_thread(self._finalize_generation, question, response, prepared)
 
             print("--- ADVANCED RAG PROCESSING COMPLETED ---\n")
-            return response
+            return {"response": response, "context": prepared["context"], "success": True, "cached": False,
+                    "self_assessment": self_assessment}
 
         except Exception as e:
-            print(f"ERROR trong Advanced RAG processing: {e}")
-            # Fallback về basic response
-            return f"Xin lỗi, đã xảy ra lỗi khi xử lý câu hỏi của bạn. Vui lòng thử lại hoặc diễn đạt câu hỏi khác. Lỗi: {str(e)}"
+            print(f"ERROR trong Advanced RAG processing (async): {e}")
+            return self._error_result(e)
+
+    def stream_with_details(self, question: str, result: Dict[str, Any],
+                            conversation_id: Hashable = DEFAULT_CONVERSATION_ID,
+                            collections: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        Giống invoke_with_details nhưng sinh phản hồi dạng stream qua LangChain .stream().
+        Yield từng đoạn token; khi stream kết thúc, `result` được điền response/context/success/cached.
+        """
+        print(f"\n--- ADVANCED RAG STREAMING: '{question}' ---")
+
+        try:
+            prepared = self._prepare_generation(question, conversation_id, collections)
+            if prepared["cached_response"] is not None:
+                yield prepared["cached_response"]
+                self._finalize_generation(question, prepared["cached_response"], prepared)
+                result.update({"response": prepared["cached_response"], "context": "", "success": True,
+                               "cached": True, "self_assessment": None})
+                print("--- ADVANCED RAG STREAMING COMPLETED (semantic cache) ---\n")
+                return
+
+            self_assessment = None
+            if self.pipeline_mode == PIPELINE_MODE_LEAN:
+                # Structured output không stream được theo token: trả về câu trả lời trong một lần
+                response, self_assessment = self._generate(prepared)
+                yield response
+            else:
+                main_chain = self.main_rag_template | self.llm | StrOutputParser()
+                response_parts = []
+                for chunk in main_chain.stream(prepared["prompt_input"]):
+                    response_parts.append(chunk)
+                    yield chunk
+                response = "".join(response_parts)
+
+            self._finalize_generation(question, response, prepared)
+            result.update({"response": response, "context": prepared["context"], "success": True, "cached": False,
+                           "self_assessment": self_assessment})
+            print("--- ADVANCED RAG STREAMING COMPLETED ---\n")
+
+        except Exception as e:
+            print(f"ERROR trong Advanced RAG streaming: {e}")
+            error_result = self._error_result(e)
+            result.update(error_result)
+            yield error_result["response"]
+
+    def invoke(self, question: str, conversation_id: Hashable = DEFAULT_CONVERSATION_ID,
+               collections: Optional[List[str]] = None) -> str:
+        """Xử lý câu hỏi với Advanced RAG Pipeline (không xác thực chất lượng: không có tin nhắn để lưu điểm)"""
+        return self.invoke_with_details(question, conversation_id, collections)["response"]
+
+    async def ainvoke(self, question: str, conversation_id: Hashable = DEFAULT_CONVERSATION_ID,
+                      collections: Optional[List[str]] = None) -> str:
+        """Phiên bản async của invoke"""
+        result = await self.ainvoke_with_details(question, conversation_id, collections)
+        return result["response"]
+
+    def stream(self, question: str, conversation_id: Hashable = DEFAULT_CONVERSATION_ID,
+               collections: Optional[List[str]] = None) -> Iterator[str]:
+        """Stream phản hồi theo token (không xác thực chất lượng, giống invoke)"""
+        yield from self.stream_with_details(question, {}, conversation_id, collections)
 
 
 # Factory function để tạo Advanced RAG Chain
-def get_advanced_rag_chain() -> AdvancedRAGChain:
+def get_advanced_rag_chain(history_loader: Optional[Callable[[Hashable, int], List[BaseMessage]]] = None) \
+        -> AdvancedRAGChain:
     """Tạo và trả về Advanced RAG Chain instance"""
     try:
-        return AdvancedRAGChain()
+        return AdvancedRAGChain(history_loader=history_loader)
     except Exception as e:
         print(f"ERROR: Không thể tạo Advanced RAG Chain: {e}")
         return None
@@ -0,0 +1,31 @@
+# app/rag/async_runner.py
+
+"""
+Event loop nền dùng chung cho các coroutine của RAG pipeline.
+Flask view là đồng bộ; thay vì asyncio.run() mỗi request (tạo loop mới, làm hỏng các async client
+của LLM đã gắn với loop cũ), mọi coroutine được gửi vào một loop chạy lâu dài trên thread riêng.
+"""
+
+import asyncio
+import threading
+from typing import Any, Coroutine
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="rag-async-loop", daemon=True)
+            thread.start()
+            print("Da khoi dong event loop nen cho RAG pipeline.")
+        return _loop
+
+
+def run_coroutine_sync(coroutine: Coroutine, timeout: float = None) -> Any:
+    """Chạy coroutine trên event loop nền và chờ kết quả từ code đồng bộ"""
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_loop())
+    return future.result(timeout=timeout)
@@ -0,0 +1,159 @@
+# app/rag/bm25_index.py
+
+"""
+Chỉ mục BM25 (tìm kiếm từ vựng) trên cùng tập chunk với Chroma.
+- Tách từ tiếng Việt: chuẩn hóa NFC, chữ thường, tách theo âm tiết và thêm bigram âm tiết
+  (từ tiếng Việt thường gồm nhiều âm tiết, ví dụ "chứng chỉ", "điều 5").
+- Lưu dạng CSR (postings) thành các file .npy cạnh data/chroma_db, khi khởi động được memory-map.
+"""
+
+import json
+import os
+import re
+import unicodedata
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.rag.metadata_filter import MetadataMaskCache
+
+BM25_META_FILE = "bm25_meta.json"
+BM25_DOCS_FILE = "bm25_docs.json"
+BM25_ARRAY_FILES = ("term_offsets", "postings_docs", "postings_tf", "doc_len", "idf")
+
+
+def tokenize_vietnamese(text: str) -> List[str]:
+    """Tách văn bản tiếng Việt thành âm tiết + bigram âm tiết (nối bằng '_')"""
+    normalized = unicodedata.normalize('NFC', text).lower()
+    syllables = re.findall(r'\w+', normalized)
+    bigrams = [f"{syllables[i]}_{syllables[i + 1]}" for i in range(len(syllables) - 1)]
+    return syllables + bigrams
+
+
+class BM25Index:
+    def __init__(self, vocab: dict, chunk_ids: List[str], texts: List[str], metadatas: List[dict],
+                 term_offsets: np.ndarray, postings_docs: np.ndarray, postings_tf: np.ndarray,
+                 doc_len: np.ndarray, idf: np.ndarray, k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab
+        self.chunk_ids = chunk_ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.term_offsets = term_offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf
+        self.doc_len = doc_len
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(np.mean(doc_len)) if len(doc_len) else 0.0
+        self._filter_masks = MetadataMaskCache(metadatas)
+
+    @classmethod
+    def build(cls, chunk_ids: List[str], texts: List[str], metadatas: List[dict],
+              k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Xây chỉ mục BM25 từ các chunk (cùng chunk id với Chroma)"""
+        vocab = {}
+        term_postings = []  # term_id -> {doc_index: tf}
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+
+        for doc_index, text in enumerate(texts):
+            tokens = tokenize_vietnamese(text)
+            doc_len[doc_index] = len(tokens)
+            for token in tokens:
+                term_id = vocab.setdefault(token, len(vocab))
+                if term_id == len(term_postings):
+                    term_postings.append({})
+                term_postings[term_id][doc_index] = term_postings[term_id].get(doc_index, 0) + 1
+
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for term_id, postings in enumerate(term_postings):
+            term_offsets[term_id + 1] = term_offsets[term_id] + len(postings)
+
+        postings_docs = np.empty(term_offsets[-1], dtype=np.int32)
+        postings_tf = np.empty(term_offsets[-1], dtype=np.float32)
+        for term_id, postings in enumerate(term_postings):
+            start = term_offsets[term_id]
+            doc_indexes = sorted(postings)
+            postings_docs[start:start + len(doc_indexes)] = doc_indexes
+            postings_tf[start:start + len(doc_indexes)] = [postings[d] for d in doc_indexes]
+
+        n_docs = len(texts)
+        doc_freq = np.diff(term_offsets).astype(np.float32)
+        idf = np.log(1.0 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+        return cls(vocab, list(chunk_ids), list(texts), [dict(m or {}) for m in metadatas],
+                   term_offsets, postings_docs, postings_tf, doc_len, idf, k1, b)
+
+    def save(self, directory: str):
+        """Lưu chỉ mục xuống thư mục (ghi file tạm rồi đổi tên)"""
+        os.makedirs(directory, exist_ok=True)
+        for name in BM25_ARRAY_FILES:
+            tmp_path = os.path.join(directory, f"{name}.tmp.npy")
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+
+        for file_name, payload in (
+                (BM25_DOCS_FILE, {"chunk_ids": self.chunk_ids, "texts": self.texts, "metadatas": self.metadatas}),
+                (BM25_META_FILE, {"vocab": self.vocab, "k1": self.k1, "b": self.b})):
+            tmp_path = os.path.join(directory, f"{file_name}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(directory, file_name))
+
+        print(f"Da luu BM25 index ({len(self.chunk_ids)} chunks, {len(self.vocab)} terms) vao '{directory}'.")
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        """Tải chỉ mục, các mảng postings được memory-map (mmap_mode='r')"""
+        meta_path = os.path.join(directory, BM25_META_FILE)
+        if not os.path.exists(meta_path):
+            print(f"WARNING: Khong tim thay BM25 index tai '{directory}'. Chi dung tim kiem vector.")
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(directory, BM25_DOCS_FILE), "r", encoding="utf-8") as f:
+                docs = json.load(f)
+            arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+                      for name in BM25_ARRAY_FILES}
+            index = cls(meta["vocab"], docs["chunk_ids"], docs["texts"], docs["metadatas"],
+                        k1=meta["k1"], b=meta["b"], **arrays)
+            print(f"Da tai BM25 index ({len(index.chunk_ids)} chunks) tu '{directory}'.")
+            return index
+        except Exception as e:
+            print(f"ERROR: Loi khi tai BM25 index tu '{directory}': {e}")
+            return None
+
+    def search(self, query: str, k: int = 10, where: Optional[dict] = None) -> List[Document]:
+        """
+        Trả về top-k chunk theo điểm BM25; metadata có 'chunk_id' và 'bm25_score'.
+        where (cú pháp Chroma) giới hạn kết quả trong các chunk có metadata thỏa bộ lọc.
+        """
+        n_docs = len(self.chunk_ids)
+        if n_docs == 0:
+            return []
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for token in set(tokenize_vietnamese(query)):
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            doc_indexes = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[doc_indexes] / self.avgdl)
+            scores[doc_indexes] += self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + norm)
+
+        if where:
+            scores[~self._filter_masks.mask(where)] = 0.0
+
+        k = min(k, n_docs)
+        top_indexes = np.argpartition(-scores, k - 1)[:k]
+        top_indexes = top_indexes[np.argsort(-scores[top_indexes])]
+
+        return [
+            Document(page_content=self.texts[i],
+                     metadata={**self.metadatas[i], 'chunk_id': self.chunk_ids[i], 'bm25_score': float(scores[i])})
+            for i in top_indexes if scores[i] > 0
+        ]
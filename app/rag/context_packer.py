@@ -0,0 +1,124 @@
+# app/rag/context_packer.py
+
+"""
+Ghép context cho prompt RAG trong giới hạn token.
+- Các chunk liền kề của cùng source_file có phần chồng lấn (CHUNK_OVERLAP) được nối lại thành một đoạn
+- Đoạn văn đã xuất hiện trong context (lặp lại giữa các chunk) bị loại
+- Các đoạn được thêm theo thứ tự liên quan cho đến khi hết ngân sách token
+"""
+
+import math
+import re
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from app.core.config import Config
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (không có tokenizer của Gemini ở local) theo số ký tự"""
+    return math.ceil(len(text) / Config.CONTEXT_CHARS_PER_TOKEN)
+
+
+def _source_key(doc: Document) -> Optional[str]:
+    return doc.metadata.get('source_file') or doc.metadata.get('source')
+
+
+def _merge_overlapping_text(first: str, second: str, min_overlap: int) -> Optional[str]:
+    """Nối second vào sau first nếu phần đầu second trùng phần cuối first (ít nhất min_overlap ký tự)"""
+    if second in first:
+        return first
+    probe = second[:min_overlap]
+    if len(probe) < min_overlap:
+        return None
+
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first + second[len(first) - start:]
+        start = first.find(probe, start + 1)
+    return None
+
+
+def _merge_adjacent(text_a: str, text_b: str, min_overlap: int) -> Optional[str]:
+    """Thử nối hai chunk theo cả hai chiều (chunk tìm thấy sau có thể đứng trước trong tài liệu)"""
+    return _merge_overlapping_text(text_a, text_b, min_overlap) or _merge_overlapping_text(text_b, text_a, min_overlap)
+
+
+def _merge_chunks(docs: List[Document], min_overlap: int) -> List[Document]:
+    """Nối các chunk chồng lấn của cùng nguồn; đoạn nối giữ vị trí (độ liên quan) của chunk tốt nhất"""
+    blocks: List[Document] = []
+    for doc in docs:
+        blocks.append(Document(page_content=doc.page_content,
+                               metadata={**doc.metadata, 'merged_chunk_ids': [doc.metadata.get('chunk_id')]}))
+        current_index = len(blocks) - 1
+        source = _source_key(doc)
+
+        # Lặp vì chunk mới có thể nối hai đoạn đã có (chunk nằm giữa hai chunk khác)
+        merged = source is not None
+        while merged:
+            merged = False
+            for i, block in enumerate(blocks):
+                if i == current_index or _source_key(block) != source:
+                    continue
+                merged_text = _merge_adjacent(block.page_content, blocks[current_index].page_content, min_overlap)
+                if merged_text is None:
+                    continue
+                keep_index, drop_index = min(i, current_index), max(i, current_index)
+                blocks[keep_index].page_content = merged_text
+                blocks[keep_index].metadata['merged_chunk_ids'].extend(blocks[drop_index].metadata['merged_chunk_ids'])
+                del blocks[drop_index]
+                current_index = keep_index
+                merged = True
+                break
+    return blocks
+
+
+def _remove_repeated_paragraphs(text: str, seen_paragraphs: set) -> tuple:
+    """
+    Bỏ các đoạn văn đã có trong context (so sánh sau khi chuẩn hóa khoảng trắng).
+    Trả về (nội dung còn lại, tập đoạn văn mới) để chỉ đánh dấu khi đoạn được đưa vào context.
+    """
+    kept = []
+    new_paragraphs = set()
+    for paragraph in re.split(r'\n\s*\n', text):
+        normalized = re.sub(r'\s+', ' ', paragraph).strip().lower()
+        if not normalized:
+            continue
+        if normalized in seen_paragraphs or normalized in new_paragraphs:
+            continue
+        new_paragraphs.add(normalized)
+        kept.append(paragraph.strip())
+    return "\n\n".join(kept), new_paragraphs
+
+
+def pack_context(docs: List[Document], token_budget: int = None, min_overlap: int = None) -> List[Document]:
+    """
+    Trả về list Document đã nối, bỏ lặp và nằm trong ngân sách token, theo thứ tự liên quan của docs đầu vào.
+    Đoạn liên quan nhất được cắt bớt nếu một mình nó đã vượt ngân sách.
+    """
+    token_budget = token_budget if token_budget is not None else Config.CONTEXT_TOKEN_BUDGET
+    min_overlap = min_overlap if min_overlap is not None else Config.CONTEXT_MIN_OVERLAP_CHARS
+
+    packed_docs = []
+    seen_paragraphs = set()
+    used_tokens = 0
+    for block in _merge_chunks(docs, min_overlap):
+        content, new_paragraphs = _remove_repeated_paragraphs(block.page_content, seen_paragraphs)
+        if not content:
+            continue
+
+        tokens = estimate_tokens(content)
+        if used_tokens + tokens > token_budget:
+            if packed_docs:
+                continue
+            content = content[:int(token_budget * Config.CONTEXT_CHARS_PER_TOKEN)]
+            tokens = estimate_tokens(content)
+
+        packed_docs.append(Document(page_content=content, metadata=block.metadata))
+        seen_paragraphs |= new_paragraphs
+        used_tokens += tokens
+
+    print(f"Context packer: {len(docs)} chunks -> {len(packed_docs)} doan, ~{used_tokens}/{token_budget} tokens.")
+    return packed_docs
@@ -0,0 +1,83 @@
+# app/rag/conversation_memory.py
+
+"""
+Bộ nhớ hội thoại theo từng phiên chat.
+Mỗi phiên (chat session id, hoặc khóa khách) có cửa sổ tin nhắn riêng có giới hạn;
+số phiên giữ trong bộ nhớ cũng có giới hạn (LRU). Khi phiên không có trong bộ nhớ,
+lịch sử được nạp lại từ bảng messages (chỉ N dòng cuối) thông qua history_loader.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from app.core.config import Config
+
+
+class ConversationMemoryStore:
+    def __init__(self, history_loader: Optional[Callable[[Hashable, int], List[BaseMessage]]] = None,
+                 max_sessions: int = None, window: int = None):
+        self.history_loader = history_loader
+        self.max_sessions = max_sessions if max_sessions is not None else Config.CONVERSATION_MEMORY_MAX_SESSIONS
+        self.window = window if window is not None else Config.CONVERSATION_MEMORY_WINDOW
+        self._sessions: "OrderedDict[Hashable, List[BaseMessage]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _rehydrate(self, conversation_id: Hashable) -> List[BaseMessage]:
+        """Nạp lại các lượt hội thoại đã hoàn tất từ DB khi phiên không có trong bộ nhớ"""
+        if self.history_loader is None:
+            return []
+        try:
+            history = list(self.history_loader(conversation_id, self.window + 1))
+        except Exception as e:
+            print(f"ERROR: Loi khi nap lai lich su hoi thoai cho phien {conversation_id}: {e}")
+            return []
+
+        # Tin nhắn người dùng cuối chưa có phản hồi là câu hỏi đang xử lý, không phải lượt đã hoàn tất
+        if history and isinstance(history[-1], HumanMessage):
+            history = history[:-1]
+        return history[-self.window:]
+
+    def _get_or_load(self, conversation_id: Hashable) -> List[BaseMessage]:
+        history = self._sessions.get(conversation_id)
+        if history is None:
+            history = self._rehydrate(conversation_id)
+            self._sessions[conversation_id] = history
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(conversation_id)
+        return history
+
+    def get(self, conversation_id: Hashable) -> List[BaseMessage]:
+        """Trả về bản sao lịch sử hội thoại của phiên"""
+        with self._lock:
+            return list(self._get_or_load(conversation_id))
+
+    def append(self, conversation_id: Hashable, *messages: BaseMessage):
+        """Thêm tin nhắn vào phiên và cắt theo cửa sổ"""
+        with self._lock:
+            history = self._get_or_load(conversation_id)
+            history.extend(messages)
+            if len(history) > self.window:
+                del history[:-self.window]
+
+    def reset(self, conversation_id: Hashable):
+        """Xóa lịch sử của một phiên; lần truy cập sau sẽ bắt đầu rỗng thay vì nạp lại từ DB"""
+        with self._lock:
+            self._sessions[conversation_id] = []
+            self._sessions.move_to_end(conversation_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "window": self.window,
+        }
@@ -0,0 +1,101 @@
+# app/rag/conversion_cache.py
+
+"""
+Cache trên đĩa cho văn bản đã chuyển đổi, định địa chỉ theo nội dung (Config.CONVERSION_CACHE_DIR).
+Kết quả docling được lưu theo hash file, kết quả OCR theo hash ảnh trang đã render (kèm tham số Tesseract),
+nên file/trang giống hệt nhau không phải chuyển đổi lại, kể cả khi build lại toàn bộ do đổi model embedding
+hoặc tham số chia chunk. Mỗi entry là một file JSON ghi nguyên tử; đọc entry cập nhật mtime và khi cache vượt
+Config.CONVERSION_CACHE_MAX_MB thì xóa entry ít dùng gần đây nhất.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+from app.core.config import Config
+
+CACHE_FORMAT_VERSION = 1
+DOCLING_NAMESPACE = "docling"
+OCR_NAMESPACE = "ocr"
+
+
+def docling_cache_key(file_hash: str, file_extension: str) -> str:
+    """Khóa cache của kết quả docling: hash nội dung file và phần mở rộng (docling chọn bộ chuyển đổi theo đuôi file)"""
+    return hashlib.sha256(f"{CACHE_FORMAT_VERSION}|{file_extension}|{file_hash}".encode("utf-8")).hexdigest()
+
+
+def ocr_cache_key(mode: str, width: int, height: int, samples: bytes) -> str:
+    """Khóa cache của kết quả OCR: hash buffer ảnh trang (DPI/grayscale nằm sẵn trong ảnh) và tham số Tesseract"""
+    digest = hashlib.sha256(
+        f"{CACHE_FORMAT_VERSION}|{Config.OCR_LANG}|{Config.OCR_TESSERACT_OEM}|{Config.OCR_TESSERACT_PSM}|"
+        f"{mode}|{width}x{height}|".encode("utf-8"))
+    digest.update(samples)
+    return digest.hexdigest()
+
+
+def _entry_path(namespace: str, key: str) -> str:
+    return os.path.join(Config.CONVERSION_CACHE_DIR, namespace, key[:2], f"{key}.json")
+
+
+def get_cached(namespace: str, key: str) -> Optional[Any]:
+    """Giá trị đã lưu của khóa (None nếu chưa có hoặc entry hỏng); cập nhật mtime để eviction giữ entry vừa dùng"""
+    path = _entry_path(namespace, key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = json.load(f)["value"]
+        os.utime(path)
+        return value
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"WARNING: Entry cache hong '{path}': {e}")
+        return None
+
+
+def put_cached(namespace: str, key: str, value: Any):
+    """Lưu giá trị (ghi file tạm riêng của process rồi đổi tên, an toàn khi nhiều process ingest cùng ghi)"""
+    path = _entry_path(namespace, key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"value": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"WARNING: Khong ghi duoc cache '{path}': {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def enforce_cache_size_limit(max_bytes: int = None):
+    """Xóa entry có mtime cũ nhất (ít dùng gần đây nhất) cho tới khi tổng dung lượng cache không vượt max_bytes"""
+    max_bytes = Config.CONVERSION_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    if not os.path.isdir(Config.CONVERSION_CACHE_DIR):
+        return
+
+    entries = []
+    for dir_path, _, file_names in os.walk(Config.CONVERSION_CACHE_DIR):
+        for file_name in file_names:
+            if not file_name.endswith(".json"):
+                continue
+            path = os.path.join(dir_path, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_bytes -= size
+        evicted += 1
+    print(f"Cache chuyen doi: {len(entries) - evicted} entry ({total_bytes / (1024 * 1024):.1f} MB), "
+          f"da xoa {evicted} entry cu.")
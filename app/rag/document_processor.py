@@ -1,7 +1,12 @@
+import multiprocessing
 import os
 import random
 import re
+import shutil
 import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from typing import List
 
 import chromadb
@@ -9,23 +14,38 @@ from chromadb.api.models.Collection import Collection
 
 from langchain_core.documents import Document
 
-from langchain_huggingface import HuggingFaceEmbeddings
-
 from app.core.config import Config
+from app.rag.bm25_index import BM25Index
+from app.rag.conversion_cache import DOCLING_NAMESPACE, OCR_NAMESPACE, docling_cache_key, \
+    enforce_cache_size_limit, get_cached, ocr_cache_key, put_cached
 from app.rag.document_loaders_factory import get_document_loader_factory
+from app.rag.embedding_registry import EmbeddingModelRegistry
+from app.rag.index_version import create_snapshot, get_index_paths, publish_snapshot
+from app.rag.ingestion_manifest import compute_file_hash, is_manifest_compatible, load_manifest, new_manifest, \
+    plan_ingestion, save_manifest
+from app.rag.numpy_vector_index import NumpyVectorIndex
 from app.rag.text_splitting_strategies import TextSplitterContext, StructuredTextSplitterStrategy, \
     UnstructuredTextSplitterStrategy
 
+# PyMuPDF du de doc text layer cua PDF; pytesseract + Pillow chi can cho cac trang phai OCR
+try:
+    import fitz
+
+    PYMUPDF_AVAILABLE = True
+except ImportError as e:
+    print(f"WARNING: Khong the import PyMuPDF de xu ly PDF: {e}")
+    print("Dam bao da cai dat: pip install PyMuPDF")
+    PYMUPDF_AVAILABLE = False
+
 try:
     import pytesseract
     from PIL import Image
-    import fitz
 
-    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+    pytesseract.pytesseract.tesseract_cmd = Config.TESSERACT_PATH
     PYTESSERACT_AVAILABLE = True
 except ImportError as e:
-    print(f"WARNING: Khong the import cac thu vien can thiet cho xu ly PDF voi pytesseract: {e}")
-    print("Dam bao da cai dat: pip install pytesseract Pillow PyMuPDF")
+    print(f"WARNING: Khong the import cac thu vien can thiet cho OCR PDF voi pytesseract: {e}")
+    print("Dam bao da cai dat: pip install pytesseract Pillow")
     PYTESSERACT_AVAILABLE = False
 except Exception as e:
     print(f"WARNING: Loi khi cau hinh pytesseract.pytesseract.tesseract_cmd: {e}")
@@ -34,47 +54,188 @@ except Exception as e:
 
 print(f"--- DEBUG TEST: PYTESSERACT_AVAILABLE = {PYTESSERACT_AVAILABLE} ---")
 
+# Chu cai tieng Viet nam trong khoi Latin-1; ky tu Latin-1 khac (µ, ¸, ·, ...) thuong la dau hieu
+# font ma hoa cu (TCVN3/VNI) bi trich xuat sai
+VIETNAMESE_LATIN1_LETTERS = set("àáâãèéêìíòóôõùúýÀÁÂÃÈÉÊÌÍÒÓÔÕÙÚÝ")
+PDF_CID_PATTERN = re.compile(r"\(cid:\d+\)")
+
 
-def load_and_process_pdf_with_pytesseract(file_path: str) -> List[Document]:
+def _text_layer_quality(text: str) -> float:
+    """
+    Ty le ky tu (khong tinh khoang trang) trong text layer trong co ve hop le.
+    Ky tu bi tinh la loi: (cid:N) cua font khong co bang ma Unicode, ky tu thay the U+FFFD,
+    vung private use, ky tu dieu khien va ky tu Latin-1 khong thuoc tieng Viet.
+    """
+    cid_count = len(PDF_CID_PATTERN.findall(text))
+    text = PDF_CID_PATTERN.sub("", text)
+    chars = [ch for ch in text if not ch.isspace()]
+    total = len(chars) + cid_count
+    if not total:
+        return 0.0
+    bad = cid_count
+    for ch in chars:
+        if ch == "\ufffd" or unicodedata.category(ch) in ("Co", "Cc", "Cn"):
+            bad += 1
+        elif "\u00a0" <= ch <= "\u00ff" and ch not in VIETNAMESE_LATIN1_LETTERS:
+            bad += 1
+    return 1 - bad / total
+
+
+def _is_usable_text_layer(text: str) -> bool:
+    non_space_chars = sum(1 for ch in text if not ch.isspace())
+    return (non_space_chars >= Config.PDF_TEXT_LAYER_MIN_CHARS
+            and _text_layer_quality(text) >= Config.PDF_TEXT_LAYER_MIN_QUALITY)
+
+
+def _rasterize_pdf_page(page) -> tuple:
+    """Render trang PDF theo Config.OCR_DPI (grayscale neu bat), tra ve buffer tho (mode, width, height, samples)"""
+    colorspace = fitz.csGRAY if Config.OCR_GRAYSCALE else fitz.csRGB
+    pix = page.get_pixmap(dpi=Config.OCR_DPI, colorspace=colorspace, alpha=False)
+    return "L" if Config.OCR_GRAYSCALE else "RGB", pix.width, pix.height, pix.samples
+
+
+def _ocr_page_image(page_number: int, mode: str, width: int, height: int, samples: bytes) -> tuple:
+    """OCR mot trang tu buffer anh tho (chay trong process con OCR), tra ve (page_number, text)"""
+    img = Image.frombytes(mode, (width, height), samples)
+    text = pytesseract.image_to_string(
+        img, lang=Config.OCR_LANG, config=f"--oem {Config.OCR_TESSERACT_OEM} --psm {Config.OCR_TESSERACT_PSM}")
+    return page_number, re.sub(r'\s+', ' ', text).strip()
+
+
+def _ocr_pdf_pages(doc, page_numbers: list[int], use_cache: bool = True) -> dict:
     """
-    Loads a PDF, converts each page to an image, and extracts text using pytesseract.
-    Returns a list of Documents, where each Document corresponds to the text of a page.
+    OCR cac trang (danh so tu 1) cua PDF, tra ve dict page_number -> text (trang loi khong co trong dict).
+    Trang duoc render trong process chinh va gui sang process pool duoi dang buffer tho (khong ma hoa lai anh);
+    so trang dang cho toi da 2 * so worker de gioi han bo nho. Khi da chay trong process con
+    (ingest song song theo file) thi OCR tuan tu de khong tao pool long nhau.
+    Voi use_cache, trang co anh giong het lan truoc lay text tu cache OCR thay vi chay Tesseract.
+    """
+    max_workers = Config.OCR_WORKERS if multiprocessing.parent_process() is None else 1
+    max_workers = max(1, min(max_workers, len(page_numbers)))
+    page_texts = {}
+    cache_hits = 0
+
+    def rendered_pages():
+        """Sinh (page_number, anh trang, khoa cache) cho cac trang chua co trong cache"""
+        nonlocal cache_hits
+        for page_number in page_numbers:
+            try:
+                page_image = _rasterize_pdf_page(doc.load_page(page_number - 1))
+            except Exception as e:
+                print(f"ERROR: Loi khi render trang {page_number} cua PDF: {e}")
+                continue
+            cache_key = ocr_cache_key(*page_image) if use_cache else None
+            cached_text = get_cached(OCR_NAMESPACE, cache_key) if use_cache else None
+            if cached_text is not None:
+                page_texts[page_number] = cached_text
+                cache_hits += 1
+                continue
+            yield page_number, page_image, cache_key
+
+    def store_result(page_number, text, cache_key):
+        page_texts[page_number] = text
+        if cache_key:
+            put_cached(OCR_NAMESPACE, cache_key, text)
+
+    if max_workers == 1:
+        for page_number, page_image, cache_key in rendered_pages():
+            print(f"--- Dang OCR trang {page_number}/{doc.page_count} cua PDF ---")
+            try:
+                store_result(page_number, _ocr_page_image(page_number, *page_image)[1], cache_key)
+            except Exception as e:
+                print(f"ERROR: Loi OCR trang {page_number} cua PDF: {e}")
+    else:
+        print(f"--- Dang OCR {len(page_numbers)} trang PDF tren {max_workers} process "
+              f"(dpi={Config.OCR_DPI}, grayscale={Config.OCR_GRAYSCALE}, psm={Config.OCR_TESSERACT_PSM}) ---")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            remaining_pages = rendered_pages()
+            while True:
+                for page_number, page_image, cache_key in remaining_pages:
+                    pending[executor.submit(_ocr_page_image, page_number, *page_image)] = (page_number, cache_key)
+                    if len(pending) >= 2 * max_workers:
+                        break
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page_number, cache_key = pending.pop(future)
+                    try:
+                        store_result(page_number, future.result()[1], cache_key)
+                        print(f"Da OCR trang {page_number}/{doc.page_count} ({len(page_texts)}/{len(page_numbers)}).")
+                    except Exception as e:
+                        print(f"ERROR: Loi OCR trang {page_number} cua PDF: {e}")
+
+    if cache_hits:
+        print(f"Cache OCR: {cache_hits}/{len(page_numbers)} trang lay tu cache.")
+    return page_texts
+
+
+def load_and_process_pdf_with_pytesseract(file_path: str, use_cache: bool = True) -> List[Document]:
+    """
+    Loads a PDF and extracts text page by page: the embedded text layer (PyMuPDF) is used when it looks
+    usable (see _is_usable_text_layer); remaining pages are rendered and OCR'd with pytesseract in parallel.
+    Returns a list of Documents, where each Document corresponds to the text of a page
+    (metadata "extraction_method" is "text_layer" or "ocr"). OCR results are cached by page-image hash
+    unless use_cache is False. Only PyMuPDF is required; without pytesseract/Pillow, pages that need OCR
+    are skipped (reported as "no_ocr").
     """
     print(f"--- Dang xu ly file PDF: {file_path} bang PyMuPDF va pytesseract ---")
-    if not PYTESSERACT_AVAILABLE:
-        print(
-            "Loi: pytesseract, Pillow hoac PyMuPDF chua duoc cai dat hoac cau hinh sai. Khong the xu ly PDF theo cach nay.")
+    if not PYMUPDF_AVAILABLE:
+        print("Loi: PyMuPDF chua duoc cai dat. Khong the xu ly PDF theo cach nay.")
         return []
 
     processed_documents = []
     try:
-        doc = fitz.open(file_path)
-        for i in range(doc.page_count):
-            page = doc.load_page(i)
-
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-            print(f"--- Dang OCR trang {i + 1}/{doc.page_count} cua PDF ---")
-            try:
-
-                text = pytesseract.image_to_string(img, lang='vie', config='--oem 1')
-
-                text = re.sub(r'\s+', ' ', text).strip()
-
-                if text:
-                    metadata = {
-                        "source_file": os.path.basename(file_path),
-                        "original_type": ".pdf",
-                        "page_number": i + 1,
-                        "file_path": file_path
-                    }
-                    processed_documents.append(Document(page_content=text, metadata=metadata))
-                else:
-                    print(f"Warning: Trang {i + 1} cua PDF khong co van ban sau OCR.")
-
-            except Exception as e:
-                print(f"ERROR: Loi OCR trang {i + 1} cua PDF: {e}")
+        with fitz.open(file_path) as doc:
+            page_numbers = list(range(1, doc.page_count + 1))
+            page_texts = {}
+            page_methods = {}
+            if Config.PDF_TEXT_LAYER_ENABLED:
+                for page_number in page_numbers:
+                    try:
+                        text = re.sub(r'\s+', ' ', doc.load_page(page_number - 1).get_text("text")).strip()
+                    except Exception as e:
+                        print(f"WARNING: Loi khi doc text layer trang {page_number} cua PDF: {e}")
+                        continue
+                    if _is_usable_text_layer(text):
+                        page_texts[page_number] = text
+                        page_methods[page_number] = "text_layer"
+
+            ocr_page_numbers = [page_number for page_number in page_numbers if page_number not in page_texts]
+            if ocr_page_numbers and not PYTESSERACT_AVAILABLE:
+                print(f"WARNING: {len(ocr_page_numbers)} trang can OCR nhung pytesseract/Pillow chua duoc cai dat "
+                      f"hoac cau hinh sai. Bo qua cac trang nay.")
+                page_methods.update({page_number: "no_ocr" for page_number in ocr_page_numbers})
+            elif ocr_page_numbers:
+                ocr_texts = _ocr_pdf_pages(doc, ocr_page_numbers, use_cache)
+                page_texts.update(ocr_texts)
+                page_methods.update({page_number: "ocr" for page_number in ocr_texts})
+
+        for page_number in page_numbers:
+            text = page_texts.get(page_number)
+            if text:
+                metadata = {
+                    "source_file": os.path.basename(file_path),
+                    "original_type": ".pdf",
+                    "page_number": page_number,
+                    "file_path": file_path,
+                    "extraction_method": page_methods[page_number]
+                }
+                processed_documents.append(Document(page_content=text, metadata=metadata))
+            elif page_number in page_texts:
+                print(f"Warning: Trang {page_number} cua PDF khong co van ban sau OCR.")
+                page_methods[page_number] = "empty"
+            elif page_number not in page_methods:
+                page_methods[page_number] = "error"
+
+        method_counts = Counter(page_methods.values())
+        print(f"Thong ke trang PDF '{os.path.basename(file_path)}' ({len(page_numbers)} trang): "
+              f"text_layer={method_counts['text_layer']}, ocr={method_counts['ocr']}, "
+              f"empty={method_counts['empty']}, no_ocr={method_counts['no_ocr']}, error={method_counts['error']}")
+        print("Duong xu ly tung trang: " + ", ".join(f"{page_number}:{page_methods[page_number]}"
+                                                    for page_number in page_numbers))
 
         if not processed_documents:
             print(f"WARNING: Khong co van ban nao duoc trich xuat tu file PDF '{file_path}'.")
@@ -87,9 +248,9 @@ def load_and_process_pdf_with_pytesseract(file_path: str) -> List[Document]:
 
 def get_embedding_model():
     """
-    Khoi tao va cau hinh Embedding Model.
+    Lay Embedding Model dung chung cua process (EmbeddingModelRegistry chi tai model mot lan).
     """
-    print("\n--- Dang khoi tao Embedding Model (get_embedding_model) ---")
+    print("\n--- Dang lay Embedding Model (get_embedding_model) ---")
     if not hasattr(Config, 'SENTENCE_TRANSFORMER_MODEL_NAME') or not Config.SENTENCE_TRANSFORMER_MODEL_NAME:
         print("ERROR: Config.SENTENCE_TRANSFORMER_MODEL_NAME khong duoc tim thay.")
         print("Dam bao SENTENCE_TRANSFORMER_MODEL_NAME duoc dinh nghia trong config.py.")
@@ -97,15 +258,9 @@ def get_embedding_model():
         return None
 
     model_name = Config.SENTENCE_TRANSFORMER_MODEL_NAME
-    print(f"Dang khoi tao HuggingFaceEmbeddings voi model: '{model_name}'")
 
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name=model_name,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-        print(f"Da khoi tao HuggingFaceEmbeddings voi model '{model_name}' thanh cong.")
+        embeddings = EmbeddingModelRegistry.get(model_name)
         print("get_embedding_model hoan tat, tra ve Embedding Model.")
         return embeddings
 
@@ -117,27 +272,71 @@ def get_embedding_model():
         return None
 
 
-def manually_store_chunks_in_vector_db(chunks: list[Document], embeddings) -> Collection | None:
+def get_hnsw_collection_metadata(space: str = None, m: int = None, ef_construction: int = None,
+                                 ef_search: int = None) -> dict:
+    """
+    Metadata cau hinh HNSW cho collection Chroma (mac dinh lay tu Config).
+    get_collection_space doc lai 'hnsw:space' de doi khoang cach sang do tuong dong.
+    """
+    return {
+        "hnsw:space": space or Config.HNSW_SPACE,
+        "hnsw:M": m or Config.HNSW_M,
+        "hnsw:construction_ef": ef_construction or Config.HNSW_EF_CONSTRUCTION,
+        "hnsw:search_ef": ef_search or Config.HNSW_EF_SEARCH,
+    }
+
+
+def make_chunk_id(chunk: Document, position: int) -> str:
+    """
+    Chunk id on dinh: ten file + trang + hash noi dung file + thu tu chunk trong file.
+    Chay lai voi file khong doi cho cung id; file thay doi cho id moi (chunk cu bi xoa theo manifest).
+    """
+    source_info = chunk.metadata.get("source_file", "unknown_source").replace("\\", "_").replace("/", "_").replace(
+        ":", "").replace(".", "_")
+    page_number_info = chunk.metadata.get("page_number", "no_page")
+    file_hash = chunk.metadata.get("file_hash", "nohash")[:16]
+    chunk_index = chunk.metadata.get("chunk_index", position)
+    return f"{source_info}_page_{page_number_info}_{file_hash}_chunk_{chunk_index}"
+
+
+def manually_store_chunks_in_vector_db(chunks: list[Document], embeddings, collection_name: str = None,
+                                       base_snapshot_paths: dict = None, stale_chunk_ids: list[str] = None,
+                                       manifest: dict = None) -> Collection | None:
+    """
+    Build collection (mac dinh: Config.DEFAULT_COLLECTION_NAME) vao mot snapshot moi cua rieng collection do
+    va cong bo snapshot; cac collection khac khong bi anh huong.
+    Ingest tang dan: base_snapshot_paths la snapshot dang cong bo, Chroma DB cua no duoc sao chep sang snapshot moi,
+    chunk trong stale_chunk_ids bi xoa va chi cac chunk moi duoc embed. manifest duoc luu cung snapshot.
+    """
     print("\n--- Dang tao Vector Database va luu tru Embeddings (manually_store_chunks_in_vector_db) ---")
-    if not chunks:
+    stale_chunk_ids = stale_chunk_ids or []
+    if not chunks and not stale_chunk_ids:
         print("WARNING: Danh sach chunks dau vao rong. Khong the luu vao Vector DB.")
         print("manually_store_chunks_in_vector_db hoan tat, tra ve None.")
         return None
 
-    if embeddings is None:
+    if chunks and embeddings is None:
         print("ERROR: Embedding Model la None. Khong the luu vao Vector DB.")
         print("manually_store_chunks_in_vector_db hoan tat, tra ve None.")
         return None
 
-    db_directory = Config.VECTOR_DB_PATH
-    collection_name = "document_collection"
+    # Build vao snapshot moi; worker web van doc snapshot cu cho den khi snapshot nay duoc cong bo
+    collection_name = collection_name or Config.DEFAULT_COLLECTION_NAME
+    snapshot_version, snapshot_paths = create_snapshot(collection_name)
+    db_directory = snapshot_paths["chroma"]
     print(f"Dang luu tru embeddings vao thu muc: {db_directory} voi collection '{collection_name}'")
 
-    if not os.path.exists(db_directory):
-        os.makedirs(db_directory)
-        print(f"Da tao thu muc Vector DB: {db_directory}")
-
     try:
+        base_db_directory = (base_snapshot_paths or {}).get("chroma")
+        if base_db_directory and os.path.isdir(base_db_directory):
+            # Snapshot cu chi duoc doc (worker web), sao chep roi cap nhat ban sao
+            print(f"Dang sao chep Vector DB cua snapshot '{base_snapshot_paths['version']}' de cap nhat tang dan...")
+            shutil.copytree(base_db_directory, db_directory)
+
+        if not os.path.exists(db_directory):
+            os.makedirs(db_directory)
+            print(f"Da tao thu muc Vector DB: {db_directory}")
+
         print("Dang khoi tao Chroma client persistent...")
         client = chromadb.PersistentClient(path=db_directory)
         print("Da khoi tao Chroma client persistent.")
@@ -145,6 +344,7 @@ def manually_store_chunks_in_vector_db(chunks: list[Document], embeddings) -> Co
         print(f"Dang lay hoac tao collection '{collection_name}'...")
         collection = client.get_or_create_collection(
             name=collection_name,
+            metadata=get_hnsw_collection_metadata(),
         )
         print(f"Da lay hoac tao collection '{collection_name}'.")
 
@@ -153,55 +353,66 @@ def manually_store_chunks_in_vector_db(chunks: list[Document], embeddings) -> Co
         print(f"So luong items trong collection: {collection.count()}")
         print("--- KET THUC DEBUG TRUOC ADD ---")
 
-        print(f"\nDang tao embeddings cho {len(chunks)} chunks...")
-        chunk_texts = [chunk.page_content for chunk in chunks]
+        if stale_chunk_ids:
+            print(f"Dang xoa {len(stale_chunk_ids)} chunk cua file da thay doi hoac da bi xoa...")
+            collection.delete(ids=stale_chunk_ids)
 
-        chunk_ids = []
-        for i, chunk in enumerate(chunks):
-            source_info = chunk.metadata.get("source_file", "unknown_source").replace("\\", "_").replace("/",
-                                                                                                         "_").replace(
-                ":", "").replace(".", "_")
+        if chunks:
+            print(f"\nDang tao embeddings cho {len(chunks)} chunks...")
+            chunk_texts = [chunk.page_content for chunk in chunks]
+            chunk_ids = [make_chunk_id(chunk, i) for i, chunk in enumerate(chunks)]
+            chunk_metadatas = [chunk.metadata for chunk in chunks]
 
-            page_number_info = chunk.metadata.get("page_number", "no_page")
-            chunk_ids.append(f"{source_info}_page_{page_number_info}_chunk_{i}")
+            print(
+                f"Kiem tra chunk_texts: {len(chunk_texts)} items. Kieu item dau tien: {type(chunk_texts[0]) if chunk_texts else 'None'}")
+            if chunk_texts:
+                print(f"Noi dung 500 ky tu dau cua chunk_texts[0]: {chunk_texts[0][:500]}...")
+            print("--- END DEBUG TRUOC EMBEDDING ---")
+
+            start_time = time.time()
+            chunk_embeddings = embeddings.embed_documents(chunk_texts)
+            end_time = time.time()
+            print(f"Da tao embeddings cho {len(chunk_embeddings)} chunks trong {end_time - start_time:.2f} giay.")
+
+            print("\n--- DEBUG TEST: Thong tin embeddings sau khi tao ---")
+            print(f"So luong embeddings tao ra: {len(chunk_embeddings)}")
+            if chunk_embeddings:
+                print(f"Kieu cua phan tu dau tien trong embeddings: {type(chunk_embeddings[0])}")
+                if hasattr(chunk_embeddings[0], '__len__'):
+                    print(f"Kich thuoc (dimension) cua embedding dau tien: {len(chunk_embeddings[0])}")
+                else:
+                    print("WARNING: Phan tu dau tien cua embeddings khong co thuoc tinh __len__.")
+                print(f"Mot phan gia tri cua embedding dau tien: {chunk_embeddings[0][:10]}...")
+            else:
+                print("WARNING: Danh sach embeddings rong.")
+            print("--- KET THUC DEBUG SAU EMBEDDING ---")
 
-        chunk_metadatas = [chunk.metadata for chunk in chunks]
+            print(f"\nDang them {len(chunks)} chunks va embeddings vao collection '{collection_name}'...")
+            start_time = time.time()
 
-        print(
-            f"Kiem tra chunk_texts: {len(chunk_texts)} items. Kieu item dau tien: {type(chunk_texts[0]) if chunk_texts else 'None'}")
-        if chunk_texts:
-            print(f"Noi dung 500 ky tu dau cua chunk_texts[0]: {chunk_texts[0][:500]}...")
-        print("--- END DEBUG TRUOC EMBEDDING ---")
+            # upsert: chay lai sau mot lan ingest bi gian doan khong bi loi trung id
+            collection.upsert(
+                embeddings=chunk_embeddings,
+                documents=chunk_texts,
+                metadatas=chunk_metadatas,
+                ids=chunk_ids
+            )
+            end_time = time.time()
+            print(f"Da them {len(chunks)} items vao collection trong {end_time - start_time:.2f} giay.")
 
-        start_time = time.time()
-        chunk_embeddings = embeddings.embed_documents(chunk_texts)
-        end_time = time.time()
-        print(f"Da tao embeddings cho {len(chunk_embeddings)} chunks trong {end_time - start_time:.2f} giay.")
-
-        print("\n--- DEBUG TEST: Thong tin embeddings sau khi tao ---")
-        print(f"So luong embeddings tao ra: {len(chunk_embeddings)}")
-        if chunk_embeddings:
-            print(f"Kieu cua phan tu dau tien trong embeddings: {type(chunk_embeddings[0])}")
-            if hasattr(chunk_embeddings[0], '__len__'):
-                print(f"Kich thuoc (dimension) cua embedding dau tien: {len(chunk_embeddings[0])}")
-            else:
-                print("WARNING: Phan tu dau tien cua embeddings khong co thuoc tinh __len__.")
-            print(f"Mot phan gia tri cua embedding dau tien: {chunk_embeddings[0][:10]}...")
-        else:
-            print("WARNING: Danh sach embeddings rong.")
-        print("--- KET THUC DEBUG SAU EMBEDDING ---")
+        print(f"So luong items trong collection sau khi cap nhat: {collection.count()}")
 
-        print(f"\nDang them {len(chunks)} chunks va embeddings vao collection '{collection_name}'...")
-        start_time = time.time()
+        if Config.BM25_ENABLED:
+            rebuild_bm25_index(collection, snapshot_paths["bm25"])
 
-        collection.add(
-            embeddings=chunk_embeddings,
-            documents=chunk_texts,
-            metadatas=chunk_metadatas,
-            ids=chunk_ids
-        )
-        end_time = time.time()
-        print(f"Da them {len(chunks)} items vao collection trong {end_time - start_time:.2f} giay.")
+        # Luon xay NumPy index de doi VECTOR_BACKEND luc chay web khong can ingest lai
+        rebuild_numpy_vector_index(collection, snapshot_paths["numpy"])
+
+        if manifest is not None:
+            save_manifest(manifest, snapshot_paths["manifest"])
+
+        # Cong bo nguyen tu: worker web chuyen sang snapshot moi, cache phia web tu vo hieu hoa
+        publish_snapshot(snapshot_version, collection_name)
 
         print("manually_store_chunks_in_vector_db hoan tat, tra ve Collection.")
         return collection
@@ -213,7 +424,201 @@ def manually_store_chunks_in_vector_db(chunks: list[Document], embeddings) -> Co
         return None
 
 
-def process_document_pipeline():
+def rebuild_bm25_index(collection: Collection, index_directory: str):
+    """
+    Xay lai chi muc BM25 tren toan bo collection (cung chunk id voi Chroma) va luu vao index_directory.
+    Loi o buoc nay khong lam hong Vector DB; web chi quay ve tim kiem vector.
+    """
+    print(f"\n--- Dang xay BM25 index cho collection '{collection.name}' ---")
+    try:
+        start_time = time.time()
+        stored = collection.get(include=['documents', 'metadatas'])
+        bm25_index = BM25Index.build(stored['ids'], stored['documents'], stored['metadatas'])
+        bm25_index.save(index_directory)
+        print(f"Da xay BM25 index trong {time.time() - start_time:.2f} giay.")
+    except Exception as e:
+        print(f"ERROR: Loi khi xay BM25 index: {e}")
+
+
+def rebuild_numpy_vector_index(collection: Collection, index_directory: str):
+    """
+    Xuat toan bo embedding cua collection thanh ma tran .npy (index_directory) cho backend 'numpy'
+    (xay cho moi snapshot, ke ca khi VECTOR_BACKEND hien tai la 'chroma').
+    Loi o buoc nay khong lam hong Vector DB; web quay ve truy van Chroma.
+    """
+    print(f"\n--- Dang xay NumPy vector index cho collection '{collection.name}' ---")
+    try:
+        start_time = time.time()
+        NumpyVectorIndex.from_collection(collection, Config.NUMPY_INDEX_DTYPE).save(index_directory)
+        print(f"Da xay NumPy vector index trong {time.time() - start_time:.2f} giay.")
+    except Exception as e:
+        print(f"ERROR: Loi khi xay NumPy vector index: {e}")
+
+
+def load_and_split_file(data_dir: str, file_name: str, use_cache: bool = True) -> list[Document]:
+    """
+    Tai mot file (PDF bang OCR, dinh dang khac bang docling) va chia chunk theo chien luoc cua dinh dang.
+    Voi use_cache, ket qua docling/OCR duoc lay tu (va ghi vao) cache chuyen doi theo hash noi dung.
+    Tra ve list rong neu tai hoac chia chunk that bai.
+    """
+    file_path = os.path.join(data_dir, file_name)
+    file_extension = os.path.splitext(file_name)[1].lower()
+    print(f"\n--- Dang xu ly file: {file_name} ---")
+
+    documents = []
+    if file_extension == '.pdf':
+        documents = load_and_process_pdf_with_pytesseract(file_path, use_cache)
+    else:
+
+        try:
+            cache_key = docling_cache_key(compute_file_hash(file_path), file_extension) if use_cache else None
+            cached_documents = get_cached(DOCLING_NAMESPACE, cache_key) if use_cache else None
+            if cached_documents is not None:
+                print(f"Lay ket qua docling cua '{file_name}' tu cache.")
+                documents = [Document(page_content=d["page_content"], metadata=d["metadata"])
+                             for d in cached_documents]
+            else:
+                loader_factory = get_document_loader_factory(file_path)
+                document_loader = loader_factory.create_loader(file_path)
+                print(f"Dang tai tai lieu tu: {file_path} bang docling...")
+                documents = document_loader.load()
+
+                if not documents:
+                    print(f"ERROR: Khong the tai tai lieu '{file_name}' hoac tai lieu rong sau khi load bang docling.")
+                    return []
+                if cache_key:
+                    put_cached(DOCLING_NAMESPACE, cache_key,
+                               [{"page_content": d.page_content, "metadata": d.metadata} for d in documents])
+
+            print(
+                f"Da tai tai lieu '{file_name}' thanh cong. Tong so ky tu: {sum(len(doc.page_content) for doc in documents)}")
+
+        except Exception as e:
+            print(f"ERROR: Loi khi tai tai lieu '{file_name}' bang docling: {e}")
+            return []
+
+    if not documents:
+        print(f"ERROR: Khong co tai lieu nao duoc tai tu file '{file_name}'. Khong the chia chunk.")
+        return []
+
+    print(f"--- DEBUG TEST: Dang chia chunk cho file: {file_name} ---")
+    chunk_size = Config.CHUNK_SIZE
+    chunk_overlap = Config.CHUNK_OVERLAP
+
+    text_splitter_strategy = None
+    if file_extension in ['.txt', '.docx']:
+        text_splitter_strategy = UnstructuredTextSplitterStrategy()
+    elif file_extension == '.pdf':
+        text_splitter_strategy = StructuredTextSplitterStrategy()
+    else:
+        print(
+            f"WARNING: Khong co chien luoc chia van ban cu the cho dinh dang '{file_extension}'. Su dung chien luoc khong co cau truc.")
+        text_splitter_strategy = UnstructuredTextSplitterStrategy()
+
+    text_splitter_context = TextSplitterContext(text_splitter_strategy)
+
+    full_document_content = "\n\n".join([doc.page_content for doc in documents])
+
+    current_file_chunks = text_splitter_context.split_document_text(
+        full_document_content,
+        chunk_size,
+        chunk_overlap
+    )
+
+    for chunk in current_file_chunks:
+        chunk.metadata["source_file"] = file_name
+        chunk.metadata["original_type"] = file_extension
+
+        if file_extension == '.pdf' and documents:
+
+            if "page_number" in documents[0].metadata:
+                chunk.metadata["page_number"] = documents[0].metadata["page_number"]
+
+    if current_file_chunks is None or not current_file_chunks:
+        print(f"WARNING: Chia chunk cho file '{file_name}' hoan tat nhung khong tao ra chunk nào.")
+        return []
+
+    if current_file_chunks:
+        print(f"\n--- DEBUG TEST: NOI DUNG CUA MOT VAI CHUNK TU FILE {file_name} ---")
+        if hasattr(current_file_chunks[0], 'page_content'):
+            print(f"--- Chunk dau tien (do dai: {len(current_file_chunks[0].page_content)}) ---")
+            print(f"Noi dung (500 ky tu dau): {current_file_chunks[0].page_content[:500]}...")
+            print(f"Metadata: {current_file_chunks[0].metadata}")
+            print("---------------------")
+
+        if len(current_file_chunks) > 1:
+            if hasattr(current_file_chunks[-1], 'page_content'):
+                print(f"--- Chunk cuoi cung (do dai: {len(current_file_chunks[-1].page_content)}) ---")
+                print(f"Noi dung (500 ky tu dau): {current_file_chunks[-1].page_content[:500]}...")
+                print(f"Metadata: {current_file_chunks[-1].metadata}")
+                print("---------------------")
+
+        if len(current_file_chunks) > 3:
+            print("--- Noi dung 3 chunk ngau nhien ---")
+            random_chunks = random.sample(current_file_chunks, min(len(current_file_chunks), 3))
+            for i, chunk in enumerate(random_chunks):
+                if hasattr(chunk, 'page_content'):
+                    print(f"--- Chunk ngau nhien {i + 1} (do dai: {len(chunk.page_content)}) ---")
+                    print(f"Noi dung (500 ky tu dau): {chunk.page_content[:500]}...")
+                    print(f"Metadata: {chunk.metadata}")
+                    print("---------------------")
+
+        print(f"--- KET THUC DEBUG CHUNKING CHO FILE {file_name} ---")
+
+    return current_file_chunks
+
+
+def _load_and_split_file_worker(data_dir: str, file_name: str, use_cache: bool = True) -> tuple:
+    """Chay trong process con: tra ve (chunks, thoi gian xu ly); loi duoc gioi han trong file nay"""
+    start_time = time.time()
+    return load_and_split_file(data_dir, file_name, use_cache), time.time() - start_time
+
+
+def load_and_split_files(data_dir: str, file_names: list[str], max_workers: int = None,
+                         use_cache: bool = True) -> dict:
+    """
+    Tai va chia chunk nhieu file song song tren process pool (Config.INGESTION_WORKERS process).
+    Loi cua mot file (ke ca process con bi sap) chi lam file do that bai (list rong).
+    Tra ve dict file_name -> chunks; caller duyet theo thu tu file_names nen ket qua khong phu thuoc thu tu hoan thanh.
+    """
+    max_workers = max(1, min(max_workers or Config.INGESTION_WORKERS, len(file_names)))
+    results = {}
+    if max_workers == 1:
+        for done, file_name in enumerate(file_names, start=1):
+            try:
+                chunks, elapsed = _load_and_split_file_worker(data_dir, file_name, use_cache)
+                print(f"[{done}/{len(file_names)}] Da xu ly '{file_name}': {len(chunks)} chunk trong {elapsed:.2f} giay.")
+            except Exception as e:
+                chunks = []
+                print(f"[{done}/{len(file_names)}] ERROR: Loi khi xu ly '{file_name}': {e}")
+            results[file_name] = chunks
+        return results
+
+    print(f"Dang chuyen doi {len(file_names)} file tren {max_workers} process...")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_load_and_split_file_worker, data_dir, file_name, use_cache): file_name
+                   for file_name in file_names}
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_name = futures[future]
+            try:
+                chunks, elapsed = future.result()
+                print(f"[{done}/{len(file_names)}] Da xu ly '{file_name}': {len(chunks)} chunk trong {elapsed:.2f} giay.")
+            except Exception as e:
+                chunks = []
+                print(f"[{done}/{len(file_names)}] ERROR: Loi khi xu ly '{file_name}' trong process con: {e}")
+            results[file_name] = chunks
+    return results
+
+
+def process_document_pipeline(data_dir: str = None, collection_name: str = None, full_rebuild: bool = False,
+                              use_cache: bool = None):
+    """
+    Xu ly cac file trong data_dir (mac dinh Config.DATA_DIRECTORY) va cap nhat collection_name
+    (mac dinh Config.DEFAULT_COLLECTION_NAME). Moi collection duoc build lai doc lap.
+    Ingest tang dan theo manifest cua snapshot hien tai: chi file moi/thay doi duoc load, chia chunk va embed,
+    chunk cua file da xoa bi loai bo. full_rebuild=True bo qua manifest va build lai toan bo.
+    use_cache (mac dinh Config.CONVERSION_CACHE_ENABLED) dung cache chuyen doi docling/OCR theo hash noi dung.
+    """
     print("\n--- Bat dau pipeline xu ly tai lieu ---")
 
     print("Dang kiem tra cac cau hinh can thiet...")
@@ -238,127 +643,90 @@ def process_document_pipeline():
 
     all_processed_chunks = []
 
-    data_dir = Config.DATA_DIRECTORY
+    data_dir = data_dir or Config.DATA_DIRECTORY
     if not os.path.exists(data_dir):
         print(f"ERROR: Thu muc du lieu '{data_dir}' khong ton tai.")
         print("Pipeline xu ly tai lieu ket thuc som.")
         return
 
-    files_to_process = [f for f in os.listdir(data_dir) if os.path.isfile(os.path.join(data_dir, f))]
+    files_to_process = sorted(f for f in os.listdir(data_dir) if os.path.isfile(os.path.join(data_dir, f)))
+
+    collection_name = collection_name or Config.DEFAULT_COLLECTION_NAME
+    previous_paths = get_index_paths(collection_name=collection_name)
+    previous_manifest = None if full_rebuild else load_manifest(previous_paths["manifest"])
+    incremental = is_manifest_compatible(previous_manifest) and os.path.isdir(previous_paths["chroma"] or "")
+    if previous_manifest is not None and not incremental:
+        print("Manifest cu khong dung duoc (doi model embedding / tham so chunk / HNSW / trich xuat). "
+              "Build lai toan bo.")
 
     if not files_to_process:
         print(f"WARNING: Khong tim thay file nao de xu ly trong thu muc '{data_dir}'.")
-        print("Pipeline xu ly tai lieu ket thuc som.")
+        if not incremental:
+            print("Pipeline xu ly tai lieu ket thuc som.")
+            return
+        # Van chay ke hoach ingest: chunk cua cac file da bi xoa phai duoc loai khoi snapshot moi
+
+    file_hashes = {file_name: compute_file_hash(os.path.join(data_dir, file_name)) for file_name in files_to_process}
+    changed_files, deleted_files = plan_ingestion(previous_manifest if incremental else None, file_hashes)
+    print(f"Ke hoach ingest ({'tang dan' if incremental else 'toan bo'}): {len(changed_files)} file moi/thay doi, "
+          f"{len(deleted_files)} file da xoa, {len(files_to_process) - len(changed_files)} file khong doi.")
+
+    if incremental and not changed_files and not deleted_files:
+        print("Khong co file nao thay doi. Giu nguyen snapshot hien tai.")
+        print("\n--- Pipeline xu ly tai lieu hoan tat thanh cong ---")
         return
 
-    for file_name in files_to_process:
-        file_path = os.path.join(data_dir, file_name)
-        file_extension = os.path.splitext(file_name)[1].lower()
-        print(f"\n--- Dang xu ly file: {file_name} ---")
-
-        documents = []
-        if file_extension == '.pdf':
-            documents = load_and_process_pdf_with_pytesseract(file_path)
-        else:
-
-            try:
-                loader_factory = get_document_loader_factory(file_path)
-                document_loader = loader_factory.create_loader(file_path)
-                print(f"Dang tai tai lieu tu: {file_path} bang docling...")
-                documents = document_loader.load()
-
-                if not documents:
-                    print(f"ERROR: Khong the tai tai lieu '{file_name}' hoac tai lieu rong sau khi load bang docling.")
-                    continue
-
-                print(
-                    f"Da tai tai lieu '{file_name}' thanh cong. Tong so ky tu: {sum(len(doc.page_content) for doc in documents)}")
-
-            except Exception as e:
-                print(f"ERROR: Loi khi tai tai lieu '{file_name}' bang docling: {e}")
-                continue
-
-        if not documents:
-            print(f"ERROR: Khong co tai lieu nao duoc tai tu file '{file_name}'. Khong the chia chunk.")
+    manifest = new_manifest()
+    stale_chunk_ids = []
+    if incremental:
+        # File khong doi (va file thay doi nhung xu ly loi) giu nguyen chunk cu
+        manifest["files"] = {name: entry for name, entry in previous_manifest["files"].items() if name in file_hashes}
+        for file_name in deleted_files:
+            stale_chunk_ids.extend(previous_manifest["files"][file_name]["chunk_ids"])
+
+    use_cache = Config.CONVERSION_CACHE_ENABLED if use_cache is None else use_cache
+    chunks_by_file = load_and_split_files(data_dir, changed_files, use_cache=use_cache)
+    if use_cache:
+        enforce_cache_size_limit()
+    failed_files = [file_name for file_name in changed_files if not chunks_by_file.get(file_name)]
+    if failed_files:
+        print(f"WARNING: {len(failed_files)} file xu ly that bai (giu chunk cu neu co): {failed_files}")
+
+    # Duyet theo thu tu file da sap xep: chunk va manifest giong nhau giua cac lan chay
+    for file_name in changed_files:
+        current_file_chunks = chunks_by_file.get(file_name)
+        if not current_file_chunks:
             continue
 
-        print(f"--- DEBUG TEST: Dang chia chunk cho file: {file_name} ---")
-        chunk_size = Config.CHUNK_SIZE
-        chunk_overlap = Config.CHUNK_OVERLAP
-
-        text_splitter_strategy = None
-        if file_extension in ['.txt', '.docx']:
-            text_splitter_strategy = UnstructuredTextSplitterStrategy()
-        elif file_extension == '.pdf':
-            text_splitter_strategy = StructuredTextSplitterStrategy()
-        else:
-            print(
-                f"WARNING: Khong co chien luoc chia van ban cu the cho dinh dang '{file_extension}'. Su dung chien luoc khong co cau truc.")
-            text_splitter_strategy = UnstructuredTextSplitterStrategy()
-
-        text_splitter_context = TextSplitterContext(text_splitter_strategy)
-
-        full_document_content = "\n\n".join([doc.page_content for doc in documents])
-
-        current_file_chunks = text_splitter_context.split_document_text(
-            full_document_content,
-            chunk_size,
-            chunk_overlap
-        )
-
-        for chunk in current_file_chunks:
-            chunk.metadata["source_file"] = file_name
-            chunk.metadata["original_type"] = file_extension
-
-            if file_extension == '.pdf' and documents:
-
-                if "page_number" in documents[0].metadata:
-                    chunk.metadata["page_number"] = documents[0].metadata["page_number"]
-
-        if current_file_chunks is None or not current_file_chunks:
-            print(f"WARNING: Chia chunk cho file '{file_name}' hoan tat nhung khong tao ra chunk nào.")
-            continue
+        for chunk_index, chunk in enumerate(current_file_chunks):
+            chunk.metadata["file_hash"] = file_hashes[file_name]
+            chunk.metadata["chunk_index"] = chunk_index
 
+        if file_name in manifest["files"]:
+            stale_chunk_ids.extend(manifest["files"][file_name]["chunk_ids"])
+        manifest["files"][file_name] = {
+            "hash": file_hashes[file_name],
+            "chunk_ids": [make_chunk_id(chunk, i) for i, chunk in enumerate(current_file_chunks)],
+        }
         all_processed_chunks.extend(current_file_chunks)
 
-        if current_file_chunks:
-            print(f"\n--- DEBUG TEST: NOI DUNG CUA MOT VAI CHUNK TU FILE {file_name} ---")
-            if hasattr(current_file_chunks[0], 'page_content'):
-                print(f"--- Chunk dau tien (do dai: {len(current_file_chunks[0].page_content)}) ---")
-                print(f"Noi dung (500 ky tu dau): {current_file_chunks[0].page_content[:500]}...")
-                print(f"Metadata: {current_file_chunks[0].metadata}")
-                print("---------------------")
-
-            if len(current_file_chunks) > 1:
-                if hasattr(current_file_chunks[-1], 'page_content'):
-                    print(f"--- Chunk cuoi cung (do dai: {len(current_file_chunks[-1].page_content)}) ---")
-                    print(f"Noi dung (500 ky tu dau): {current_file_chunks[-1].page_content[:500]}...")
-                    print(f"Metadata: {current_file_chunks[-1].metadata}")
-                    print("---------------------")
-
-            if len(current_file_chunks) > 3:
-                print("--- Noi dung 3 chunk ngau nhien ---")
-                random_chunks = random.sample(current_file_chunks, min(len(current_file_chunks), 3))
-                for i, chunk in enumerate(random_chunks):
-                    if hasattr(chunk, 'page_content'):
-                        print(f"--- Chunk ngau nhien {i + 1} (do dai: {len(chunk.page_content)}) ---")
-                        print(f"Noi dung (500 ky tu dau): {chunk.page_content[:500]}...")
-                        print(f"Metadata: {chunk.metadata}")
-                        print("---------------------")
-
-            print(f"--- KET THUC DEBUG CHUNKING CHO FILE {file_name} ---")
-
-    if not all_processed_chunks:
+    if not all_processed_chunks and not stale_chunk_ids:
         print("ERROR: Khong co chunk nao duoc tao tu tat ca cac file da xu ly.")
         print("Pipeline xu ly tai lieu ket thuc som.")
         return
 
-    embeddings = get_embedding_model()
-    if embeddings is None:
+    # Chi xoa chunk (khong co file moi) thi khong can tai model embedding
+    embeddings = get_embedding_model() if all_processed_chunks else None
+    if all_processed_chunks and embeddings is None:
         print("Pipeline xu ly tai lieu ket thuc som do lay/khoi tao Embedding Model that bai.")
         return
 
-    vectorstore_collection = manually_store_chunks_in_vector_db(all_processed_chunks, embeddings)
+    vectorstore_collection = manually_store_chunks_in_vector_db(
+        all_processed_chunks, embeddings, collection_name,
+        base_snapshot_paths=previous_paths if incremental else None,
+        stale_chunk_ids=stale_chunk_ids,
+        manifest=manifest
+    )
     if vectorstore_collection is None:
         print("Pipeline xu ly tai lieu ket thuc som do luu tru vao Vector DB that bai.")
         return
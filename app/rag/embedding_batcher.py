@@ -0,0 +1,306 @@
+# app/rag/embedding_batcher.py
+
+"""
+Gom nhóm (micro-batching) các yêu cầu embed đồng thời.
+- MicroBatchingEmbeddings: các thread gọi embed_query cùng lúc được gom trong vài mili giây
+  và chạy một forward pass cho cả lô thay vì nhiều lô một câu.
+- serve_embeddings / RemoteEmbeddings: chạy batcher trong một process riêng, nhiều Flask worker
+  dùng chung qua socket local (multiprocessing.connection), mỗi worker không cần tải model.
+"""
+
+import ipaddress
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from typing import Callable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import Config
+from app.rag.document_processor import get_embedding_model
+
+MAX_SERVER_RETRY_SECONDS = 60.0
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = None, max_wait_ms: float = None):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size if max_batch_size is not None else Config.EMBEDDING_BATCH_MAX_SIZE
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else Config.EMBEDDING_BATCH_MAX_WAIT_MS
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._batches = 0
+        self._texts = 0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            requests = [self._queue.get()]
+            text_count = len(requests[0][0])
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+
+            # Gom thêm yêu cầu đến khi đủ lô hoặc hết thời gian chờ
+            while text_count < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                text_count += len(request[0])
+
+            all_texts = [text for texts, _ in requests for text in texts]
+            try:
+                vectors = self.embeddings.embed_documents(all_texts)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            self._batches += 1
+            self._texts += len(all_texts)
+            offset = 0
+            for texts, future in requests:
+                future.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+    def embed_batched(self, texts: List[str]) -> List[List[float]]:
+        """Gửi một nhóm câu vào lô chung và chờ kết quả"""
+        if not texts:
+            return []
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Lô lớn (pipeline xử lý tài liệu) không cần gom, gọi thẳng model
+        if len(texts) >= self.max_batch_size:
+            return self.embeddings.embed_documents(texts)
+        return self.embed_batched(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        # normalize_embeddings=True nên embed theo lô cho kết quả giống embed_query
+        return self.embed_batched([text])[0]
+
+    def get_stats(self) -> dict:
+        return {
+            "mode": "in-process",
+            "batches": self._batches,
+            "texts": self._texts,
+            "avg_batch_size": round(self._texts / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+        }
+
+
+def _parse_address(address: str) -> tuple:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def _is_loopback_host(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def _server_settings(address: str = None, authkey: str = None) -> tuple:
+    """
+    Kiểm tra cấu hình embedding server, trả về ((host, port), authkey bytes).
+    Kết nối trao đổi dữ liệu pickle nên bắt buộc có authkey bí mật và chỉ dùng loopback,
+    trừ khi Config.EMBEDDING_SERVER_ALLOW_REMOTE; cấu hình không hợp lệ raise ValueError.
+    """
+    address = address or Config.EMBEDDING_SERVER_ADDRESS
+    authkey = authkey or Config.EMBEDDING_SERVER_AUTHKEY
+    if not address:
+        raise ValueError("EMBEDDING_SERVER_ADDRESS chua duoc thiet lap (vi du 127.0.0.1:6390).")
+    if not authkey:
+        raise ValueError("EMBEDDING_SERVER_AUTHKEY chua duoc thiet lap (dat mot chuoi bi mat).")
+    host, port = _parse_address(address)
+    if not _is_loopback_host(host) and not Config.EMBEDDING_SERVER_ALLOW_REMOTE:
+        raise ValueError(f"Embedding server '{host}' khong phai loopback. "
+                         f"Dat EMBEDDING_SERVER_ALLOW_REMOTE=true neu that su can mo ra mang.")
+    return (host, port), authkey.encode("utf-8")
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Client của embedding server; mỗi thread giữ một kết nối riêng.
+    Có fallback_factory: khi server lỗi, embed bằng model trong process (tạo lười ở lần lỗi đầu tiên)
+    và chỉ thử lại server sau Config.EMBEDDING_SERVER_RETRY_SECONDS, gấp đôi sau mỗi lần lỗi liên tiếp.
+    """
+
+    def __init__(self, address: str = None, authkey: str = None,
+                 fallback_factory: Optional[Callable[[], Optional[Embeddings]]] = None):
+        self.address, self.authkey = _server_settings(address, authkey)
+        self._local = threading.local()
+        self._requests = 0
+        self._fallback_factory = fallback_factory
+        self._fallback = None
+        self._fallback_loaded = False
+        self._fallback_lock = threading.Lock()
+        self._fallback_requests = 0
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = Client(self.address, authkey=self.authkey)
+            self._local.connection = connection
+        return connection
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.send(("embed", list(texts)))
+                status, payload = connection.recv()
+                break
+            except (EOFError, OSError):
+                # Server khởi động lại: mở lại kết nối một lần
+                self._local.connection = None
+                if attempt == 1:
+                    raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding server loi: {payload}")
+        self._requests += 1
+        return payload
+
+    def _get_fallback(self) -> Optional[Embeddings]:
+        if not self._fallback_loaded:
+            with self._fallback_lock:
+                if not self._fallback_loaded:
+                    self._fallback = self._fallback_factory()
+                    self._fallback_loaded = True
+        return self._fallback
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if self._fallback_factory is None:
+            return self._request(texts)
+
+        if time.monotonic() >= self._retry_at:
+            try:
+                vectors = self._request(texts)
+                if self._failures:
+                    print("Embedding server da phan hoi lai, ngung dung model trong process.")
+                    self._failures = 0
+                return vectors
+            except Exception as e:
+                self._failures += 1
+                backoff = min(Config.EMBEDDING_SERVER_RETRY_SECONDS * 2 ** (self._failures - 1),
+                              MAX_SERVER_RETRY_SECONDS)
+                self._retry_at = time.monotonic() + backoff
+                print(f"WARNING: Embedding server loi: {e}. Dung model trong process, "
+                      f"thu lai server sau {backoff:.0f} giay.")
+
+        fallback = self._get_fallback()
+        if fallback is None:
+            raise RuntimeError("Embedding server khong kha dung va khong tai duoc model trong process.")
+        self._fallback_requests += 1
+        return fallback.embed_documents(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts) if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def get_stats(self) -> dict:
+        return {
+            "mode": "remote",
+            "address": f"{self.address[0]}:{self.address[1]}",
+            "requests": self._requests,
+            "fallback_requests": self._fallback_requests,
+            "consecutive_failures": self._failures,
+            "server_available": time.monotonic() >= self._retry_at,
+        }
+
+
+def _handle_connection(connection, batcher: MicroBatchingEmbeddings):
+    with connection:
+        while True:
+            try:
+                command, texts = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if command != "embed":
+                    raise ValueError(f"Lenh khong hop le: {command}")
+                connection.send(("ok", batcher.embed_batched(texts)))
+            except Exception as e:
+                connection.send(("error", str(e)))
+
+
+def serve_embeddings(address: str = None, authkey: str = None):
+    """Chạy embedding server: tải model một lần, gom lô yêu cầu từ mọi worker kết nối tới"""
+    try:
+        server_address, authkey = _server_settings(address, authkey)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return
+
+    embeddings = get_embedding_model()
+    if embeddings is None:
+        print("ERROR: Khong the khoi tao Embedding Model cho embedding server.")
+        return
+
+    batcher = MicroBatchingEmbeddings(embeddings)
+    with Listener(server_address, authkey=authkey) as listener:
+        print(f"Embedding server dang lang nghe tai {server_address[0]}:{server_address[1]} "
+              f"(lo toi da {batcher.max_batch_size}, cho {batcher.max_wait_ms} ms).")
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                print(f"WARNING: Loi khi chap nhan ket noi embedding: {e}")
+                continue
+            threading.Thread(target=_handle_connection, args=(connection, batcher), daemon=True).start()
+
+
+_query_embedder = None
+_query_embedder_lock = threading.Lock()
+
+
+def _build_local_embedder() -> Optional[Embeddings]:
+    """Model trong process (get_embedding_model), bọc MicroBatchingEmbeddings nếu bật gom lô"""
+    embeddings = get_embedding_model()
+    if embeddings is None:
+        return None
+    if Config.EMBEDDING_BATCHING_ENABLED:
+        print("Bat micro-batching cho embedding truy van.")
+        embeddings = MicroBatchingEmbeddings(embeddings)
+    return embeddings
+
+
+def get_query_embedder():
+    """
+    Embedding dùng cho truy vấn phía web (retriever, semantic cache), dùng chung trong process:
+    RemoteEmbeddings nếu có EMBEDDING_SERVER_ADDRESS (server lỗi lúc gọi thì tạm dùng model trong process),
+    ngược lại là model từ get_embedding_model(), bọc MicroBatchingEmbeddings nếu bật gom lô.
+    """
+    global _query_embedder
+    if _query_embedder is not None:
+        return _query_embedder
+
+    with _query_embedder_lock:
+        if _query_embedder is not None:
+            return _query_embedder
+
+        if Config.EMBEDDING_SERVER_ADDRESS:
+            try:
+                _query_embedder = RemoteEmbeddings(fallback_factory=_build_local_embedder)
+                print(f"Su dung embedding server tai {Config.EMBEDDING_SERVER_ADDRESS}.")
+                return _query_embedder
+            except ValueError as e:
+                print(f"ERROR: Cau hinh embedding server khong hop le: {e} Dung model trong process.")
+
+        _query_embedder = _build_local_embedder()
+        return _query_embedder
@@ -0,0 +1,68 @@
+# app/rag/embedding_parity.py
+
+"""
+Kiểm tra độ lệch của một backend embedding so với vector fp32 đã lưu trong collection.
+Embed lại một mẫu chunk bằng backend cần kiểm tra, so cosine với vector đã lưu
+và đo độ trễ embed truy vấn (một câu) cùng RSS của process.
+"""
+
+import time
+
+import chromadb
+import numpy as np
+
+from app.core.config import Config
+from app.rag.embedding_registry import EmbeddingModelRegistry, get_process_rss_mb
+from app.rag.index_version import get_index_paths
+
+
+def check_embedding_parity(backend: str, sample_size: int = 200,
+                           collection_name: str = Config.DEFAULT_COLLECTION_NAME) -> dict:
+    """
+    Trả về thống kê cosine (mean, min, p5) và độ lệch (1 - cosine) giữa vector của backend và vector đã lưu,
+    độ trễ embed truy vấn p50/p99 (ms) và RSS của process.
+    """
+    print(f"\n--- Kiem tra do lech embedding: backend '{backend}', collection '{collection_name}', "
+          f"mau {sample_size} chunk ---")
+    chroma_path = get_index_paths(collection_name=collection_name)["chroma"]
+    if not chroma_path:
+        print(f"ERROR: Collection '{collection_name}' chua co snapshot nao duoc cong bo.")
+        return {}
+    client = chromadb.PersistentClient(path=chroma_path)
+    collection = client.get_collection(name=collection_name)
+    stored = collection.get(limit=sample_size, include=['documents', 'embeddings'])
+
+    texts = stored['documents']
+    if not texts:
+        print("WARNING: Collection rong, khong co vector de so sanh.")
+        return {}
+
+    stored_vectors = np.asarray(stored['embeddings'], dtype=np.float32)
+    stored_vectors /= np.linalg.norm(stored_vectors, axis=1, keepdims=True)
+
+    embeddings = EmbeddingModelRegistry.get(Config.SENTENCE_TRANSFORMER_MODEL_NAME, backend)
+    candidate_vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    candidate_vectors /= np.linalg.norm(candidate_vectors, axis=1, keepdims=True)
+
+    cosines = np.sum(stored_vectors * candidate_vectors, axis=1)
+
+    latencies_ms = []
+    for text in texts[:50]:
+        start_time = time.perf_counter()
+        embeddings.embed_query(text[:200])
+        latencies_ms.append((time.perf_counter() - start_time) * 1000)
+
+    report = {
+        "backend": backend,
+        "samples": len(texts),
+        "cosine_mean": round(float(np.mean(cosines)), 6),
+        "cosine_min": round(float(np.min(cosines)), 6),
+        "cosine_p5": round(float(np.percentile(cosines, 5)), 6),
+        "max_drift": round(float(1.0 - np.min(cosines)), 6),
+        "query_latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "query_latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "process_rss_mb": get_process_rss_mb(),
+    }
+    for name, value in report.items():
+        print(f"{name}: {value}")
+    return report
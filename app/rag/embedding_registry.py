@@ -0,0 +1,141 @@
+# app/rag/embedding_registry.py
+
+"""
+Registry dùng chung cho Embedding Model trong một process.
+Mỗi model (theo tên) chỉ được tải một lần; VectorStoreManager, Advanced RAG, Basic RAG và semantic cache
+dùng chung cùng một instance. get_stats() báo cáo bộ nhớ của tham số model và RSS của process.
+Backend chọn từ Config.EMBEDDING_BACKEND: 'torch' (fp32), 'torch-int8' (quantize động các lớp Linear)
+hoặc 'onnx' (ONNX Runtime qua sentence-transformers, cần optimum[onnxruntime]).
+"""
+
+import importlib.util
+import os
+import threading
+import time
+
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from app.core.config import Config
+
+try:
+    import resource
+
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    # Windows không có module resource
+    RESOURCE_AVAILABLE = False
+
+# Backend 'onnx' cần optimum[onnxruntime] (dependency tùy chọn); chỉ kiểm tra có cài hay không, import lúc tạo model
+ONNX_BACKEND_AVAILABLE = all(importlib.util.find_spec(module) is not None for module in ("optimum", "onnxruntime"))
+
+BACKEND_TORCH = "torch"
+BACKEND_TORCH_INT8 = "torch-int8"
+BACKEND_ONNX = "onnx"
+EMBEDDING_BACKENDS = (BACKEND_TORCH, BACKEND_TORCH_INT8, BACKEND_ONNX)
+
+
+def get_process_rss_mb():
+    """RSS hiện tại của process (MB); dùng /proc trên Linux, ru_maxrss (đỉnh) nếu không có, None nếu không đo được"""
+    try:
+        with open(f"/proc/{os.getpid()}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if RESOURCE_AVAILABLE:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return None
+
+
+def _model_parameter_mb(embeddings) -> float | None:
+    """Dung lượng tham số của SentenceTransformer bên trong HuggingFaceEmbeddings (MB)"""
+    try:
+        client = getattr(embeddings, '_client', None) or getattr(embeddings, 'client', None)
+        total_bytes = sum(p.numel() * p.element_size() for p in client.parameters())
+        return round(total_bytes / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+
+def _create_embedding_model(model_name: str, backend: str):
+    """Tạo HuggingFaceEmbeddings (CPU, normalize_embeddings=True) theo backend"""
+    model_kwargs = {'device': 'cpu'}
+    if backend == BACKEND_ONNX:
+        if not ONNX_BACKEND_AVAILABLE:
+            raise ImportError("EMBEDDING_BACKEND='onnx' can optimum va onnxruntime. "
+                              "Cai dat: pip install -r requirements-onnx.txt hoac dung backend 'torch'.")
+        model_kwargs['backend'] = 'onnx'
+        if Config.EMBEDDING_ONNX_FILE_NAME:
+            # Ví dụ 'onnx/model_qint8_avx512_vnni.onnx' cho bản ONNX đã quantize int8
+            model_kwargs['model_kwargs'] = {'file_name': Config.EMBEDDING_ONNX_FILE_NAME}
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+    if backend == BACKEND_TORCH_INT8:
+        import torch
+
+        client = getattr(embeddings, '_client', None) or getattr(embeddings, 'client', None)
+        torch.quantization.quantize_dynamic(client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        print("Da quantize dong (int8) cac lop Linear cua Embedding Model.")
+
+    return embeddings
+
+
+class EmbeddingModelRegistry:
+    _models = {}
+    _model_info = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, model_name: str, backend: str = None):
+        """Trả về Embedding Model dùng chung cho (model_name, backend), tải lần đầu nếu chưa có"""
+        backend = (backend or Config.EMBEDDING_BACKEND).lower()
+        if backend not in EMBEDDING_BACKENDS:
+            print(f"WARNING: EMBEDDING_BACKEND '{backend}' khong hop le, dung '{BACKEND_TORCH}'.")
+            backend = BACKEND_TORCH
+        key = f"{model_name}[{backend}]"
+
+        embeddings = cls._models.get(key)
+        if embeddings is not None:
+            print(f"Su dung Embedding Model '{key}' da tai trong registry.")
+            return embeddings
+
+        with cls._lock:
+            embeddings = cls._models.get(key)
+            if embeddings is not None:
+                return embeddings
+
+            print(f"Dang khoi tao HuggingFaceEmbeddings voi model: '{model_name}' (backend: {backend})")
+            rss_before = get_process_rss_mb()
+            start_time = time.time()
+            embeddings = _create_embedding_model(model_name, backend)
+            rss_after = get_process_rss_mb()
+
+            cls._models[key] = embeddings
+            cls._model_info[key] = {
+                "load_seconds": round(time.time() - start_time, 2),
+                "parameter_mb": _model_parameter_mb(embeddings),
+                "rss_delta_mb": round(rss_after - rss_before, 1)
+                if rss_before is not None and rss_after is not None else None,
+            }
+            print(f"Da khoi tao HuggingFaceEmbeddings '{key}' thanh cong: {cls._model_info[key]}")
+            return embeddings
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._models.clear()
+            cls._model_info.clear()
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        return {
+            "pid": os.getpid(),
+            "process_rss_mb": get_process_rss_mb(),
+            "models": {name: dict(info) for name, info in cls._model_info.items()},
+        }
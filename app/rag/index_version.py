@@ -0,0 +1,131 @@
+# app/rag/index_version.py
+
+"""
+Phiên bản (snapshot) của chỉ mục tài liệu.
+Mỗi lần pipeline build lại, Chroma DB, BM25 và NumPy index được ghi vào thư mục snapshot mới
+Config.INDEX_SNAPSHOT_ROOT/<version>/ rồi được công bố nguyên tử bằng cách ghi đè file CURRENT (os.replace).
+Worker web đọc CURRENT để phát hiện phiên bản mới và chuyển sang mà không cần khởi động lại;
+truy vấn đang chạy vẫn dùng snapshot cũ. Khi chưa có snapshot nào, dùng chỉ mục cũ tại Config.VECTOR_DB_PATH,
+Config.BM25_INDEX_PATH và Config.NUMPY_INDEX_PATH.
+Mỗi collection có chuỗi snapshot riêng (build lại độc lập): collection mặc định dùng Config.INDEX_SNAPSHOT_ROOT,
+các collection khác dùng Config.INDEX_SNAPSHOT_ROOT/collections/<tên collection>/.
+"""
+
+import os
+import shutil
+import time
+from typing import Dict, Optional, Tuple
+
+from app.core.config import Config
+
+CURRENT_FILE_NAME = "CURRENT"
+LEGACY_INDEX_VERSION_FILE_NAME = "index_version.txt"
+SNAPSHOT_CHROMA_DIR = "chroma"
+SNAPSHOT_BM25_DIR = "bm25"
+SNAPSHOT_NUMPY_DIR = "numpy"
+SNAPSHOT_MANIFEST_FILE = "manifest.json"
+COLLECTIONS_DIR = "collections"
+
+
+def _is_default_collection(collection_name: Optional[str]) -> bool:
+    return not collection_name or collection_name == Config.DEFAULT_COLLECTION_NAME
+
+
+def _snapshot_root(collection_name: Optional[str] = None) -> str:
+    if _is_default_collection(collection_name):
+        return Config.INDEX_SNAPSHOT_ROOT
+    return os.path.join(Config.INDEX_SNAPSHOT_ROOT, COLLECTIONS_DIR, collection_name)
+
+
+def _current_file_path(collection_name: Optional[str] = None) -> str:
+    return os.path.join(_snapshot_root(collection_name), CURRENT_FILE_NAME)
+
+
+def _read_text(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _snapshot_paths(version: str, collection_name: Optional[str] = None) -> Dict[str, str]:
+    snapshot_dir = os.path.join(_snapshot_root(collection_name), version)
+    return {
+        "version": version,
+        "chroma": os.path.join(snapshot_dir, SNAPSHOT_CHROMA_DIR),
+        "bm25": os.path.join(snapshot_dir, SNAPSHOT_BM25_DIR),
+        "numpy": os.path.join(snapshot_dir, SNAPSHOT_NUMPY_DIR),
+        "manifest": os.path.join(snapshot_dir, SNAPSHOT_MANIFEST_FILE),
+    }
+
+
+def get_index_version(collection_name: Optional[str] = None) -> str:
+    """
+    Phiên bản snapshot đang được công bố của collection (mặc định: collection mặc định);
+    Vector DB cũ (chưa có snapshot, chỉ collection mặc định) trả về phiên bản cũ hoặc chuỗi rỗng
+    """
+    version = _read_text(_current_file_path(collection_name))
+    if version or not _is_default_collection(collection_name):
+        return version
+    return _read_text(os.path.join(Config.VECTOR_DB_PATH, LEGACY_INDEX_VERSION_FILE_NAME))
+
+
+def get_index_paths(version: Optional[str] = None, collection_name: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """
+    Đường dẫn Chroma DB, BM25 và NumPy index của một snapshot (mặc định: snapshot đang công bố).
+    Chỉ mục cũ (chưa có snapshot, chỉ collection mặc định) dùng đường dẫn cũ trong Config và không có manifest;
+    collection khác chưa có snapshot trả về toàn None.
+    """
+    version = get_index_version(collection_name) if version is None else version
+    if not version or not os.path.isfile(_current_file_path(collection_name)):
+        if not _is_default_collection(collection_name):
+            return {"version": version, "chroma": None, "bm25": None, "numpy": None, "manifest": None}
+        return {"version": version, "chroma": Config.VECTOR_DB_PATH, "bm25": Config.BM25_INDEX_PATH,
+                "numpy": Config.NUMPY_INDEX_PATH, "manifest": None}
+    return _snapshot_paths(version, collection_name)
+
+
+def create_snapshot(collection_name: Optional[str] = None) -> Tuple[str, Dict[str, str]]:
+    """Tạo thư mục cho snapshot mới (chưa công bố) của collection, trả về (version, các đường dẫn)"""
+    version = f"{time.time_ns()}"
+    snapshot_dir = os.path.join(_snapshot_root(collection_name), version)
+    os.makedirs(snapshot_dir)
+    print(f"Da tao snapshot moi: {snapshot_dir}")
+    return version, _snapshot_paths(version, collection_name)
+
+
+def publish_snapshot(version: str, collection_name: Optional[str] = None):
+    """Công bố snapshot (ghi file tạm rồi os.replace lên CURRENT) và dọn các snapshot cũ của collection"""
+    os.makedirs(_snapshot_root(collection_name), exist_ok=True)
+    current_file_path = _current_file_path(collection_name)
+    tmp_path = current_file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, current_file_path)
+    print(f"Da cong bo snapshot chi muc: {version} (collection '{collection_name or Config.DEFAULT_COLLECTION_NAME}')")
+    prune_snapshots(collection_name=collection_name)
+
+
+def prune_snapshots(keep: int = None, collection_name: Optional[str] = None):
+    """
+    Xóa các snapshot cũ hơn snapshot hiện tại, giữ lại `keep` snapshot mới nhất (tính cả snapshot hiện tại)
+    để worker chưa kịp chuyển phiên bản vẫn đọc được. Snapshot mới hơn (đang build) không bị động tới.
+    """
+    keep = max(1, keep if keep is not None else Config.INDEX_SNAPSHOTS_KEEP)
+    snapshot_root = _snapshot_root(collection_name)
+    current_version = _read_text(_current_file_path(collection_name))
+    if not current_version or not os.path.isdir(snapshot_root):
+        return
+
+    versions = sorted((name for name in os.listdir(snapshot_root)
+                       if name.isdigit() and os.path.isdir(os.path.join(snapshot_root, name))),
+                      key=int)
+    published = [v for v in versions if int(v) <= int(current_version)]
+    for version in published[:-keep]:
+        try:
+            shutil.rmtree(os.path.join(snapshot_root, version))
+            print(f"Da xoa snapshot cu: {version}")
+        except OSError as e:
+            # Windows không cho xóa file đang được worker khác mở; lần dọn sau sẽ thử lại
+            print(f"WARNING: Chua xoa duoc snapshot cu {version}: {e}")
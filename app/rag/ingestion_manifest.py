@@ -0,0 +1,101 @@
+# app/rag/ingestion_manifest.py
+
+"""
+Manifest của lần ingest gần nhất, lưu trong từng snapshot (manifest.json) cạnh Chroma/BM25.
+Với mỗi file nguồn ghi lại hash nội dung (SHA-256) và chunk id đã thêm vào collection,
+cùng model và backend embedding, tham số chia chunk, tham số HNSW và tham số trích xuất văn bản
+(OCR/text layer PDF) của cả lần build. Lần chạy sau chỉ load, chia chunk và embed file mới/đã thay đổi, xóa chunk của file
+đã bị xóa hoặc thay đổi. Đổi một trong các tham số trên làm manifest không còn dùng được (build lại toàn bộ):
+ingest tăng dần sao chép Chroma DB cũ (giữ nguyên HNSW) và giữ văn bản đã trích xuất của file không đổi.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import Config
+
+MANIFEST_FORMAT_VERSION = 3
+COMPATIBILITY_KEYS = ("format_version", "model_name", "embedding_backend", "chunk_size", "chunk_overlap", "hnsw",
+                      "extraction")
+HASH_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def compute_file_hash(file_path: str) -> str:
+    """SHA-256 của nội dung file (đọc theo khối)"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def new_manifest() -> dict:
+    return {
+        "format_version": MANIFEST_FORMAT_VERSION,
+        "model_name": Config.SENTENCE_TRANSFORMER_MODEL_NAME,
+        "embedding_backend": Config.EMBEDDING_BACKEND,
+        "chunk_size": Config.CHUNK_SIZE,
+        "chunk_overlap": Config.CHUNK_OVERLAP,
+        "hnsw": {
+            "space": Config.HNSW_SPACE,
+            "M": Config.HNSW_M,
+            "construction_ef": Config.HNSW_EF_CONSTRUCTION,
+            "search_ef": Config.HNSW_EF_SEARCH,
+        },
+        "extraction": {
+            "ocr_dpi": Config.OCR_DPI,
+            "ocr_grayscale": Config.OCR_GRAYSCALE,
+            "ocr_lang": Config.OCR_LANG,
+            "ocr_tesseract_psm": Config.OCR_TESSERACT_PSM,
+            "ocr_tesseract_oem": Config.OCR_TESSERACT_OEM,
+            "pdf_text_layer_enabled": Config.PDF_TEXT_LAYER_ENABLED,
+            "pdf_text_layer_min_chars": Config.PDF_TEXT_LAYER_MIN_CHARS,
+            "pdf_text_layer_min_quality": Config.PDF_TEXT_LAYER_MIN_QUALITY,
+        },
+        "files": {},
+    }
+
+
+def is_manifest_compatible(manifest: Optional[dict]) -> bool:
+    """Manifest dùng được cho ingest tăng dần nếu cùng model/backend embedding, tham số chia chunk, HNSW và trích xuất"""
+    if not manifest:
+        return False
+    expected = new_manifest()
+    return all(manifest.get(key) == expected[key] for key in COMPATIBILITY_KEYS)
+
+
+def load_manifest(manifest_path: Optional[str]) -> Optional[dict]:
+    if not manifest_path or not os.path.isfile(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"WARNING: Khong doc duoc manifest '{manifest_path}': {e}")
+        return None
+
+
+def save_manifest(manifest: dict, manifest_path: str):
+    """Ghi manifest (ghi file tạm rồi đổi tên)"""
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    print(f"Da luu manifest ({len(manifest['files'])} file) vao '{manifest_path}'.")
+
+
+def plan_ingestion(manifest: Optional[dict], file_hashes: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """
+    So sánh hash hiện tại của các file với manifest, trả về (file cần xử lý, file đã bị xóa).
+    Manifest không dùng được: xử lý lại mọi file.
+    """
+    if not is_manifest_compatible(manifest):
+        return sorted(file_hashes), []
+    previous_files = manifest["files"]
+    changed_files = sorted(name for name, file_hash in file_hashes.items()
+                           if previous_files.get(name, {}).get("hash") != file_hash)
+    deleted_files = sorted(name for name in previous_files if name not in file_hashes)
+    return changed_files, deleted_files
@@ -0,0 +1,93 @@
+# app/rag/metadata_filter.py
+
+"""
+Bộ lọc metadata theo cú pháp `where` của Chroma, dùng chung cho các backend không phải Chroma
+(NumPy index, BM25) để cùng một bộ lọc cho kết quả giống nhau trên mọi backend.
+Hỗ trợ: so sánh bằng trực tiếp, $eq, $ne, $in, $nin, $gt, $gte, $lt, $lte, $and, $or.
+MetadataMaskCache giữ mặt nạ đã tính theo từng bộ lọc để mỗi truy vấn con không phải duyệt lại toàn bộ metadata.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+MASK_CACHE_MAX_ENTRIES = 64
+
+_COMPARATORS = {
+    "$eq": lambda value, target: value == target,
+    "$ne": lambda value, target: value != target,
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+    "$gt": lambda value, target: value is not None and value > target,
+    "$gte": lambda value, target: value is not None and value >= target,
+    "$lt": lambda value, target: value is not None and value < target,
+    "$lte": lambda value, target: value is not None and value <= target,
+}
+
+
+def metadata_matches(metadata: dict, where: Optional[dict]) -> bool:
+    """Kiểm tra metadata của một chunk có thỏa bộ lọc where không (where rỗng/None luôn thỏa)"""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, sub_where) for sub_where in condition):
+                return False
+        elif key == "$or":
+            if not any(metadata_matches(metadata, sub_where) for sub_where in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, target in condition.items():
+                comparator = _COMPARATORS.get(operator)
+                if comparator is None:
+                    raise ValueError(f"Toan tu bo loc khong ho tro: {operator}")
+                if not comparator(value, target):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class MetadataMaskCache:
+    """
+    Mặt nạ bool (chunk nào thỏa bộ lọc where) trên danh sách metadata cố định của một chỉ mục,
+    tính một lần cho mỗi bộ lọc và giữ tối đa max_entries bộ lọc dùng gần nhất (LRU).
+    """
+
+    def __init__(self, metadatas: List[dict], max_entries: int = MASK_CACHE_MAX_ENTRIES):
+        self.metadatas = metadatas
+        self.max_entries = max_entries
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mask(self, where: dict) -> np.ndarray:
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False, default=str)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+
+        mask = np.fromiter((metadata_matches(m, where) for m in self.metadatas), dtype=bool,
+                           count=len(self.metadatas))
+        mask.flags.writeable = False
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > self.max_entries:
+                self._masks.popitem(last=False)
+        return mask
+
+
+def build_source_filter(source_files: Iterable[str]) -> Optional[dict]:
+    """Bộ lọc where giới hạn tìm kiếm trong các file nguồn (None nếu danh sách rỗng)"""
+    source_files = sorted(set(source_files))
+    if not source_files:
+        return None
+    if len(source_files) == 1:
+        return {"source_file": source_files[0]}
+    return {"source_file": {"$in": source_files}}
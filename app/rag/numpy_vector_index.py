@@ -0,0 +1,124 @@
+# app/rag/numpy_vector_index.py
+
+"""
+Chỉ mục vector tìm kiếm chính xác (exact search) bằng NumPy, thay thế HNSW của Chroma cho corpus nhỏ.
+Ma trận embedding đã chuẩn hóa (float32 hoặc float16) được lưu thành file .npy và memory-map khi tải;
+top-k = tích ma trận-vector + argpartition, hỗ trợ nhiều truy vấn một lần và bộ lọc metadata (where).
+Kết quả trả về cùng định dạng collection.query của Chroma (khoảng cách cosine = 1 - cos).
+"""
+
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+from chromadb.api.models.Collection import Collection
+
+from app.rag.metadata_filter import MetadataMaskCache
+
+NUMPY_VECTORS_FILE = "vectors.npy"
+NUMPY_DOCS_FILE = "vector_docs.json"
+NUMPY_INDEX_SPACE = "cosine"
+
+# Số dòng ma trận nhân mỗi lần (float16 được đổi sang float32 theo từng khối để dùng BLAS)
+SEARCH_BLOCK_ROWS = 8192
+
+
+class NumpyVectorIndex:
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[dict], vectors: np.ndarray):
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.vectors = vectors
+        self._filter_masks = MetadataMaskCache(metadatas)
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[str], metadatas: List[dict], embeddings,
+              dtype: str = "float32") -> "NumpyVectorIndex":
+        """Tạo chỉ mục từ embedding (chuẩn hóa lại theo hàng để tích vô hướng = cosine)"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        return cls(list(ids), list(documents), [dict(m or {}) for m in metadatas],
+                   np.ascontiguousarray(vectors.astype(np.dtype(dtype))))
+
+    @classmethod
+    def from_collection(cls, collection: Collection, dtype: str = "float32") -> "NumpyVectorIndex":
+        stored = collection.get(include=['documents', 'metadatas', 'embeddings'])
+        return cls.build(stored['ids'], stored['documents'], stored['metadatas'], stored['embeddings'], dtype)
+
+    def save(self, directory: str):
+        """Lưu ma trận và tài liệu xuống thư mục (ghi file tạm rồi đổi tên)"""
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, "vectors.tmp.npy")
+        np.save(tmp_path, self.vectors)
+        os.replace(tmp_path, os.path.join(directory, NUMPY_VECTORS_FILE))
+
+        tmp_path = os.path.join(directory, f"{NUMPY_DOCS_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, f,
+                      ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, NUMPY_DOCS_FILE))
+        print(f"Da luu NumPy vector index ({self.vectors.shape}, {self.vectors.dtype}) vao '{directory}'.")
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["NumpyVectorIndex"]:
+        """Tải chỉ mục, ma trận vector được memory-map (mmap_mode='r')"""
+        vectors_path = os.path.join(directory, NUMPY_VECTORS_FILE)
+        if not os.path.exists(vectors_path):
+            print(f"WARNING: Khong tim thay NumPy vector index tai '{directory}'.")
+            return None
+        try:
+            with open(os.path.join(directory, NUMPY_DOCS_FILE), "r", encoding="utf-8") as f:
+                docs = json.load(f)
+            index = cls(docs["ids"], docs["documents"], docs["metadatas"], np.load(vectors_path, mmap_mode='r'))
+            print(f"Da tai NumPy vector index ({index.vectors.shape}, {index.vectors.dtype}) tu '{directory}'.")
+            return index
+        except Exception as e:
+            print(f"ERROR: Loi khi tai NumPy vector index tu '{directory}': {e}")
+            return None
+
+    def _similarities(self, query_matrix: np.ndarray) -> np.ndarray:
+        """Ma trận cosine (số truy vấn x số chunk)"""
+        n_rows = self.vectors.shape[0]
+        if self.vectors.dtype == np.float32 and n_rows <= SEARCH_BLOCK_ROWS:
+            return query_matrix @ self.vectors.T
+        similarities = np.empty((query_matrix.shape[0], n_rows), dtype=np.float32)
+        for start in range(0, n_rows, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            similarities[:, start:start + block.shape[0]] = query_matrix @ block.T
+        return similarities
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[dict] = None) -> dict:
+        """
+        Top-k chính xác cho một hoặc nhiều truy vấn, trả về dict giống collection.query.
+        where (cú pháp Chroma) giới hạn kết quả trong các chunk có metadata thỏa bộ lọc.
+        """
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        query_matrix = np.asarray(query_embeddings, dtype=np.float32)
+        n_rows = self.vectors.shape[0]
+        allowed = None
+        if where:
+            allowed = self._filter_masks.mask(where)
+            n_rows = int(allowed.sum())
+        if n_rows == 0 or query_matrix.size == 0:
+            for _ in range(len(query_matrix)):
+                for value in results.values():
+                    value.append([])
+            return results
+
+        norms = np.linalg.norm(query_matrix, axis=1, keepdims=True)
+        query_matrix = query_matrix / np.where(norms == 0, 1.0, norms)
+
+        similarities = self._similarities(query_matrix)
+        if allowed is not None:
+            similarities[:, ~allowed] = -np.inf
+        k = min(n_results, n_rows)
+        top_indexes = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        for row, candidates in enumerate(top_indexes):
+            ordered = candidates[np.argsort(-similarities[row, candidates])]
+            results["ids"].append([self.ids[i] for i in ordered])
+            results["documents"].append([self.documents[i] for i in ordered])
+            results["metadatas"].append([self.metadatas[i] for i in ordered])
+            results["distances"].append([float(1.0 - similarities[row, i]) for i in ordered])
+        return results
@@ -0,0 +1,85 @@
+# app/rag/query_embedding_cache.py
+
+"""
+Cache vector embedding của truy vấn (query text -> vector).
+Truy vấn con lặp lại (từ khóa, câu hỏi liên quan, câu hỏi phổ biến) không cần chạy lại transformer.
+Có giới hạn số phần tử (LRU), tùy chọn lưu float16 để giảm một nửa bộ nhớ, và bộ đếm hit/miss.
+"""
+
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.config import Config
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries: int = None, use_float16: bool = None):
+        self.max_entries = max_entries if max_entries is not None else Config.QUERY_EMBEDDING_CACHE_SIZE
+        self.use_float16 = use_float16 if use_float16 is not None else Config.QUERY_EMBEDDING_CACHE_FLOAT16
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        # Model phân biệt hoa thường nên chỉ chuẩn hóa Unicode và khoảng trắng hai đầu
+        return unicodedata.normalize('NFC', text).strip()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Vector đã cache theo thứ tự texts, None cho truy vấn chưa có"""
+        results = []
+        with self._lock:
+            for text in texts:
+                key = self.make_key(text)
+                vector = self._entries.get(key)
+                if vector is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                results.append(vector.astype(np.float32).tolist())
+        return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        dtype = np.float16 if self.use_float16 else np.float32
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(text)
+                self._entries[key] = np.asarray(vector, dtype=dtype)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def embed_queries(self, texts: List[str], embeddings) -> List[List[float]]:
+        """Embed các truy vấn, chỉ chạy model (một lần embed_documents) cho các truy vấn chưa có trong cache"""
+        vectors = self.get_many(texts)
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing_texts:
+            missing_vectors = embeddings.embed_documents(missing_texts)
+            self.put_many(missing_texts, missing_vectors)
+            by_text = dict(zip(missing_texts, missing_vectors))
+            vectors = [vector if vector is not None else list(by_text[text]) for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "float16": self.use_float16,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,133 @@
+# app/rag/query_expansion_cache.py
+
+"""
+Cache kết quả mở rộng câu hỏi (query expansion).
+Khóa gồm câu hỏi đã chuẩn hóa Unicode và hash của cửa sổ lịch sử hội thoại,
+nên câu hỏi lặp lại (cùng ngữ cảnh) không cần gọi LLM lần nữa.
+Có giới hạn số phần tử (LRU), bộ đếm hit/miss và tùy chọn lưu xuống file JSON: file được ghi bởi
+một timer nền (gom thay đổi trong Config.QUERY_EXPANSION_CACHE_FLUSH_SECONDS) và khi process thoát,
+không ghi trên luồng xử lý request.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.core.config import Config
+
+
+def normalize_question(question: str) -> str:
+    """Chuẩn hóa NFC, chữ thường và gộp khoảng trắng để câu hỏi gần giống nhau dùng chung khóa"""
+    normalized = unicodedata.normalize('NFC', question).casefold()
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    return normalized.rstrip(' ?.!')
+
+
+class QueryExpansionCache:
+    def __init__(self, max_entries: int = None, cache_file: Optional[str] = None):
+        self.max_entries = max_entries if max_entries is not None else Config.QUERY_EXPANSION_CACHE_SIZE
+        self.cache_file = cache_file if cache_file is not None else Config.QUERY_EXPANSION_CACHE_FILE
+        self._entries: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer = None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+        if self.cache_file:
+            self._load_from_disk()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(question: str, conversation_context: str) -> str:
+        context_hash = hashlib.sha256(conversation_context.encode('utf-8')).hexdigest()[:16]
+        return f"{normalize_question(question)}::{context_hash}"
+
+    def get(self, question: str, conversation_context: str) -> Optional[Dict[str, str]]:
+        key = self.make_key(question, conversation_context)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, question: str, conversation_context: str, expansion: Dict[str, str]):
+        key = self.make_key(question, conversation_context)
+        with self._lock:
+            self._entries[key] = dict(expansion)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        """Đánh dấu cần ghi file và hẹn một lần ghi nền nếu chưa có (gọi khi giữ self._lock)"""
+        if not self.cache_file:
+            return
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(Config.QUERY_EXPANSION_CACHE_FLUSH_SECONDS, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Ghi cache xuống file nếu có thay đổi (chụp bản sao dưới lock, ghi file ngoài lock)"""
+        with self._lock:
+            self._flush_timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            entries = dict(self._entries)
+        with self._flush_lock:
+            self._save_to_disk(entries)
+
+    def _load_from_disk(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for key, expansion in list(data.items())[-self.max_entries:]:
+                self._entries[key] = expansion
+            print(f"Da tai {len(self._entries)} muc query expansion cache tu '{self.cache_file}'.")
+        except Exception as e:
+            print(f"WARNING: Khong the doc query expansion cache tu '{self.cache_file}': {e}")
+
+    def _save_to_disk(self, entries: Dict[str, Dict[str, str]]):
+        # File tạm riêng của process: nhiều worker cùng ghi không đè file tạm của nhau
+        tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            cache_dir = os.path.dirname(self.cache_file)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"WARNING: Khong the ghi query expansion cache xuong '{self.cache_file}': {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._mark_dirty()
+
+    def get_stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -5,9 +5,11 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.documents import Document
 
+from app.rag.context_packer import pack_context
 from app.rag.vector_storage_manager import VectorStoreManager
 
-from app.rag.document_processor import get_embedding_model
+from app.rag.embedding_batcher import get_query_embedder
+from app.rag.semantic_cache import SemanticAnswerCache
 
 from app.core.config import Config
 
@@ -76,7 +78,7 @@ def get_rag_chain():
             print("Dam bao da chay script process_document.py va thu muc data/chroma_db ton tai.")
             return None
 
-        embeddings = get_embedding_model()
+        embeddings = get_query_embedder()
         if embeddings is None:
             print("ERROR: Khong the lay Embedding Model cho Retriever.")
             return None
@@ -106,13 +108,13 @@ def get_rag_chain():
     try:
 
         def format_docs(docs: list[Document]) -> str:
-            """Ghep noi dung cac document thanh mot chuoi duy nhat."""
+            """Ghep noi dung cac document thanh mot chuoi duy nhat (noi chunk chong lan, bo lap, gioi han token)."""
             print("\n--- DEBUG TEST: CAC DOCUMENTS DUOC FORMAT CHO PROMPT ---")
             context_text = ""
             if not docs:
                 print("WARNING: Danh sach documents de format rong.")
             else:
-                for i, doc in enumerate(docs):
+                for i, doc in enumerate(pack_context(docs)):
                     content_preview = doc.page_content[:500] + "..." if doc.page_content else "<TRONG>"
                     metadata_info = doc.metadata if doc.metadata else "Không có metadata"
                     print(f"--- Document {i + 1} (Formatted) ---")
@@ -135,6 +137,35 @@ def get_rag_chain():
 
         print("Da xay dung RAG Chain thanh cong (su dung retriever thu cong).")
 
+        if Config.SEMANTIC_CACHE_ENABLED:
+            answer_cache = SemanticAnswerCache(embeddings, vector_store_manager=vector_store_manager)
+            uncached_rag_chain = rag_chain
+
+            def cached_rag_invoke(x):
+                """
+                Tra semantic cache truoc khi goi RAG Chain, luu lai cau tra loi moi.
+                Ham generator de RunnableLambda ho tro ca .invoke() lan .stream() theo token.
+                """
+                question = x["question"]
+                try:
+                    question_vector = answer_cache.embed(question)
+                except Exception as e:
+                    print(f"ERROR: Loi khi embed cau hoi cho semantic cache: {e}. Bo qua cache.")
+                    yield from uncached_rag_chain.stream(x)
+                    return
+                cached_response = answer_cache.lookup(question, question_vector)
+                if cached_response is not None:
+                    yield cached_response
+                    return
+                response_parts = []
+                for chunk in uncached_rag_chain.stream(x):
+                    response_parts.append(chunk)
+                    yield chunk
+                answer_cache.store(question, "".join(response_parts), question_vector)
+
+            rag_chain = RunnableLambda(cached_rag_invoke)
+            print("Da bat semantic cache cho RAG Chain.")
+
     except Exception as e:
         print(f"ERROR: Loi khi xay dung RAG Chain: {e}")
         return None
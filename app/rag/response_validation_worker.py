@@ -0,0 +1,85 @@
+# app/rag/response_validation_worker.py
+
+"""
+Worker nền xác thực chất lượng phản hồi.
+Việc gọi LLM để chấm điểm phản hồi được đưa ra khỏi luồng xử lý request:
+request chỉ đẩy job vào hàng đợi có giới hạn, một thread nền sẽ chấm điểm và lưu kết quả.
+"""
+
+import queue
+import random
+import threading
+from typing import Callable, Dict, Any, Optional
+
+from app.core.config import Config
+
+
+class ResponseValidationWorker:
+    """Hàng đợi có giới hạn + thread nền chạy hàm validate cho các phản hồi được lấy mẫu."""
+
+    def __init__(self, validate_func: Callable[[str, str, str], Dict[str, Any]],
+                 max_queue_size: int = None, sample_rate: float = None):
+        self.validate_func = validate_func
+        self.max_queue_size = max_queue_size if max_queue_size is not None else Config.RESPONSE_VALIDATION_QUEUE_SIZE
+        self.sample_rate = sample_rate if sample_rate is not None else Config.RESPONSE_VALIDATION_SAMPLE_RATE
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.submitted_count = 0
+        self.dropped_count = 0
+        self.processed_count = 0
+
+    def _ensure_started(self):
+        """Khởi động thread nền ở lần submit đầu tiên"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="response-validation-worker", daemon=True)
+                self._thread.start()
+                print("Đã khởi động Response Validation Worker.")
+
+    def submit(self, question: str, response: str, context: str,
+               on_validated: Optional[Callable[[Dict[str, Any]], None]] = None) -> bool:
+        """
+        Đẩy một phản hồi vào hàng đợi xác thực (không chặn).
+        Trả về False nếu phản hồi không được lấy mẫu hoặc hàng đợi đã đầy.
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((question, response, context, on_validated))
+            self.submitted_count += 1
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            print(f"WARNING: Hàng đợi validation đã đầy ({self.max_queue_size}). Bỏ qua việc chấm điểm phản hồi.")
+            return False
+
+    def _run(self):
+        while True:
+            question, response, context, on_validated = self._queue.get()
+            try:
+                validation = self.validate_func(question, response, context)
+                print(f"Quality level: {validation['quality_level']} (Score: {validation['total_score']}/50)")
+                if validation['quality_level'] == 'poor':
+                    print(f"WARNING: Low quality response - {validation['feedback']}")
+
+                if on_validated is not None:
+                    on_validated(validation)
+            except Exception as e:
+                print(f"ERROR trong Response Validation Worker: {e}")
+            finally:
+                self.processed_count += 1
+                self._queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê hàng đợi validation"""
+        return {
+            "sample_rate": self.sample_rate,
+            "queue_size": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "submitted": self.submitted_count,
+            "dropped": self.dropped_count,
+            "processed": self.processed_count,
+        }
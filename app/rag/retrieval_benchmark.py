@@ -0,0 +1,52 @@
+# app/rag/retrieval_benchmark.py
+
+"""
+Tiện ích đo đạc truy vấn vector dùng chung cho các script benchmark:
+lấy truy vấn mẫu từ collection, đo độ trễ p50/p99 và recall@k so với kết quả tìm kiếm chính xác.
+"""
+
+import random
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from app.rag.document_processor import get_embedding_model
+from app.rag.numpy_vector_index import NumpyVectorIndex
+
+
+def sample_query_embeddings(exact_index: NumpyVectorIndex, num_queries: int, seed: int = 0) -> list:
+    """Truy vấn mẫu: 200 ký tự đầu của các chunk ngẫu nhiên (cố định seed), embed bằng model hiện tại"""
+    rng = random.Random(seed)
+    sample = rng.sample(exact_index.documents, min(num_queries, len(exact_index.documents)))
+    return get_embedding_model().embed_documents([text[:200] for text in sample])
+
+
+def exact_top_k_ids(exact_index: NumpyVectorIndex, query_embeddings: list, k: int) -> List[set]:
+    return [set(ids) for ids in exact_index.query(query_embeddings, n_results=k)["ids"]]
+
+
+def measure_search(search: Callable[[list], dict], query_embeddings: list, exact_ids: List[set], k: int) -> dict:
+    """
+    Chạy search(list embedding) -> dict kiểu collection.query cho từng truy vấn và cho cả lô,
+    trả về độ trễ p50/p99 (ms), thời gian trung bình mỗi truy vấn khi chạy theo lô và recall@k.
+    """
+    latencies = []
+    found_ids = []
+    for embedding in query_embeddings:
+        start_time = time.perf_counter()
+        results = search([embedding])
+        latencies.append(time.perf_counter() - start_time)
+        found_ids.append(set(results["ids"][0]))
+
+    start_time = time.perf_counter()
+    search(query_embeddings)
+    batch_seconds = time.perf_counter() - start_time
+
+    recall = np.mean([len(found & exact) / len(exact) for found, exact in zip(found_ids, exact_ids) if exact])
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "batch_ms_per_query": round(batch_seconds * 1000 / len(query_embeddings), 3),
+        f"recall@{k}": round(float(recall), 4),
+    }
@@ -0,0 +1,74 @@
+# app/rag/retrieval_fusion.py
+
+"""
+Ghép kết quả tìm kiếm của nhiều truy vấn con.
+- Reciprocal Rank Fusion (RRF): điểm = tổng weight / (k + rank) trên mọi danh sách chứa chunk
+- Score fusion: điểm = điểm lớn nhất (nhân weight) của chunk trên các danh sách. Kết quả vector dùng độ tương đồng
+  cosine; kết quả BM25 (chỉ có 'bm25_score') được chuẩn hóa theo điểm cao nhất của danh sách rồi đưa về thang
+  cosine (nhân với độ tương đồng cao nhất trong các kết quả vector) để hai loại điểm so sánh được với nhau
+Chunk được định danh bằng chunk_id (id trong Chroma); chunk có độ tương đồng tốt nhất dưới ngưỡng bị loại.
+"""
+
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+FUSION_RRF = "rrf"
+FUSION_SCORE = "score"
+
+
+def _doc_key(doc: Document) -> str:
+    chunk_id = doc.metadata.get('chunk_id')
+    return chunk_id if chunk_id is not None else f"content:{hash(doc.page_content)}"
+
+
+def fuse_retrieval_results(ranked_lists: List[Tuple[List[Document], float]], top_k: int,
+                           method: str = FUSION_RRF, rrf_k: int = 60,
+                           min_similarity: float = None) -> List[Document]:
+    """
+    ranked_lists: list (docs đã sắp xếp theo độ liên quan, weight của truy vấn con).
+    Trả về tối đa top_k Document theo điểm ghép giảm dần; metadata được bổ sung 'fusion_score'.
+    """
+    fused_scores: Dict[str, float] = {}
+    best_similarity: Dict[str, float] = {}
+    best_doc: Dict[str, Document] = {}
+
+    similarities = [doc.metadata['similarity'] for docs, _ in ranked_lists for doc in docs
+                    if doc.metadata.get('similarity') is not None]
+    similarity_scale = max(similarities) if similarities else 1.0
+
+    for docs, weight in ranked_lists:
+        max_bm25_score = max((doc.metadata.get('bm25_score') or 0.0 for doc in docs), default=0.0)
+        for rank, doc in enumerate(docs, 1):
+            key = _doc_key(doc)
+            similarity = doc.metadata.get('similarity')
+
+            if key not in best_doc or (similarity is not None and similarity > best_similarity.get(key, float('-inf'))):
+                best_doc[key] = doc
+                if similarity is not None:
+                    best_similarity[key] = similarity
+
+            if method == FUSION_SCORE:
+                if similarity is not None:
+                    score = similarity
+                elif max_bm25_score > 0:
+                    score = (doc.metadata.get('bm25_score') or 0.0) / max_bm25_score * similarity_scale
+                else:
+                    score = 0.0
+                fused_scores[key] = max(fused_scores.get(key, float('-inf')), weight * score)
+            else:
+                fused_scores[key] = fused_scores.get(key, 0.0) + weight / (rrf_k + rank)
+
+    ranked_keys = sorted(fused_scores, key=fused_scores.get, reverse=True)
+
+    fused_docs = []
+    for key in ranked_keys:
+        if min_similarity is not None and key in best_similarity and best_similarity[key] < min_similarity:
+            continue
+        doc = best_doc[key]
+        fused_docs.append(Document(page_content=doc.page_content,
+                                   metadata={**doc.metadata, 'fusion_score': fused_scores[key]}))
+        if len(fused_docs) >= top_k:
+            break
+
+    return fused_docs
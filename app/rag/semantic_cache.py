@@ -0,0 +1,136 @@
+# app/rag/semantic_cache.py
+
+"""
+Semantic cache cho câu trả lời của chatbot.
+Câu hỏi mới được embed và so sánh cosine với các câu hỏi đã trả lời; nếu đủ gần
+(>= ngưỡng cấu hình) thì trả về câu trả lời đã lưu thay vì gọi lại LLM.
+Cache có giới hạn số phần tử (LRU), thời gian sống (TTL) và tự xóa khi một collection bất kỳ
+trong Config.VECTOR_COLLECTIONS được build lại.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import Config
+from app.rag.index_version import get_index_version
+
+
+class SemanticAnswerCache:
+    def __init__(self, embeddings, threshold: float = None, max_entries: int = None, ttl_seconds: int = None,
+                 vector_store_manager=None):
+        self.embeddings = embeddings
+        # VectorStoreManager (nếu có) đọc lại file CURRENT theo chu kỳ INDEX_VERSION_CHECK_SECONDS
+        self.vector_store_manager = vector_store_manager
+        self.threshold = threshold if threshold is not None else Config.SEMANTIC_CACHE_THRESHOLD
+        self.max_entries = max_entries if max_entries is not None else Config.SEMANTIC_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.SEMANTIC_CACHE_TTL_SECONDS
+
+        self._entries = OrderedDict()  # key -> (vector, question, answer, created_at)
+        self._next_key = 0
+        self._index_version = self._current_index_versions()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, question: str) -> np.ndarray:
+        """
+        Vector chuẩn hóa của câu hỏi. Có vector_store_manager thì đi qua cache embedding truy vấn dùng chung,
+        nên bước tìm kiếm sau đó dùng lại vector này thay vì chạy model lần nữa.
+        """
+        if self.vector_store_manager is not None:
+            raw_vector = self.vector_store_manager.embed_queries([question], self.embeddings)[0]
+        else:
+            raw_vector = self.embeddings.embed_query(question)
+        vector = np.asarray(raw_vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _current_index_versions(self) -> tuple:
+        """Phiên bản snapshot đang công bố của mọi collection được cấu hình"""
+        if self.vector_store_manager is not None:
+            return tuple(self.vector_store_manager.current_index_version(name) for name in Config.VECTOR_COLLECTIONS)
+        return tuple(get_index_version(name) for name in Config.VECTOR_COLLECTIONS)
+
+    def _check_index_version(self):
+        """Xóa toàn bộ cache nếu một collection bất kỳ đã được build lại"""
+        current_version = self._current_index_versions()
+        if current_version != self._index_version:
+            print("Vector DB da duoc build lai. Xoa semantic cache.")
+            self._entries.clear()
+            self._index_version = current_version
+
+    def _evict_expired(self, now: float):
+        expired_keys = [key for key, (_, _, _, created_at) in self._entries.items()
+                        if now - created_at > self.ttl_seconds]
+        for key in expired_keys:
+            del self._entries[key]
+
+    def lookup(self, question: str, query_vector: np.ndarray = None) -> Optional[str]:
+        """
+        Trả về câu trả lời đã lưu cho câu hỏi gần nghĩa nhất, hoặc None.
+        Có thể truyền sẵn query_vector (từ embed()) để dùng lại khi gọi store().
+        """
+        if query_vector is None:
+            try:
+                query_vector = self.embed(question)
+            except Exception as e:
+                print(f"ERROR: Loi khi embed cau hoi cho semantic cache: {e}")
+                return None
+
+        with self._lock:
+            self._check_index_version()
+            self._evict_expired(time.time())
+
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            keys = list(self._entries.keys())
+            matrix = np.stack([self._entries[key][0] for key in keys])
+            similarities = matrix @ query_vector
+            best = int(np.argmax(similarities))
+
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            best_key = keys[best]
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            _, cached_question, answer, _ = self._entries[best_key]
+            print(f"Semantic cache HIT (cosine={similarities[best]:.4f}) voi cau hoi: '{cached_question}'")
+            return answer
+
+    def store(self, question: str, answer: str, query_vector: np.ndarray = None):
+        """Lưu câu trả lời cho câu hỏi, loại phần tử ít dùng nhất khi vượt giới hạn"""
+        vector = query_vector
+        if vector is None:
+            try:
+                vector = self.embed(question)
+            except Exception as e:
+                print(f"ERROR: Loi khi embed cau hoi de luu semantic cache: {e}")
+                return
+
+        with self._lock:
+            self._check_index_version()
+            self._entries[self._next_key] = (vector, question, answer, time.time())
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,102 @@
+# app/rag/source_router.py
+
+"""
+Bộ định tuyến nguồn (source router) nhẹ: chọn các file nguồn ứng viên từ câu hỏi, không cần LLM.
+Mỗi file có một hồ sơ từ khóa gồm âm tiết/bigram của tên file và các bigram đặc trưng nhất (TF-IDF)
+trong nội dung của file. Câu hỏi được so khớp với hồ sơ (bỏ dấu để khớp cả tên file không dấu),
+điểm = tổng IDF (theo file) của các từ khóa trùng, từ khóa trong tên file được nhân NAME_TERM_WEIGHT.
+"""
+
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from app.rag.bm25_index import tokenize_vietnamese
+
+NAME_TERM_WEIGHT = 2.0
+
+
+def strip_vietnamese_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt (kể cả đ -> d) và chuyển chữ thường"""
+    decomposed = unicodedata.normalize('NFD', text.lower())
+    without_marks = ''.join(c for c in decomposed if unicodedata.category(c) != 'Mn')
+    return without_marks.replace('đ', 'd')
+
+
+def _routing_terms(text: str) -> List[str]:
+    return tokenize_vietnamese(strip_vietnamese_accents(text))
+
+
+def _name_terms(source_file: str) -> set:
+    """Âm tiết và bigram của tên file (bỏ phần mở rộng, '_', '-', '.')"""
+    name = os.path.splitext(source_file)[0]
+    return set(_routing_terms(re.sub(r'[_\-.]+', ' ', name)))
+
+
+class SourceRouter:
+    def __init__(self, profiles: Dict[str, Dict[str, float]], min_score: float, relative_score: float):
+        # profiles: source_file -> {term: trọng số}
+        self.profiles = profiles
+        self.min_score = min_score
+        self.relative_score = relative_score
+
+    @classmethod
+    def build(cls, texts: List[str], metadatas: List[dict], terms_per_source: int = 50,
+              min_score: float = 2.0, relative_score: float = 0.5) -> "SourceRouter":
+        """Xây hồ sơ từ khóa cho từng source_file từ các chunk (text + metadata)"""
+        content_counts = defaultdict(Counter)
+        for text, metadata in zip(texts, metadatas):
+            source_file = (metadata or {}).get('source_file')
+            if source_file:
+                # Chỉ dùng bigram cho nội dung: âm tiết đơn lẻ quá mơ hồ để phân biệt tài liệu
+                content_counts[source_file].update(t for t in _routing_terms(text) if '_' in t)
+
+        name_terms = {source_file: _name_terms(source_file) for source_file in content_counts}
+
+        # Chọn bigram đặc trưng của từng file theo TF-IDF (IDF tính trên số file chứa bigram)
+        n_sources = len(content_counts)
+        content_doc_freq = Counter(term for counts in content_counts.values() for term in counts)
+        content_terms = {}
+        for source_file, counts in content_counts.items():
+            ranked = sorted(counts, key=lambda t: (-counts[t] * math.log(n_sources / content_doc_freq[t] + 1.0), t))
+            content_terms[source_file] = set(ranked[:terms_per_source])
+
+        # IDF theo file trên hồ sơ cuối cùng: từ khóa có mặt ở mọi file có trọng số 0
+        profile_terms = {s: name_terms[s] | content_terms[s] for s in content_counts}
+        profile_doc_freq = Counter(term for terms in profile_terms.values() for term in terms)
+        profiles = {}
+        for source_file, terms in profile_terms.items():
+            weights = {}
+            for term in terms:
+                idf = math.log(n_sources / profile_doc_freq[term])
+                if idf > 0:
+                    weights[term] = idf * (NAME_TERM_WEIGHT if term in name_terms[source_file] else 1.0)
+            profiles[source_file] = weights
+
+        print(f"Da xay source router cho {len(profiles)} file nguon.")
+        return cls(profiles, min_score, relative_score)
+
+    def score(self, question: str) -> Dict[str, float]:
+        """Điểm của từng file nguồn cho câu hỏi"""
+        question_terms = set(_routing_terms(question))
+        return {source_file: sum(weight for term, weight in weights.items() if term in question_terms)
+                for source_file, weights in self.profiles.items()}
+
+    def route(self, question: str) -> Optional[List[str]]:
+        """
+        Các file nguồn ứng viên cho câu hỏi, hoặc None nếu không đủ tín hiệu để lọc
+        (điểm cao nhất dưới min_score, hoặc mọi file đều là ứng viên).
+        """
+        if len(self.profiles) < 2:
+            return None
+        scores = self.score(question)
+        best_score = max(scores.values())
+        if best_score < self.min_score:
+            return None
+        candidates = sorted(s for s, value in scores.items() if value >= best_score * self.relative_score)
+        if len(candidates) == len(self.profiles):
+            return None
+        return candidates
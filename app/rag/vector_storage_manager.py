@@ -1,66 +1,283 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Optional
 
 import chromadb
+from chromadb.api.client import SharedSystemClient
 from chromadb.api.models.Collection import Collection
 from langchain_core.documents import Document
 
 from app.core.config import Config
-from app.rag.document_processor import get_embedding_model
+from app.rag.bm25_index import BM25Index
+from app.rag.embedding_batcher import get_query_embedder
+from app.rag.index_version import create_snapshot, get_index_paths, get_index_version, publish_snapshot
+from app.rag.numpy_vector_index import NumpyVectorIndex, NUMPY_INDEX_SPACE
+from app.rag.query_embedding_cache import QueryEmbeddingCache
+from app.rag.source_router import SourceRouter
+
+# release_chroma_client dung API noi bo SharedSystemClient._identifier_to_system cua Chroma,
+# moi chi kiem chung voi chromadb 1.0.x (requirements.txt: chromadb~=1.0.8)
+CHROMA_SHARED_SYSTEM_CACHE_VERSION = (1, 0)
+
+
+def get_chroma_shared_system_cache() -> dict:
+    """
+    Cache system dung chung cua Chroma (identifier -> System).
+    Bao loi ro rang khi phien ban chromadb khac phien ban da kiem chung hoac API noi bo da thay doi,
+    de nang cap chromadb khong am tham lam ro ri client cua snapshot cu.
+    """
+    version = tuple(int(part) for part in chromadb.__version__.split(".")[:2])
+    cache = getattr(SharedSystemClient, "_identifier_to_system", None)
+    if version != CHROMA_SHARED_SYSTEM_CACHE_VERSION or not isinstance(cache, dict):
+        raise RuntimeError(
+            f"chromadb {chromadb.__version__}: chua kiem chung SharedSystemClient._identifier_to_system "
+            f"(chi ho tro {'.'.join(map(str, CHROMA_SHARED_SYSTEM_CACHE_VERSION))}.x). "
+            f"Kiem tra lai release_chroma_client truoc khi nang cap chromadb.")
+    return cache
+
+
+# Kiem tra ngay khi import: nang cap chromadb bao loi luc khoi dong thay vi luc doi snapshot
+get_chroma_shared_system_cache()
+
+
+def distance_to_similarity(distance: float, space: str = "l2") -> float:
+    """
+    Doi khoang cach Chroma sang do tuong dong cosine.
+    Embedding da duoc chuan hoa (normalize_embeddings=True): voi 'l2' Chroma tra ve binh phuong khoang cach
+    nen cos = 1 - d/2; voi 'cosine' cos = 1 - d; voi 'ip' Chroma tra ve 1 - dot.
+    """
+    if distance is None:
+        return 0.0
+    if space == "l2":
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+
+def query_results_to_documents(results: dict, query_index: int, space: str = "l2") -> list[Document]:
+    """
+    Chuyen ket qua collection.query cua mot query thanh list Document.
+    Metadata cua moi Document duoc bo sung 'chunk_id', 'distance' va 'similarity' de buoc ghep ket qua dung.
+    """
+    documents = results.get('documents') or []
+    if query_index >= len(documents) or not documents[query_index]:
+        return []
+
+    ids = (results.get('ids') or [[]] * len(documents))[query_index] or []
+    metadatas = (results.get('metadatas') or [[]] * len(documents))[query_index] or []
+    distances = (results.get('distances') or [[]] * len(documents))[query_index] or []
+
+    retrieved_docs = []
+    for i, doc_content in enumerate(documents[query_index]):
+        doc_metadata = dict(metadatas[i]) if i < len(metadatas) and metadatas[i] else {}
+        doc_distance = distances[i] if i < len(distances) else None
+        if i < len(ids):
+            doc_metadata['chunk_id'] = ids[i]
+        if doc_distance is not None:
+            doc_metadata['distance'] = doc_distance
+            doc_metadata['similarity'] = distance_to_similarity(doc_distance, space)
+        retrieved_docs.append(Document(page_content=doc_content, metadata=doc_metadata))
+    return retrieved_docs
+
+
+def get_collection_space(collection: Collection) -> str:
+    """Khong gian khoang cach cua collection (mac dinh cua Chroma la 'l2')"""
+    metadata = getattr(collection, 'metadata', None) or {}
+    return metadata.get('hnsw:space', 'l2')
+
+
+def release_chroma_client(client):
+    """
+    Dong system cua Chroma client (file HNSW/sqlite cua snapshot) va xoa no khoi cache system dung chung
+    cua Chroma; neu khong, moi snapshot da tung tai van giu bo nho va file handle (Windows khong xoa duoc).
+    """
+    shared_system_cache = get_chroma_shared_system_cache()
+    try:
+        identifier = getattr(client, "_identifier", None)
+        if identifier is not None:
+            shared_system_cache.pop(identifier, None)
+        system = getattr(client, "_system", None)
+        if system is not None:
+            system.stop()
+    except Exception as e:
+        print(f"WARNING: Loi khi dong Chroma client cua snapshot cu: {e}")
+
+
+def tag_collection_documents(docs: list[Document], collection_name: str) -> list[Document]:
+    """
+    Gan ten collection vao metadata cua Document. Khi co nhieu collection, chunk id duoc them tien to
+    '<collection>/' de chunk trung id o hai collection khong bi gop nham khi ghep ket qua.
+    """
+    for doc in docs:
+        doc.metadata['collection'] = collection_name
+        if len(Config.VECTOR_COLLECTIONS) > 1 and 'chunk_id' in doc.metadata:
+            doc.metadata['chunk_id'] = f"{collection_name}/{doc.metadata['chunk_id']}"
+    return docs
+
+
+def merge_collection_results(per_collection_docs: list[list[Document]], k: int, score_key: str) -> list[Document]:
+    """Ghep ket qua cua nhieu collection cho mot query: sap xep theo metadata[score_key] giam dan, lay top-k"""
+    if len(per_collection_docs) == 1:
+        return per_collection_docs[0][:k]
+    merged = [doc for docs in per_collection_docs for doc in docs]
+    merged.sort(key=lambda doc: doc.metadata.get(score_key, 0.0), reverse=True)
+    return merged[:k]
 
 
 class VectorStoreManager:
-    _client_instance = None
-    _collection_instance = None
+    # Trang thai dung chung theo ten collection (moi collection co chuoi snapshot rieng)
+    _client_instances = {}
+    _retired_clients = []  # (thoi diem bi thay, client) cua snapshot cu, dong sau INDEX_CLIENT_RELEASE_DELAY_SECONDS
+    _collection_instances = {}
+    _loaded_versions = {}
+    _version_checked_at = {}
+    _current_versions = {}
+    _reload_lock = threading.Lock()
     _embedding_model = None
+    _bm25_indexes = {}  # ten collection -> (version, BM25Index)
+    _numpy_indexes = {}  # ten collection -> (version, NumpyVectorIndex)
+    _source_routers = {}  # tuple ten collection -> (tuple version, SourceRouter)
+    # Rieng voi _reload_lock: xay router goi load_bm25_index/get_current_collection (co the lay _reload_lock)
+    _source_router_lock = threading.Lock()
+    _query_embedding_cache = None
+    _fanout_executor = None
     _db_directory = None
-    _collection_name = "document_collection"
+    _collection_name = Config.VECTOR_COLLECTIONS[0]
 
     def __init__(self):
         print("Tao instance VectorStoreManager lan dau...")
-        self._db_directory = Config.VECTOR_DB_PATH
+        self._db_directory = get_index_paths(collection_name=self._collection_name)["chroma"]
         self._model_name = Config.SENTENCE_TRANSFORMER_MODEL_NAME
+        if VectorStoreManager._query_embedding_cache is None:
+            VectorStoreManager._query_embedding_cache = QueryEmbeddingCache()
 
         print("Khoi tao thuoc tinh cua VectorStoreManager...")
-        print(f"Su dung duong dan Vector DB tu Config: {self._db_directory}")
+        print(f"Su dung duong dan Vector DB (snapshot hien tai): {self._db_directory}")
         print(f"Su dung model embedding tu Config: {self._model_name}")
-        print(f"Su dung ten collection: {self._collection_name}")
+        print(f"Su dung ten collection chinh: {self._collection_name} (tat ca: {Config.VECTOR_COLLECTIONS})")
         print("VectorStoreManager da khoi tao thuoc tinh.")
 
-    def load_vector_store(self) -> Collection | None:
+    def collection_names(self, collections: Optional[list[str]] = None) -> list[str]:
         """
-        Tai VectorStore (Chroma Collection) tu duong dan da cau hinh.
-        Neu Collection da duoc tai truoc do, tra ve instance dang ton tai.
+        Cac collection can truy van: tat ca collection trong Config.VECTOR_COLLECTIONS,
+        hoac tap con duoc yeu cau (ten khong co trong Config bi bo qua).
         """
-        print("\n--- Dang tai VectorStore (load_vector_store) ---")
+        if not collections:
+            return list(Config.VECTOR_COLLECTIONS)
+        unknown = [name for name in collections if name not in Config.VECTOR_COLLECTIONS]
+        if unknown:
+            print(f"WARNING: Bo qua collection khong co trong Config.VECTOR_COLLECTIONS: {unknown}")
+        return [name for name in Config.VECTOR_COLLECTIONS if name in collections]
+
+    def _fan_out(self, search: Callable, collection_names: list[str]) -> list:
+        """Goi search(ten collection) cho tung collection song song tren thread pool, giu thu tu collection"""
+        if len(collection_names) <= 1:
+            return [search(name) for name in collection_names]
+        if VectorStoreManager._fanout_executor is None:
+            with VectorStoreManager._reload_lock:
+                if VectorStoreManager._fanout_executor is None:
+                    VectorStoreManager._fanout_executor = ThreadPoolExecutor(
+                        max_workers=max(1, Config.COLLECTION_FANOUT_WORKERS), thread_name_prefix="collection-fanout")
+        return list(VectorStoreManager._fanout_executor.map(search, collection_names))
+
+    def current_index_version(self, collection_name: Optional[str] = None) -> str:
+        """Phien ban snapshot dang cong bo, doc lai file CURRENT toi da moi INDEX_VERSION_CHECK_SECONDS giay"""
+        collection_name = collection_name or self._collection_name
+        now = time.monotonic()
+        if VectorStoreManager._current_versions.get(collection_name) is None or \
+                now - VectorStoreManager._version_checked_at.get(collection_name, 0.0) >= \
+                Config.INDEX_VERSION_CHECK_SECONDS:
+            VectorStoreManager._current_versions[collection_name] = get_index_version(collection_name)
+            VectorStoreManager._version_checked_at[collection_name] = now
+            if VectorStoreManager._retired_clients:
+                with VectorStoreManager._reload_lock:
+                    self._release_retired_clients()
+        return VectorStoreManager._current_versions[collection_name]
 
-        if VectorStoreManager._collection_instance is not None:
+    @staticmethod
+    def _retire_client(collection_name: str, replacement=None):
+        """
+        Dua client dang dung cua collection vao hang cho dong (goi khi giu _reload_lock, truoc khi thay).
+        Client cung duong dan voi client thay the (Vector DB cu) dung chung system nen khong bi dong.
+        """
+        client = VectorStoreManager._client_instances.get(collection_name)
+        if client is None or client is replacement:
+            return
+        if replacement is not None and getattr(client, "_identifier", None) == getattr(replacement, "_identifier", None):
+            return
+        VectorStoreManager._retired_clients.append((time.monotonic(), client))
+
+    @staticmethod
+    def _discard_client(client, collection_name: str):
+        """Dong client vua mo cho snapshot khong tai duoc (tru khi dung chung system voi client dang dung)"""
+        current_client = VectorStoreManager._client_instances.get(collection_name)
+        if current_client is None or getattr(current_client, "_identifier", None) != getattr(client, "_identifier", None):
+            release_chroma_client(client)
+
+    @staticmethod
+    def _release_retired_clients():
+        """Dong client cua snapshot cu da bi thay lau hon INDEX_CLIENT_RELEASE_DELAY_SECONDS (giu _reload_lock)"""
+        now = time.monotonic()
+        still_retired = []
+        for retired_at, client in VectorStoreManager._retired_clients:
+            if now - retired_at >= Config.INDEX_CLIENT_RELEASE_DELAY_SECONDS:
+                release_chroma_client(client)
+            else:
+                still_retired.append((retired_at, client))
+        VectorStoreManager._retired_clients = still_retired
+
+    def load_vector_store(self, collection_name: Optional[str] = None) -> Collection | None:
+        """
+        Tai VectorStore (Chroma Collection) cua snapshot dang duoc cong bo (mac dinh: collection chinh).
+        Neu Collection cua snapshot nay da duoc tai truoc do, tra ve instance dang ton tai;
+        khi co snapshot moi, collection moi duoc tai va thay the (truy van dang chay van dung collection cu).
+        """
+        collection_name = collection_name or self._collection_name
+        print(f"\n--- Dang tai VectorStore '{collection_name}' (load_vector_store) ---")
+
+        current_version = self.current_index_version(collection_name)
+        if VectorStoreManager._loaded_versions.get(collection_name) == current_version:
             print("VectorStore Collection da duoc tai truoc do. Tra ve instance dang ton tai.")
             print("load_vector_store hoan tat, tra ve VectorStore Collection dang ton tai.")
-            return VectorStoreManager._collection_instance
+            return VectorStoreManager._collection_instances.get(collection_name)
+
+        with VectorStoreManager._reload_lock:
+            if VectorStoreManager._loaded_versions.get(collection_name) == current_version:
+                return VectorStoreManager._collection_instances.get(collection_name)
+            return self._load_snapshot(current_version, collection_name)
 
-        print(f"VectorStore Collection chua duoc tai. Thu tai tu '{self._db_directory}'...")
+    def _load_snapshot(self, version: str, collection_name: str) -> Collection | None:
+        """Tai Chroma Collection cua mot snapshot va doi instance dung chung cua collection sang snapshot do"""
+        db_directory = get_index_paths(version, collection_name)["chroma"]
+        print(f"VectorStore Collection '{collection_name}' (snapshot '{version}') chua duoc tai. "
+              f"Thu tai tu '{db_directory}'...")
 
-        print(f"Dang kiem tra su ton tai cua thu muc DB: {self._db_directory}")
-        if not os.path.exists(self._db_directory) or not os.path.isdir(self._db_directory):
-            print(f"WARNING: Thu muc Vector DB khong ton tai hoac khong hop le: {self._db_directory}")
+        print(f"Dang kiem tra su ton tai cua thu muc DB: {db_directory}")
+        if not db_directory or not os.path.isdir(db_directory):
+            print(f"WARNING: Thu muc Vector DB khong ton tai hoac khong hop le: {db_directory}")
             print("Vui long dam bao da chay script process_document.py de tao Vector DB.")
+            # Snapshot da cong bo nhung rong (vector store da bi xoa): ngung phuc vu snapshot cu
+            self._retire_client(collection_name)
+            VectorStoreManager._client_instances[collection_name] = None
+            VectorStoreManager._collection_instances[collection_name] = None
+            VectorStoreManager._loaded_versions[collection_name] = version
             print("load_vector_store hoan tat, tra ve None.")
             return None
 
-        if VectorStoreManager._client_instance is None:
-            print("Dang khoi tao Chroma client persistent...")
-            try:
-                VectorStoreManager._client_instance = chromadb.PersistentClient(path=self._db_directory)
-                print("Da khoi tao Chroma client persistent.")
-            except Exception as e:
-                print(f"ERROR: Loi khi khoi tao Chroma client persistent tai {self._db_directory}: {e}")
-                print("load_vector_store hoan tat, tra ve None do loi client.")
-                return None
+        current_collection = VectorStoreManager._collection_instances.get(collection_name)
+        print("Dang khoi tao Chroma client persistent...")
+        try:
+            client = chromadb.PersistentClient(path=db_directory)
+            print("Da khoi tao Chroma client persistent.")
+        except Exception as e:
+            print(f"ERROR: Loi khi khoi tao Chroma client persistent tai {db_directory}: {e}")
+            print("load_vector_store hoan tat, tra ve None do loi client.")
+            return current_collection
 
         if VectorStoreManager._embedding_model is None:
             print("Dang khoi tao Embedding Model...")
-            VectorStoreManager._embedding_model = get_embedding_model()
+            VectorStoreManager._embedding_model = get_query_embedder()
 
             if VectorStoreManager._embedding_model is None:
                 print("ERROR: Khong the khoi tao Embedding Model.")
@@ -71,54 +288,226 @@ class VectorStoreManager:
 
         try:
 
-            print(f"Dang lay collection '{self._collection_name}' tu client...")
+            print(f"Dang lay collection '{collection_name}' tu client...")
 
-            collection_list = [c.name for c in VectorStoreManager._client_instance.list_collections()]
-            if self._collection_name not in collection_list:
-                print(f"ERROR: Collection '{self._collection_name}' khong ton tai.")
+            collection_list = [c.name for c in client.list_collections()]
+            if collection_name not in collection_list:
+                print(f"ERROR: Collection '{collection_name}' khong ton tai.")
                 print("Vui long dam bao da chay script process_document.py de tao collection.")
                 print("load_vector_store hoan tat, tra ve None.")
-                return None
+                self._discard_client(client, collection_name)
+                return current_collection
 
-            collection = VectorStoreManager._client_instance.get_collection(
-                name=self._collection_name,
+            collection = client.get_collection(
+                name=collection_name,
             )
-            print(f"Da lay collection '{self._collection_name}' thanh cong.")
+            print(f"Da lay collection '{collection_name}' thanh cong.")
 
             print(f"--- DEBUG: So luong items trong Vector Store (sau khi load): {collection.count()} ---")
 
-            VectorStoreManager._collection_instance = collection
-            print("load_vector_store hoan tat, tra ve VectorStore Collection.")
+            # Truy van dang chay van dung collection cu; client cu duoc dong sau mot khoang cho
+            self._retire_client(collection_name, replacement=client)
+            VectorStoreManager._client_instances[collection_name] = client
+            VectorStoreManager._collection_instances[collection_name] = collection
+            VectorStoreManager._loaded_versions[collection_name] = version
+            print(f"load_vector_store hoan tat, tra ve VectorStore Collection (snapshot '{version}').")
             return collection
 
         except Exception as e:
             print(
-                f"ERROR: Loi khi tai hoac ket noi den VectorStore Collection '{self._collection_name}' tai {self._db_directory}: {e}")
+                f"ERROR: Loi khi tai hoac ket noi den VectorStore Collection '{collection_name}' tai {db_directory}: {e}")
             print("Kiem tra lai duong dan Vector DB va ten collection.")
-            print("load_vector_store hoan tat, tra ve None do loi.")
-            return None
+            print("load_vector_store hoan tat, giu collection dang dung do loi.")
+            self._discard_client(client, collection_name)
+            return current_collection
+
+    def get_current_collection(self, collection_name: Optional[str] = None) -> Collection | None:
+        """Collection cua snapshot hien tai; tu chuyen sang snapshot moi khi pipeline da cong bo"""
+        collection_name = collection_name or self._collection_name
+        current_version = self.current_index_version(collection_name)
+        if VectorStoreManager._loaded_versions.get(collection_name) != current_version:
+            print(f"Phat hien snapshot moi '{current_version}' cua collection '{collection_name}', dang chuyen sang...")
+            return self.load_vector_store(collection_name)
+        return VectorStoreManager._collection_instances.get(collection_name)
 
-    def delete_vector_store(self):
+    def delete_vector_store(self, collection_name: Optional[str] = None):
         """
-        Xoa thu muc VectorStore.
+        Xoa VectorStore an toan voi worker dang doc: cong bo mot snapshot rong thay vi xoa thu muc dang duoc dung.
+        Worker chuyen sang snapshot rong o lan kiem tra ke tiep; snapshot cu duoc don theo INDEX_SNAPSHOTS_KEEP.
         """
-        print(f"\n--- Dang xoa thu muc VectorStore: {self._db_directory} ---")
+        collection_name = collection_name or self._collection_name
+        print(f"\n--- Dang xoa VectorStore '{collection_name}' (cong bo snapshot rong) ---")
         try:
-            if os.path.exists(self._db_directory):
-                import shutil
-                shutil.rmtree(self._db_directory)
-                VectorStoreManager._client_instance = None
-                VectorStoreManager._collection_instance = None
-                print(f"Da xoa thu muc VectorStore: {self._db_directory} thanh cong.")
-            else:
-                print(f"Thu muc VectorStore khong ton tai: {self._db_directory}. Khong can xoa.")
+            version, _ = create_snapshot(collection_name)
+            publish_snapshot(version, collection_name)
+            VectorStoreManager._current_versions[collection_name] = None
+            print(f"Da xoa VectorStore: snapshot rong '{version}' da duoc cong bo.")
         except Exception as e:
-            print(f"ERROR: Loi khi xoa thu muc VectorStore {self._db_directory}: {e}")
+            print(f"ERROR: Loi khi xoa VectorStore: {e}")
+
+    def embed_queries(self, queries: list[str], embeddings) -> list[list[float]]:
+        """Embed cac query qua cache LRU dung chung (query text -> vector)"""
+        return VectorStoreManager._query_embedding_cache.embed_queries(queries, embeddings)
+
+    def get_query_embedding_cache_stats(self) -> dict:
+        return VectorStoreManager._query_embedding_cache.get_stats()
+
+    def load_numpy_index(self, collection_name: Optional[str] = None) -> NumpyVectorIndex | None:
+        """
+        Tai NumPy vector index (memory-map) cua snapshot hien tai.
+        Instance (hoac None neu snapshot khong co index) duoc giu lai cho den khi co snapshot moi,
+        nen canh bao quay ve Chroma chi in mot lan cho moi snapshot.
+        """
+        collection_name = collection_name or self._collection_name
+        current_version = self.current_index_version(collection_name)
+        loaded_version, numpy_index = VectorStoreManager._numpy_indexes.get(collection_name, (None, None))
+        if loaded_version != current_version:
+            index_path = get_index_paths(current_version, collection_name)["numpy"]
+            numpy_index = NumpyVectorIndex.load(index_path) if index_path else None
+            if numpy_index is None:
+                print(f"WARNING: Snapshot '{current_version}' cua collection '{collection_name}' chua co "
+                      f"NumPy vector index, dung Chroma. Chay lai ingest de xay index.")
+            VectorStoreManager._numpy_indexes[collection_name] = (current_version, numpy_index)
+        return numpy_index
+
+    def _query_vectors(self, query_embeddings: list, k: int, where: Optional[dict] = None,
+                       collection_name: Optional[str] = None) -> tuple:
+        """
+        Truy van top-k tren snapshot hien tai cua mot collection theo backend trong Config.VECTOR_BACKEND,
+        tra ve (results, space). Backend 'numpy' quay ve Chroma neu chua co NumPy index; snapshot rong tra ve ket qua rong.
+        where: bo loc metadata theo cu phap Chroma (vi du {"source_file": {"$in": [...]}}).
+        """
+        if Config.VECTOR_BACKEND == 'numpy':
+            numpy_index = self.load_numpy_index(collection_name)
+            if numpy_index is not None:
+                return numpy_index.query(query_embeddings, n_results=k, where=where), NUMPY_INDEX_SPACE
+
+        # Giu tham chieu collection trong suot truy van: doi snapshot giua chung khong anh huong
+        collection = self.get_current_collection(collection_name)
+        if collection is None:
+            return {}, "l2"
+
+        results = collection.query(
+            query_embeddings=query_embeddings,
+            n_results=k,
+            where=where or None,
+            include=['documents', 'metadatas', 'distances']
+        )
+        return results, get_collection_space(collection)
+
+    def search_vectors(self, query_embeddings: list, k: int, where: Optional[dict] = None,
+                       collections: Optional[list[str]] = None) -> list[list[Document]]:
+        """
+        Truy van song song cac collection (tat ca hoac tap con `collections`), moi collection top-k,
+        roi ghep theo do tuong dong cosine. Tra ve list[list[Document]] theo thu tu query.
+        """
+        def search_collection(collection_name: str) -> list[list[Document]]:
+            try:
+                results, space = self._query_vectors(query_embeddings, k, where, collection_name)
+                return [tag_collection_documents(query_results_to_documents(results, q_idx, space), collection_name)
+                        for q_idx in range(len(query_embeddings))]
+            except Exception as e:
+                print(f"ERROR: Loi khi truy van collection '{collection_name}': {e}")
+                return [[] for _ in query_embeddings]
+
+        per_collection = self._fan_out(search_collection, self.collection_names(collections))
+        return [merge_collection_results([docs[q_idx] for docs in per_collection], k, 'similarity')
+                for q_idx in range(len(query_embeddings))]
+
+    def load_bm25_index(self, collection_name: Optional[str] = None) -> BM25Index | None:
+        """
+        Tai chi muc BM25 (memory-map) cua snapshot hien tai.
+        Instance duoc giu lai cho den khi co snapshot moi (pipeline da build lai).
+        """
+        collection_name = collection_name or self._collection_name
+        current_version = self.current_index_version(collection_name)
+        loaded_version, bm25_index = VectorStoreManager._bm25_indexes.get(collection_name, (None, None))
+        if loaded_version != current_version:
+            index_path = get_index_paths(current_version, collection_name)["bm25"]
+            bm25_index = BM25Index.load(index_path) if index_path else None
+            VectorStoreManager._bm25_indexes[collection_name] = (current_version, bm25_index)
+        return bm25_index
+
+    def get_source_router(self, collections: Optional[list[str]] = None) -> SourceRouter | None:
+        """
+        Source router cua snapshot hien tai cua cac collection, xay tu cac chunk cua BM25 index
+        (hoac cua collection neu khong co BM25). Instance duoc giu lai cho den khi co snapshot moi;
+        tra ve None neu bi tat trong Config hoac snapshot rong.
+        """
+        if not Config.SOURCE_ROUTER_ENABLED:
+            return None
+        collection_names = tuple(self.collection_names(collections))
+        current_versions = tuple(self.current_index_version(name) for name in collection_names)
+        loaded_versions, source_router = VectorStoreManager._source_routers.get(collection_names, (None, None))
+        if loaded_versions == current_versions:
+            return source_router
+
+        # Sau khi chuyen snapshot chi mot request xay lai router, cac request khac cho va dung ket qua
+        with VectorStoreManager._source_router_lock:
+            loaded_versions, source_router = VectorStoreManager._source_routers.get(collection_names, (None, None))
+            if loaded_versions == current_versions:
+                return source_router
+            source_router = None
+            try:
+                texts, metadatas = [], []
+                for collection_name in collection_names:
+                    bm25_index = self.load_bm25_index(collection_name)
+                    if bm25_index is not None:
+                        texts += bm25_index.texts
+                        metadatas += bm25_index.metadatas
+                        continue
+                    collection = self.get_current_collection(collection_name)
+                    stored = collection.get(include=['documents', 'metadatas']) if collection is not None else {}
+                    texts += stored.get('documents') or []
+                    metadatas += stored.get('metadatas') or []
+                if texts:
+                    source_router = SourceRouter.build(
+                        texts, metadatas,
+                        terms_per_source=Config.SOURCE_ROUTER_TERMS_PER_SOURCE,
+                        min_score=Config.SOURCE_ROUTER_MIN_SCORE,
+                        relative_score=Config.SOURCE_ROUTER_RELATIVE_SCORE
+                    )
+            except Exception as e:
+                print(f"ERROR: Loi khi xay source router: {e}")
+            VectorStoreManager._source_routers[collection_names] = (current_versions, source_router)
+        return source_router
+
+    def get_lexical_retriever(self) -> Optional[Callable]:
+        """
+        Tao ham retriever theo lo dung BM25: nhan list query string, tra ve list[list[Document]] theo thu tu query.
+        Cac collection duoc tim song song va ghep theo diem BM25. Tra ve None neu BM25 bi tat trong Config.
+        """
+        if not Config.BM25_ENABLED:
+            print("BM25 bi tat trong Config. Chi dung tim kiem vector.")
+            return None
+
+        def lexical_retriever_function(queries: list[str], k: int = Config.BM25_TOP_K, where: Optional[dict] = None,
+                                       collections: Optional[list[str]] = None) -> list[list[Document]]:
+            def search_collection(collection_name: str) -> list[list[Document]]:
+                bm25_index = self.load_bm25_index(collection_name)
+                if bm25_index is None:
+                    return [[] for _ in queries]
+                try:
+                    return [tag_collection_documents(bm25_index.search(query, k, where), collection_name)
+                            for query in queries]
+                except Exception as e:
+                    print(f"ERROR: Loi khi thuc hien BM25 retrieval tren collection '{collection_name}': {e}")
+                    return [[] for _ in queries]
+
+            # Diem BM25 cua cac collection khac nhau tinh theo IDF rieng, chi so sanh gan dung khi ghep
+            per_collection = self._fan_out(search_collection, self.collection_names(collections))
+            return [merge_collection_results([docs[q_idx] for docs in per_collection], k, 'bm25_score')
+                    for q_idx in range(len(queries))]
+
+        print("Da tao ham BM25 Retriever thanh cong.")
+        return lexical_retriever_function
 
     def get_retriever_from_collection(self, collection: Collection, embeddings) -> Optional[Callable]:
         """
         Tao mot ham retriever tu Chroma Collection.
-        Ham retriever nay se nhan vao query string va tra ve list of Document.
+        Ham retriever nay se nhan vao query string (va bo loc metadata where, tap con collections tuy chon)
+        va tra ve list of Document.
+        Moi lan truy van dung collection cua snapshot dang cong bo (collection truyen vao la snapshot luc tao).
         """
         print("\n--- Dang tao Retriever tu Collection ---")
         if collection is None:
@@ -128,33 +517,16 @@ class VectorStoreManager:
             print("ERROR: Embedding Model la None. Khong the tao Retriever.")
             return None
 
-        def retriever_function(query: str, k: int = 10) -> list[Document]:
-            print(f"\n--- DEBUG TEST: Dang thuc hien retrieval cho query: '{query}' (k={k}) ---")
+        def retriever_function(query: str, k: int = 10, where: Optional[dict] = None,
+                               collections: Optional[list[str]] = None) -> list[Document]:
+            print(f"\n--- DEBUG TEST: Dang thuc hien retrieval cho query: '{query}' (k={k}, where={where}) ---")
             try:
-                query_embedding = embeddings.embed_query(query)
+                query_embedding = self.embed_queries([query], embeddings)[0]
                 print("Da tao embedding cho query.")
 
-                results = collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=k,
-                    include=['documents', 'metadatas', 'distances']
-                )
-                print(
-                    f"Tim kiem trong collection hoan tat. Tim thay {len(results.get('documents', [])[0]) if results.get('documents') and results.get('documents')[0] else 0} ket qua.")
-
-                retrieved_docs = []
-                if results and results.get('documents') and results.get('documents')[0]:
-                    for i in range(len(results['documents'][0])):
-                        doc_content = results['documents'][0][i]
-                        doc_metadata = results['metadatas'][0][i] if results.get('metadatas') and \
-                                                                     results.get('metadatas')[0] else {}
-                        doc_distance = results['distances'][0][i] if results.get('distances') and \
-                                                                     results.get('distances')[0] else None
-
-                        doc = Document(page_content=doc_content, metadata=doc_metadata)
-                        retrieved_docs.append(doc)
-
-                print(f"Da chuyen doi {len(retrieved_docs)} ket qua sang Document objects.")
+                retrieved_docs = self.search_vectors([query_embedding], k, where, collections)[0]
+
+                print(f"Tim kiem trong collection hoan tat. Tim thay {len(retrieved_docs)} ket qua.")
                 return retrieved_docs
 
             except Exception as e:
@@ -163,3 +535,41 @@ class VectorStoreManager:
 
         print("Da tao ham Retriever thanh cong.")
         return retriever_function
+
+    def get_batch_retriever_from_collection(self, collection: Collection, embeddings) -> Optional[Callable]:
+        """
+        Tao mot ham retriever theo lo (batch) tu Chroma Collection.
+        Ham nay nhan vao list query string, embed tat ca bang mot lan goi embed_documents
+        va gui mot lan collection.query voi nhieu vector (cung bo loc where) cho moi collection.
+        Tra ve list[list[Document]] theo thu tu query.
+        """
+        print("\n--- Dang tao Batch Retriever tu Collection ---")
+        if collection is None:
+            print("ERROR: Collection la None. Khong the tao Batch Retriever.")
+            return None
+        if embeddings is None:
+            print("ERROR: Embedding Model la None. Khong the tao Batch Retriever.")
+            return None
+
+        def batch_retriever_function(queries: list[str], k: int = 10, where: Optional[dict] = None,
+                                     collections: Optional[list[str]] = None) -> list[list[Document]]:
+            if not queries:
+                return []
+            print(f"\n--- DEBUG TEST: Dang thuc hien batch retrieval cho {len(queries)} query (k={k}) ---")
+            try:
+                # embed_documents chay mot forward pass cho ca lo cac query chua co trong cache;
+                # voi normalize_embeddings=True ket qua giong embed_query cho tung query.
+                query_embeddings = self.embed_queries(queries, embeddings)
+                print(f"Da tao {len(query_embeddings)} embedding cho cac query.")
+
+                batched_docs = self.search_vectors(query_embeddings, k, where, collections)
+
+                print(f"Batch retrieval hoan tat. So ket qua moi query: {[len(d) for d in batched_docs]}")
+                return batched_docs
+
+            except Exception as e:
+                print(f"ERROR: Loi khi thuc hien batch retrieval: {e}")
+                return [[] for _ in queries]
+
+        print("Da tao ham Batch Retriever thanh cong.")
+        return batch_retriever_function
@@ -10,6 +10,7 @@ from typing import List, Optional
 
 from app.models.chat_session import ChatSession
 from app.models.message import Message
+from app.models.message_validation import MessageValidation
 
 from app.repositories.interfaces.i_chat_repository import IChatRepository
 
@@ -132,6 +133,45 @@ class SQLAlchemyChatRepository(IChatRepository):
 
             return new_message
 
+    def save_message_validation(self, message_id: int, validation: dict) -> MessageValidation:
+        """Luu ket qua cham diem chat luong cho mot tin nhan cua bot."""
+        logger.debug(f"save_message_validation called for message_id: {message_id}")
+
+        db_session_instance: Optional[Session] = None
+        try:
+            db_session_instance = self.db_session_factory()
+            scores = validation.get('scores') or {}
+
+            new_validation = MessageValidation(
+                message_id=message_id,
+                accuracy=scores.get('accuracy'),
+                relevance=scores.get('relevance'),
+                completeness=scores.get('completeness'),
+                clarity=scores.get('clarity'),
+                helpfulness=scores.get('helpfulness'),
+                total_score=validation.get('total_score', 0),
+                quality_level=validation.get('quality_level', 'unknown'),
+                feedback=validation.get('feedback'),
+                should_improve=bool(validation.get('should_improve', False))
+            )
+            db_session_instance.add(new_validation)
+            db_session_instance.commit()
+
+            db_session_instance.refresh(new_validation)
+
+            logger.info(f"MessageValidation saved for message_id {message_id}.")
+            return new_validation
+
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu MessageValidation trong repo: {e}", exc_info=True)
+            if db_session_instance:
+                db_session_instance.rollback()
+            raise e
+        finally:
+            if db_session_instance:
+                db_session_instance.close()
+                logger.debug("Session instance đóng trong save_message_validation.")
+
     def get_messages_by_session_id(self, session_id: int) -> List[Message]:
         logger.debug(f"get_messages_by_session_id called for session_id: {session_id}")
         db_session_instance: Optional[Session] = None
@@ -152,6 +192,28 @@ class SQLAlchemyChatRepository(IChatRepository):
                 db_session_instance.close()
                 logger.debug("Session instance đóng trong get_messages_by_session_id.")
 
+    def get_recent_messages_by_session_id(self, session_id: int, limit: int) -> List[Message]:
+        """Get the last `limit` messages of a session, oldest first"""
+        logger.debug(f"get_recent_messages_by_session_id called for session_id: {session_id}, limit: {limit}")
+        db_session_instance: Optional[Session] = None
+        try:
+            db_session_instance = self.db_session_factory()
+            messages = db_session_instance.query(Message) \
+                .filter_by(session_id=session_id) \
+                .order_by(Message.timestamp.desc(), Message.id.desc()) \
+                .limit(limit) \
+                .all()
+            messages.reverse()
+            logger.debug(f"Found {len(messages)} recent messages for session_id {session_id}.")
+            return messages
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy tin nhắn gần nhất theo session ID trong repo: {e}", exc_info=True)
+            return []
+        finally:
+            if db_session_instance:
+                db_session_instance.close()
+                logger.debug("Session instance đóng trong get_recent_messages_by_session_id.")
+
     def get_all_sessions_by_user_id(self, user_id: int) -> List[ChatSession]:
         """Get all chat sessions for a specific user"""
         logger.debug(f"get_all_sessions_by_user_id called for user_id: {user_id}")
@@ -185,7 +247,13 @@ class SQLAlchemyChatRepository(IChatRepository):
         try:
             db_session_instance = self.db_session_factory()
 
-            # First delete all messages in the session
+            # First delete quality scores attached to the session's messages
+            message_ids = db_session_instance.query(Message.id).filter_by(session_id=session_id)
+            db_session_instance.query(MessageValidation) \
+                .filter(MessageValidation.message_id.in_(message_ids.scalar_subquery())) \
+                .delete(synchronize_session=False)
+
+            # Then delete all messages in the session
             messages_deleted = db_session_instance.query(Message) \
                 .filter_by(session_id=session_id) \
                 .delete()
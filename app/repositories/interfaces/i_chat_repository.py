@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from app.models.chat_session import ChatSession
 from app.models.message import Message
+from app.models.message_validation import MessageValidation
 
 
 class IChatRepository(ABC):
@@ -23,10 +24,18 @@ class IChatRepository(ABC):
     def save_message(self, session_id: int, sender_type: str, content: str) -> Message:
         pass
 
+    @abstractmethod
+    def save_message_validation(self, message_id: int, validation: dict) -> MessageValidation:
+        pass
+
     @abstractmethod
     def get_messages_by_session_id(self, session_id: int) -> List[Message]:
         pass
 
+    @abstractmethod
+    def get_recent_messages_by_session_id(self, session_id: int, limit: int) -> List[Message]:
+        pass
+
     @abstractmethod
     def get_all_sessions_by_user_id(self, user_id: int) -> List[ChatSession]:
         pass
@@ -4,7 +4,9 @@ from datetime import datetime
 import pytz
 from types import SimpleNamespace
 
+from app.core.config import Config
 from app.models.chat_session import ChatSession
+from app.rag.async_runner import run_coroutine_sync
 from app.repositories.implementations.sqlalchemy_chat_repository import SQLAlchemyChatRepository
 # Import ChatbotService (vẫn cần để khai báo kiểu dữ liệu)
 from app.services.chatbot_service import ChatbotService
@@ -16,27 +18,18 @@ class ChatService:
         self.chat_repository = chat_repository
         self.chatbot_service = chatbot_service  # Gán instance chatbot_service được truyền vào
 
-    def process_user_message(self, user_id: int, user_message: str, session_id: int = None):
+    def process_user_message(self, user_id: int, user_message: str, session_id: int = None, collections: list = None):
         print(
             f"Calling ChatService.process_user_message for user {user_id} with input '{user_message}' and session_id {session_id}.")
 
         # 1. Lấy hoặc tạo session
-        session_obj = None
-        if session_id:
-            session_obj = self.chat_repository.get_session_by_id(session_id)
-            if not session_obj:
-                # Nếu session_id không hợp lệ, tạo session mới
-                session_obj = self.chat_repository.create_session(user_id)
-                print(
-                    f"WARNING: Session ID {session_id} khong hop le hoac khong ton tai. Tao session moi voi ID: {session_obj.id}")
-        else:
-            session_obj = self.chat_repository.create_session(user_id)
-            print(f"Tao session moi voi ID: {session_obj.id}")
+        session_obj = self._get_or_create_session(user_id, session_id)
 
         # 2. Lưu tin nhắn người dùng vào lịch sử chat
         self.chat_repository.save_message(session_obj.id, "user", user_message)
         print(f"Tin nhắn người dùng đã lưu thành công.")  # 3. Gọi chatbot để lấy phản hồi
         bot_response_content = ""
+        advanced_result = None
         try:
             # Lấy RAG Chain từ chatbot_service đã được inject
             rag_chain = self.chatbot_service.get_rag_chain_instance()
@@ -52,8 +45,15 @@ class ChatService:
 
                 # Gọi RAG chain với input phù hợp
                 if chatbot_info['type'] == 'Advanced RAG':
-                    # Advanced RAG chỉ cần string input
-                    response = rag_chain.invoke(user_message)
+                    # Advanced RAG chỉ cần string input; xác thực chất lượng được lên lịch sau khi lưu tin nhắn
+                    if Config.RAG_ASYNC_PIPELINE_ENABLED:
+                        advanced_result = run_coroutine_sync(
+                            rag_chain.ainvoke_with_details(user_message, conversation_id=session_obj.id,
+                                                           collections=collections))
+                    else:
+                        advanced_result = rag_chain.invoke_with_details(user_message, conversation_id=session_obj.id,
+                                                                        collections=collections)
+                    response = advanced_result["response"]
                 else:
                     # Basic RAG cần dict input
                     response = rag_chain.invoke({"question": user_message})
@@ -69,7 +69,13 @@ class ChatService:
             print(f"ERROR: Loi khi goi RAG Chain.invoke(): {e}")
 
         # 4. Lưu phản hồi của chatbot vào lịch sử chat
-        self.chat_repository.save_message(session_obj.id, "bot", bot_response_content)  # 5. Trả về kết quả
+        bot_message = self.chat_repository.save_message(session_obj.id, "bot", bot_response_content)
+
+        # 5. Lưu điểm chất lượng cạnh tin nhắn của bot (tự đánh giá của lean mode hoặc xác thực nền)
+        if advanced_result is not None:
+            self._record_response_quality(advanced_result, user_message, bot_response_content, bot_message.id)
+
+        # 6. Trả về kết quả
         vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
         current_time = datetime.now(vietnam_tz)
         return {
@@ -79,6 +85,102 @@ class ChatService:
             "timestamp": current_time.isoformat()
         }
 
+    def stream_user_message(self, user_id: int, user_message: str, session_id: int = None, collections: list = None):
+        """
+        Phiên bản streaming của process_user_message.
+        Session và tin nhắn người dùng được xử lý ngay; trả về (session_id, generator) trong đó generator
+        yield từng đoạn token của phản hồi và lưu toàn bộ phản hồi vào DB khi stream kết thúc.
+        """
+        print(
+            f"Calling ChatService.stream_user_message for user {user_id} with input '{user_message}' and session_id {session_id}.")
+
+        session_obj = self._get_or_create_session(user_id, session_id)
+        self.chat_repository.save_message(session_obj.id, "user", user_message)
+        print(f"Tin nhắn người dùng đã lưu thành công.")
+
+        def token_generator():
+            response_parts = []
+            advanced_result = {}
+            completed = False
+            try:
+                rag_chain = self.chatbot_service.get_rag_chain_instance()
+                if rag_chain is None:
+                    print("ERROR: get_rag_chain() tra ve None. RAG Chain khong the khoi tao.")
+                    chunks = iter(["RAG Chain khong the khoi tao. Vui long thu lai sau."])
+                elif self.chatbot_service.get_chatbot_info()['type'] == 'Advanced RAG':
+                    chunks = rag_chain.stream_with_details(user_message, advanced_result,
+                                                           conversation_id=session_obj.id, collections=collections)
+                else:
+                    chunks = rag_chain.stream({"question": user_message})
+
+                for chunk in chunks:
+                    response_parts.append(chunk)
+                    yield chunk
+                completed = True
+
+            except Exception as e:
+                error_text = f"Đã xảy ra lỗi khi xử lý yêu cầu của bạn: {e}"
+                print(f"ERROR: Loi khi goi RAG Chain.stream(): {e}")
+                response_parts.append(error_text)
+                yield error_text
+
+            finally:
+                # Lưu phản hồi (kể cả khi client ngắt kết nối giữa chừng) để lịch sử chat đầy đủ
+                bot_response_content = "".join(response_parts)
+                if bot_response_content:
+                    bot_message = self.chat_repository.save_message(session_obj.id, "bot", bot_response_content)
+                    if completed and advanced_result:
+                        self._record_response_quality(advanced_result, user_message, bot_response_content,
+                                                      bot_message.id)
+
+        return session_obj.id, token_generator()
+
+    def _get_or_create_session(self, user_id: int, session_id: int = None) -> ChatSession:
+        """Lấy session theo ID, tạo session mới nếu không có hoặc không hợp lệ"""
+        if session_id:
+            session_obj = self.chat_repository.get_session_by_id(session_id)
+            if not session_obj:
+                # Nếu session_id không hợp lệ, tạo session mới
+                session_obj = self.chat_repository.create_session(user_id)
+                print(
+                    f"WARNING: Session ID {session_id} khong hop le hoac khong ton tai. Tao session moi voi ID: {session_obj.id}")
+        else:
+            session_obj = self.chat_repository.create_session(user_id)
+            print(f"Tao session moi voi ID: {session_obj.id}")
+        return session_obj
+
+    def _record_response_quality(self, advanced_result: dict, user_message: str, bot_response_content: str,
+                                 message_id: int):
+        """
+        Lưu điểm chất lượng của phản hồi Advanced RAG vào bảng message_validations.
+        Lean mode đã có độ tin cậy tự đánh giá nên lưu ngay; full mode gửi vào worker xác thực nền.
+        Phản hồi lấy từ semantic cache hoặc bị lỗi thì bỏ qua.
+        """
+        if not advanced_result.get("success") or advanced_result.get("cached"):
+            return
+
+        self_assessment = advanced_result.get("self_assessment")
+        if self_assessment is not None:
+            try:
+                self.chat_repository.save_message_validation(message_id, self_assessment)
+            except Exception as e:
+                print(f"ERROR: Loi khi luu ket qua tu danh gia cho message {message_id}: {e}")
+            return
+
+        rag_chain = self.chatbot_service.get_rag_chain_instance()
+        context = advanced_result["context"]
+
+        def persist_validation(validation):
+            try:
+                self.chat_repository.save_message_validation(message_id, validation)
+            except Exception as e:
+                print(f"ERROR: Loi khi luu ket qua validation cho message {message_id}: {e}")
+
+        try:
+            rag_chain.schedule_validation(user_message, bot_response_content, context, persist_validation)
+        except Exception as e:
+            print(f"ERROR: Loi khi len lich validation cho message {message_id}: {e}")
+
     def get_chat_history(self, session_id: int):
         # Lấy lịch sử tin nhắn của một session cụ thể
         messages = self.chat_repository.get_messages_by_session_id(session_id)
@@ -115,10 +217,10 @@ class ChatService:
                 return self.get_chat_history(latest_session.id)
             return []
 
-    def reset_chatbot_conversation_history(self):
-        """Reset lịch sử hội thoại của chatbot (chỉ dành cho Advanced RAG)"""
+    def reset_chatbot_conversation_history(self, session_id: int):
+        """Reset lịch sử hội thoại của chatbot cho một phiên chat (chỉ dành cho Advanced RAG)"""
         try:
-            self.chatbot_service.reset_conversation_history()
+            self.chatbot_service.reset_conversation_history(session_id)
             return {"status": "success", "message": "Đã reset lịch sử hội thoại chatbot"}
         except Exception as e:
             print(f"ERROR khi reset conversation history: {e}")
@@ -1,7 +1,30 @@
 # app/services/chatbot_service.py
 
+from langchain_core.messages import HumanMessage, AIMessage
+
+from app.core.config import Config
+from app.core.database import SessionLocal
+from app.repositories.implementations.sqlalchemy_chat_repository import SQLAlchemyChatRepository
+from app.rag.embedding_batcher import get_query_embedder
+from app.rag.embedding_registry import EmbeddingModelRegistry
 from app.rag.rag_chain import get_rag_chain # Import ham get_rag_chain
-from app.rag.advanced_rag_chain import get_advanced_rag_chain # Import advanced RAG chain
+from app.rag.advanced_rag_chain import get_advanced_rag_chain, DEFAULT_CONVERSATION_ID, \
+    PIPELINE_MODE_LEAN # Import advanced RAG chain
+
+
+def load_conversation_from_db(conversation_id, limit: int):
+    """
+    Nap lai lich su hoi thoai tu bang messages cho memory store cua Advanced RAG.
+    Chi ap dung cho chat session id (so nguyen); phien cua khach khong duoc luu nen tra ve rong.
+    """
+    if not isinstance(conversation_id, int) or SessionLocal is None:
+        return []
+
+    chat_repo_instance = SQLAlchemyChatRepository(db_session_factory=SessionLocal)
+    messages = chat_repo_instance.get_recent_messages_by_session_id(conversation_id, limit)
+    return [HumanMessage(content=msg.content) if msg.sender_type == "user" else AIMessage(content=msg.content)
+            for msg in messages]
+
 
 class ChatbotService:
     _rag_chain_instance = None # Bien lop de luu tru instance RAG Chain (Singleton)
@@ -20,7 +43,7 @@ class ChatbotService:
             # Thử sử dụng Advanced RAG Chain trước
             if ChatbotService._advanced_rag_instance is None:
                 print("Dang thu khoi tao Advanced RAG Chain...")
-                ChatbotService._advanced_rag_instance = get_advanced_rag_chain()
+                ChatbotService._advanced_rag_instance = get_advanced_rag_chain(history_loader=load_conversation_from_db)
                 
             if ChatbotService._advanced_rag_instance:
                 print("Sử dụng Advanced RAG Chain.")
@@ -44,34 +67,63 @@ class ChatbotService:
     def get_chatbot_info(self):
         """Lấy thông tin về loại chatbot đang sử dụng"""
         if self._use_advanced_rag and ChatbotService._advanced_rag_instance:
+            pipeline_mode = ChatbotService._advanced_rag_instance.pipeline_mode
+            if pipeline_mode == PIPELINE_MODE_LEAN:
+                features = [
+                    "Local Query Rewrite",
+                    "Hybrid Search",
+                    "Conversation Context",
+                    "Single-call Answer + Self-assessed Confidence",
+                    "Semantic Cache"
+                ]
+            else:
+                features = [
+                    "Query Expansion",
+                    "Hybrid Search",
+                    "Conversation Context",
+                    "Response Validation (background)",
+                    "Quality Scoring",
+                    "Semantic Cache"
+                ]
             return {
                 "type": "Advanced RAG",
-                "features": [
-                    "Query Expansion", 
-                    "Hybrid Search", 
-                    "Conversation Context",
-                    "Response Validation",
-                    "Quality Scoring"
-                ],
+                "mode": pipeline_mode,
+                "features": features,
+                "conversation_memory": ChatbotService._advanced_rag_instance.memory_store.get_stats(),
+                "validation": ChatbotService._advanced_rag_instance.validation_worker.get_stats(),
+                "query_expansion_cache": ChatbotService._advanced_rag_instance.expansion_cache.get_stats(),
+                "semantic_cache": ChatbotService._advanced_rag_instance.answer_cache.get_stats()
+                if ChatbotService._advanced_rag_instance.answer_cache else None,
+                "query_embedding_cache":
+                    ChatbotService._advanced_rag_instance.vector_store_manager.get_query_embedding_cache_stats(),
+                "embedding_models": EmbeddingModelRegistry.get_stats(),
+                "embedding_batching": self._get_embedding_batching_stats(),
+                "collections": Config.VECTOR_COLLECTIONS,
                 "description": "Chatbot thông minh với các tính năng nâng cao"
             }
         else:
             return {
                 "type": "Basic RAG", 
                 "features": ["Document Retrieval", "Basic Response Generation"],
+                "embedding_models": EmbeddingModelRegistry.get_stats(),
                 "description": "Chatbot cơ bản với tính năng truy xuất tài liệu"
             }
 
-    def reset_conversation_history(self):
-        """Reset lịch sử hội thoại của Advanced RAG"""
+    def _get_embedding_batching_stats(self):
+        """Thống kê gom lô embedding truy vấn (None nếu không bật micro-batching / embedding server)"""
+        query_embedder = get_query_embedder()
+        return query_embedder.get_stats() if hasattr(query_embedder, 'get_stats') else None
+
+    def reset_conversation_history(self, conversation_id=DEFAULT_CONVERSATION_ID):
+        """Reset lịch sử hội thoại của một phiên trong Advanced RAG"""
         if ChatbotService._advanced_rag_instance:
-            ChatbotService._advanced_rag_instance.conversation_history = []
-            print("Đã reset lịch sử hội thoại.")
+            ChatbotService._advanced_rag_instance.reset_conversation_history(conversation_id)
+            print(f"Đã reset lịch sử hội thoại của phiên {conversation_id}.")
     
-    def reset_conversation(self):
+    def reset_conversation(self, conversation_id=DEFAULT_CONVERSATION_ID):
         """Reset conversation and clear memory"""
         try:
-            self.reset_conversation_history()
+            self.reset_conversation_history(conversation_id)
             
             # If using advanced RAG, also reset any additional state
             if self._use_advanced_rag and ChatbotService._advanced_rag_instance:
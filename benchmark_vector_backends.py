@@ -0,0 +1,52 @@
+import argparse
+
+import chromadb
+
+from app.core.config import Config
+from app.rag.index_version import get_index_paths
+from app.rag.numpy_vector_index import NumpyVectorIndex
+from app.rag.retrieval_benchmark import exact_top_k_ids, measure_search, sample_query_embeddings
+
+
+def run_benchmark(num_queries: int, k: int, dtype: str, collection_name: str = Config.DEFAULT_COLLECTION_NAME):
+    """
+    So sanh Chroma (HNSW) va NumPy exact search tren cung collection:
+    do tre p50/p99 (mot truy van va theo lo) va recall@k cua moi backend so voi ket qua chinh xac (float32).
+    """
+    chroma_path = get_index_paths(collection_name=collection_name)["chroma"]
+    if not chroma_path:
+        print(f"ERROR: Collection '{collection_name}' chua co snapshot nao duoc cong bo.")
+        return {}
+    client = chromadb.PersistentClient(path=chroma_path)
+    collection = client.get_collection(name=collection_name)
+    exact_index = NumpyVectorIndex.from_collection(collection, "float32")
+    numpy_index = exact_index if dtype == "float32" else NumpyVectorIndex.from_collection(collection, dtype)
+    print(f"Collection co {len(exact_index.ids)} chunk, k={k}, dtype NumPy index={dtype}.")
+
+    query_embeddings = sample_query_embeddings(exact_index, num_queries)
+    exact_ids = exact_top_k_ids(exact_index, query_embeddings, k)
+
+    report = {
+        "chroma": measure_search(
+            lambda embeddings: collection.query(query_embeddings=embeddings, n_results=k,
+                                                include=['documents', 'metadatas', 'distances']),
+            query_embeddings, exact_ids, k),
+        "numpy": measure_search(
+            lambda embeddings: numpy_index.query(embeddings, n_results=k),
+            query_embeddings, exact_ids, k),
+    }
+
+    for name, metrics in report.items():
+        print(f"{name}: {metrics}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sanh do tre va recall cua Chroma va NumPy exact search.")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default=Config.NUMPY_INDEX_DTYPE)
+    parser.add_argument("--collection", default=Config.DEFAULT_COLLECTION_NAME)
+    args = parser.parse_args()
+
+    run_benchmark(args.num_queries, args.k, args.dtype, args.collection)
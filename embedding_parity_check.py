@@ -0,0 +1,15 @@
+import argparse
+
+from app.core.config import Config
+from app.rag.embedding_parity import check_embedding_parity
+from app.rag.embedding_registry import EMBEDDING_BACKENDS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sanh vector cua mot backend embedding voi vector da luu trong Chroma.")
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=Config.EMBEDDING_BACKEND)
+    parser.add_argument("--sample-size", type=int, default=200)
+    parser.add_argument("--collection", default=Config.DEFAULT_COLLECTION_NAME,
+                        help="Collection can kiem tra (mac dinh: collection mac dinh).")
+    args = parser.parse_args()
+
+    check_embedding_parity(args.backend, args.sample_size, args.collection)
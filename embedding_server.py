@@ -0,0 +1,4 @@
+from app.rag.embedding_batcher import serve_embeddings
+
+if __name__ == "__main__":
+    serve_embeddings()
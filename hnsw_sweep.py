@@ -0,0 +1,76 @@
+import argparse
+import itertools
+import tempfile
+import time
+
+import chromadb
+
+from app.core.config import Config
+from app.rag.document_processor import get_hnsw_collection_metadata
+from app.rag.index_version import get_index_paths
+from app.rag.numpy_vector_index import NumpyVectorIndex
+from app.rag.retrieval_benchmark import exact_top_k_ids, measure_search, sample_query_embeddings
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def run_sweep(spaces: list, m_values: list, ef_construction_values: list, ef_search_values: list,
+              num_queries: int, k: int, collection_name: str = Config.DEFAULT_COLLECTION_NAME):
+    """
+    Build lai collection hien tai (trong thu muc tam) voi tung to hop tham so HNSW,
+    bao cao thoi gian build, recall@k so voi tim kiem chinh xac va do tre p50/p99.
+    """
+    source_path = get_index_paths(collection_name=collection_name)["chroma"]
+    if not source_path:
+        print(f"ERROR: Collection '{collection_name}' chua co snapshot nao duoc cong bo.")
+        return []
+    source_client = chromadb.PersistentClient(path=source_path)
+    source_collection = source_client.get_collection(name=collection_name)
+    stored = source_collection.get(include=['documents', 'metadatas', 'embeddings'])
+    exact_index = NumpyVectorIndex.build(stored['ids'], stored['documents'], stored['metadatas'], stored['embeddings'])
+    print(f"Collection co {len(exact_index.ids)} chunk, k={k}, {num_queries} truy van.")
+
+    query_embeddings = sample_query_embeddings(exact_index, num_queries)
+    exact_ids = exact_top_k_ids(exact_index, query_embeddings, k)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as sweep_directory:
+        client = chromadb.PersistentClient(path=sweep_directory)
+        for space, m, ef_construction, ef_search in itertools.product(
+                spaces, m_values, ef_construction_values, ef_search_values):
+            name = f"sweep_{space}_m{m}_efc{ef_construction}_efs{ef_search}"
+            start_time = time.perf_counter()
+            collection = client.create_collection(
+                name=name, metadata=get_hnsw_collection_metadata(space, m, ef_construction, ef_search))
+            collection.add(ids=stored['ids'], embeddings=stored['embeddings'], documents=stored['documents'],
+                           metadatas=stored['metadatas'])
+            build_seconds = time.perf_counter() - start_time
+
+            metrics = measure_search(
+                lambda embeddings: collection.query(query_embeddings=embeddings, n_results=k,
+                                                    include=['documents', 'metadatas', 'distances']),
+                query_embeddings, exact_ids, k)
+            row = {"space": space, "M": m, "ef_construction": ef_construction, "ef_search": ef_search,
+                   "build_s": round(build_seconds, 2), **metrics}
+            rows.append(row)
+            print(row)
+            client.delete_collection(name)
+
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quet tham so HNSW cua Chroma: recall@k va do tre p50/p99.")
+    parser.add_argument("--spaces", default="cosine,ip,l2")
+    parser.add_argument("--m", default="8,16,32")
+    parser.add_argument("--ef-construction", default="100,200")
+    parser.add_argument("--ef-search", default="10,50,100")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--collection", default=Config.DEFAULT_COLLECTION_NAME)
+    args = parser.parse_args()
+
+    run_sweep(parse_list(args.spaces), parse_list(args.m, int), parse_list(args.ef_construction, int),
+              parse_list(args.ef_search, int), args.num_queries, args.k, args.collection)
@@ -1,5 +1,18 @@
+import argparse
+
+from app.core.config import Config
 from app.rag.document_processor import process_document_pipeline
 
 if __name__ == "__main__":
-    process_document_pipeline()
+    parser = argparse.ArgumentParser(description="Xu ly tai lieu va cap nhat mot collection (snapshot rieng).")
+    parser.add_argument("--collection", default=Config.DEFAULT_COLLECTION_NAME,
+                        help="Ten collection can build lai (them vao VECTOR_COLLECTIONS de worker truy van)")
+    parser.add_argument("--data-dir", default=Config.DATA_DIRECTORY, help="Thu muc tai lieu cua collection")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Bo qua manifest, load/chia chunk/embed lai toan bo file")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bo qua cache chuyen doi (docling/OCR), chuyen doi lai moi file/trang")
+    args = parser.parse_args()
 
+    process_document_pipeline(data_dir=args.data_dir, collection_name=args.collection,
+                              full_rebuild=args.full_rebuild, use_cache=False if args.no_cache else None)
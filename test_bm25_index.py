@@ -0,0 +1,88 @@
+# test_bm25_index.py
+
+import os
+import sys
+import unicodedata
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.rag.bm25_index import BM25Index, tokenize_vietnamese
+
+CHUNK_IDS = ["c0", "c1", "c2"]
+TEXTS = [
+    "Sinh viên được cấp chứng chỉ ngoại ngữ khi đạt điều kiện.",
+    "Học bổng khuyến khích học tập xét theo điểm trung bình học kỳ.",
+    "Điều 5. Sinh viên ở ký túc xá đóng phí theo học kỳ.",
+]
+METADATAS = [
+    {"source_file": "ngoai_ngu.pdf"},
+    {"source_file": "hoc_bong.docx"},
+    {"source_file": "ky_tuc_xa.pdf"},
+]
+
+
+def build_index() -> BM25Index:
+    return BM25Index.build(CHUNK_IDS, TEXTS, METADATAS)
+
+
+def chunk_ids(docs) -> list:
+    return [doc.metadata["chunk_id"] for doc in docs]
+
+
+def test_tokenize_vietnamese_adds_syllable_bigrams():
+    assert tokenize_vietnamese("Chứng chỉ, Điều 5") == ["chứng", "chỉ", "điều", "5", "chứng_chỉ", "chỉ_điều",
+                                                        "điều_5"]
+
+
+def test_tokenize_vietnamese_normalizes_unicode():
+    # Chu viet dang to hop (NFD) va dung san (NFC) cho cung token
+    assert tokenize_vietnamese(unicodedata.normalize("NFD", "Học Bổng")) == ["học", "bổng", "học_bổng"]
+
+
+def test_search_ranks_matching_chunks():
+    index = build_index()
+    results = index.search("học bổng khuyến khích", k=3)
+    assert chunk_ids(results)[0] == "c1"
+    assert results[0].metadata["source_file"] == "hoc_bong.docx"
+    assert results[0].metadata["bm25_score"] > 0
+    # Chunk khong chua tu nao cua truy van khong duoc tra ve
+    assert "c0" not in chunk_ids(results)
+
+
+def test_search_with_where_filter():
+    index = build_index()
+    results = index.search("sinh viên học kỳ", k=3, where={"source_file": {"$in": ["ky_tuc_xa.pdf"]}})
+    assert chunk_ids(results) == ["c2"]
+
+
+def test_save_and_memory_mapped_load(tmp_path):
+    index = build_index()
+    index.save(str(tmp_path / "bm25"))
+
+    loaded = BM25Index.load(str(tmp_path / "bm25"))
+    assert loaded is not None
+    assert isinstance(loaded.postings_docs, np.memmap)
+    assert isinstance(loaded.idf, np.memmap)
+    assert loaded.vocab == index.vocab
+
+    query = "điều 5 ký túc xá"
+    expected = index.search(query, k=3)
+    actual = loaded.search(query, k=3)
+    assert chunk_ids(actual) == chunk_ids(expected)
+    assert [doc.metadata["bm25_score"] for doc in actual] == [doc.metadata["bm25_score"] for doc in expected]
+
+
+def test_load_missing_index_returns_none(tmp_path):
+    assert BM25Index.load(str(tmp_path / "khong_co")) is None
+
+
+def test_empty_corpus(tmp_path):
+    index = BM25Index.build([], [], [])
+    assert index.search("học bổng") == []
+
+    index.save(str(tmp_path / "bm25"))
+    loaded = BM25Index.load(str(tmp_path / "bm25"))
+    assert loaded is not None
+    assert loaded.search("học bổng") == []
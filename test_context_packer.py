@@ -0,0 +1,78 @@
+# test_context_packer.py
+
+import os
+import sys
+
+import pytest
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import Config
+from app.rag.context_packer import estimate_tokens, pack_context
+
+# Van ban goc duoc chia thanh 3 chunk chong lan nhau
+PART_1 = "Điều 1. Sinh viên phải đăng ký học phần trong thời gian quy định của trường."
+PART_2 = "trong thời gian quy định của trường. Điều 2. Điểm học phần tính theo thang điểm 10."
+PART_3 = "theo thang điểm 10. Điều 3. Sinh viên được xét học bổng mỗi học kỳ."
+FULL_TEXT = ("Điều 1. Sinh viên phải đăng ký học phần trong thời gian quy định của trường. "
+             "Điều 2. Điểm học phần tính theo thang điểm 10. Điều 3. Sinh viên được xét học bổng mỗi học kỳ.")
+
+
+@pytest.fixture(autouse=True)
+def chars_per_token(monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_CHARS_PER_TOKEN", 4)
+
+
+def chunk(chunk_id: str, text: str, source_file: str = "quy_che.pdf") -> Document:
+    return Document(page_content=text, metadata={"chunk_id": chunk_id, "source_file": source_file})
+
+
+def test_merges_adjacent_chunks_of_same_file():
+    packed = pack_context([chunk("c0", PART_1), chunk("c1", PART_2), chunk("c2", PART_3)],
+                          token_budget=1000, min_overlap=10)
+    assert [doc.page_content for doc in packed] == [FULL_TEXT]
+    assert packed[0].metadata["merged_chunk_ids"] == ["c0", "c1", "c2"]
+
+
+def test_merge_keeps_document_order_and_best_position():
+    other = chunk("x0", "Nội quy ký túc xá.", source_file="ky_tuc_xa.pdf")
+    # Chunk giua duoc tim thay truoc: doan noi giu vi tri cua no, noi dung theo thu tu trong tai lieu
+    packed = pack_context([chunk("c1", PART_2), other, chunk("c2", PART_3), chunk("c0", PART_1)],
+                          token_budget=1000, min_overlap=10)
+    assert [doc.page_content for doc in packed] == [FULL_TEXT, "Nội quy ký túc xá."]
+    assert sorted(packed[0].metadata["merged_chunk_ids"]) == ["c0", "c1", "c2"]
+
+
+def test_chunk_between_two_blocks_joins_them():
+    packed = pack_context([chunk("c0", PART_1), chunk("c2", PART_3), chunk("c1", PART_2)],
+                          token_budget=1000, min_overlap=10)
+    assert [doc.page_content for doc in packed] == [FULL_TEXT]
+
+
+def test_does_not_merge_chunks_of_different_files():
+    packed = pack_context([chunk("c0", PART_1), chunk("c1", PART_2, source_file="khac.pdf")],
+                          token_budget=1000, min_overlap=10)
+    assert [doc.page_content for doc in packed] == [PART_1, PART_2]
+
+
+def test_removes_repeated_paragraphs():
+    repeated = "Điều 5. Quy định chung."
+    packed = pack_context([chunk("c0", f"{repeated}\n\nĐoạn A.", "a.pdf"),
+                           chunk("c1", f"{repeated}\n\nĐoạn B.", "b.pdf")],
+                          token_budget=1000, min_overlap=10)
+    assert [doc.page_content for doc in packed] == [f"{repeated}\n\nĐoạn A.", "Đoạn B."]
+
+
+def test_token_budget_skips_blocks_that_do_not_fit():
+    docs = [chunk("a", "a" * 40, "a.pdf"), chunk("b", "b" * 80, "b.pdf"), chunk("c", "c" * 20, "c.pdf")]
+    # 10 + 20 + 5 token; ngan sach 16 bo qua doan 20 token nhung van them doan 5 token phia sau
+    packed = pack_context(docs, token_budget=16, min_overlap=10)
+    assert [doc.metadata["chunk_id"] for doc in packed] == ["a", "c"]
+    assert sum(estimate_tokens(doc.page_content) for doc in packed) <= 16
+
+
+def test_truncates_first_block_larger_than_budget():
+    packed = pack_context([chunk("a", "a" * 100, "a.pdf"), chunk("b", "b" * 8, "b.pdf")],
+                          token_budget=5, min_overlap=10)
+    assert [doc.page_content for doc in packed] == ["a" * 20]
@@ -0,0 +1,106 @@
+# test_conversation_memory.py
+
+import os
+import sys
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.rag.conversation_memory import ConversationMemoryStore
+
+
+class FakeHistoryLoader:
+    """Thay cho bang messages: tra ve `limit` tin nhan cuoi cua phien va ghi lai cac lan goi"""
+
+    def __init__(self, histories: dict):
+        self.histories = histories
+        self.calls = []
+
+    def __call__(self, conversation_id, limit):
+        self.calls.append((conversation_id, limit))
+        return self.histories.get(conversation_id, [])[-limit:]
+
+
+def contents(messages) -> list:
+    return [message.content for message in messages]
+
+
+def test_sessions_are_isolated():
+    store = ConversationMemoryStore(max_sessions=10, window=4)
+    store.append(1, HumanMessage(content="câu hỏi phiên 1"), AIMessage(content="trả lời phiên 1"))
+    store.append(2, HumanMessage(content="câu hỏi phiên 2"))
+
+    assert contents(store.get(1)) == ["câu hỏi phiên 1", "trả lời phiên 1"]
+    assert contents(store.get(2)) == ["câu hỏi phiên 2"]
+    assert store.get(3) == []
+
+
+def test_get_returns_copy():
+    store = ConversationMemoryStore(max_sessions=10, window=4)
+    store.append(1, HumanMessage(content="a"))
+    store.get(1).append(AIMessage(content="khong duoc luu"))
+    assert contents(store.get(1)) == ["a"]
+
+
+def test_window_keeps_latest_messages():
+    store = ConversationMemoryStore(max_sessions=10, window=3)
+    for i in range(5):
+        store.append(1, HumanMessage(content=f"h{i}"), AIMessage(content=f"a{i}"))
+    assert contents(store.get(1)) == ["a3", "h4", "a4"]
+
+
+def test_least_recently_used_session_is_evicted():
+    loader = FakeHistoryLoader({})
+    store = ConversationMemoryStore(history_loader=loader, max_sessions=2, window=4)
+    store.append(1, HumanMessage(content="1"))
+    store.append(2, HumanMessage(content="2"))
+    store.get(1)
+    store.append(3, HumanMessage(content="3"))
+
+    assert store.get_stats()["sessions"] == 2
+    # Phien 2 bi day ra, lan truy cap sau nap lai tu DB (o day rong)
+    assert store.get(2) == []
+    assert loader.calls[-1] == (2, 5)
+
+
+def test_rehydrates_completed_turns_from_db():
+    history = [HumanMessage(content="h0"), AIMessage(content="a0"), HumanMessage(content="h1"),
+               AIMessage(content="a1")]
+    loader = FakeHistoryLoader({7: history})
+    store = ConversationMemoryStore(history_loader=loader, max_sessions=10, window=2)
+
+    assert contents(store.get(7)) == ["h1", "a1"]
+    # Nap window + 1 dong de van du window tin nhan sau khi bo cau hoi chua tra loi
+    assert loader.calls == [(7, 3)]
+    # Da nap thi khong doc DB lan nua
+    store.get(7)
+    assert len(loader.calls) == 1
+
+
+def test_rehydrate_drops_trailing_unanswered_question():
+    history = [HumanMessage(content="h0"), AIMessage(content="a0"), HumanMessage(content="câu hỏi đang xử lý")]
+    store = ConversationMemoryStore(history_loader=FakeHistoryLoader({7: history}), max_sessions=10, window=2)
+    assert contents(store.get(7)) == ["h0", "a0"]
+
+
+def test_rehydrate_failure_starts_empty():
+    def failing_loader(conversation_id, limit):
+        raise RuntimeError("mat ket noi DB")
+
+    store = ConversationMemoryStore(history_loader=failing_loader, max_sessions=10, window=2)
+    assert store.get(7) == []
+
+
+def test_reset_does_not_rehydrate():
+    history = [HumanMessage(content="h0"), AIMessage(content="a0")]
+    loader = FakeHistoryLoader({7: history})
+    store = ConversationMemoryStore(history_loader=loader, max_sessions=10, window=4)
+    store.append(7, HumanMessage(content="h1"))
+
+    store.reset(7)
+    assert store.get(7) == []
+    assert len(loader.calls) == 1
+
+    store.clear()
+    assert contents(store.get(7)) == ["h0", "a0"]
@@ -0,0 +1,77 @@
+# test_conversion_cache.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import Config
+from app.rag import conversion_cache
+from app.rag.conversion_cache import DOCLING_NAMESPACE, OCR_NAMESPACE, docling_cache_key, \
+    enforce_cache_size_limit, get_cached, ocr_cache_key, put_cached
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "CONVERSION_CACHE_DIR", str(tmp_path / "conversion_cache"))
+    return tmp_path / "conversion_cache"
+
+
+def test_put_and_get():
+    key = docling_cache_key("hash-file", ".docx")
+    assert get_cached(DOCLING_NAMESPACE, key) is None
+
+    documents = [{"page_content": "Điều 1. Phạm vi", "metadata": {"page": 1}}]
+    put_cached(DOCLING_NAMESPACE, key, documents)
+    assert get_cached(DOCLING_NAMESPACE, key) == documents
+    # Cung khoa o namespace khac la entry khac
+    assert get_cached(OCR_NAMESPACE, key) is None
+
+
+def test_docling_key_depends_on_hash_and_extension():
+    assert docling_cache_key("h", ".docx") == docling_cache_key("h", ".docx")
+    assert docling_cache_key("h", ".docx") != docling_cache_key("h", ".txt")
+    assert docling_cache_key("h", ".docx") != docling_cache_key("h2", ".docx")
+
+
+def test_ocr_key_depends_on_image_and_tesseract_settings(monkeypatch):
+    key = ocr_cache_key("L", 2, 2, b"\x00\x01\x02\x03")
+    assert key == ocr_cache_key("L", 2, 2, b"\x00\x01\x02\x03")
+    assert key != ocr_cache_key("L", 2, 2, b"\x00\x01\x02\x04")
+    assert key != ocr_cache_key("L", 4, 1, b"\x00\x01\x02\x03")
+
+    monkeypatch.setattr(Config, "OCR_TESSERACT_PSM", Config.OCR_TESSERACT_PSM + 1)
+    assert key != ocr_cache_key("L", 2, 2, b"\x00\x01\x02\x03")
+
+
+def test_corrupt_entry_is_a_miss():
+    key = ocr_cache_key("L", 1, 1, b"\x00")
+    put_cached(OCR_NAMESPACE, key, "van ban")
+    with open(conversion_cache._entry_path(OCR_NAMESPACE, key), "w", encoding="utf-8") as f:
+        f.write("{hong")
+    assert get_cached(OCR_NAMESPACE, key) is None
+
+
+def test_eviction_removes_least_recently_used_entries():
+    keys = [ocr_cache_key("L", 1, 1, bytes([i])) for i in range(4)]
+    for age, key in enumerate(keys):
+        put_cached(OCR_NAMESPACE, key, "x" * 100)
+        # Entry dau tien cu nhat
+        old_time = 1_000_000 + age
+        os.utime(conversion_cache._entry_path(OCR_NAMESPACE, key), (old_time, old_time))
+
+    # Doc lai entry cu nhat: no tro thanh entry dung gan day nhat
+    assert get_cached(OCR_NAMESPACE, keys[0]) == "x" * 100
+
+    entry_size = os.path.getsize(conversion_cache._entry_path(OCR_NAMESPACE, keys[0]))
+    enforce_cache_size_limit(max_bytes=2 * entry_size)
+
+    remaining = [key for key in keys if get_cached(OCR_NAMESPACE, key) is not None]
+    assert remaining == [keys[0], keys[3]]
+
+
+def test_eviction_without_cache_dir_is_noop(cache_dir):
+    enforce_cache_size_limit(max_bytes=0)
+    assert not cache_dir.exists()
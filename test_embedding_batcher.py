@@ -0,0 +1,168 @@
+# test_embedding_batcher.py
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Listener
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import Config
+from app.rag.embedding_batcher import MicroBatchingEmbeddings, RemoteEmbeddings, _handle_connection, \
+    _server_settings
+
+# Cong khong co server lang nghe: ket noi bi tu choi ngay
+UNREACHABLE_ADDRESS = "127.0.0.1:1"
+
+
+class CountingEmbeddings(Embeddings):
+    """Embedding gia: vector suy ra tu noi dung, ghi lai cac lo duoc embed"""
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def vector(text: str) -> list:
+        return [float(len(text)), float(ord(text[0]))]
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("model loi")
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_concurrent_queries_share_one_batch():
+    embeddings = CountingEmbeddings()
+    # Lo dong ngay khi du 4 cau, thoi gian cho du dai de 4 thread cung vao lo
+    batcher = MicroBatchingEmbeddings(embeddings, max_batch_size=4, max_wait_ms=2000)
+    texts = ["a", "bb", "ccc", "dddd"]
+    start = threading.Barrier(len(texts))
+
+    def embed(text):
+        start.wait()
+        return batcher.embed_query(text)
+
+    with ThreadPoolExecutor(max_workers=len(texts)) as executor:
+        results = list(executor.map(embed, texts))
+
+    assert len(embeddings.batches) == 1
+    assert sorted(embeddings.batches[0]) == texts
+    assert results == [CountingEmbeddings.vector(text) for text in texts]
+    assert batcher.get_stats()["batches"] == 1
+    assert batcher.get_stats()["avg_batch_size"] == 4.0
+
+
+def test_each_request_gets_its_own_vectors_in_order():
+    embeddings = CountingEmbeddings()
+    batcher = MicroBatchingEmbeddings(embeddings, max_batch_size=5, max_wait_ms=2000)
+    groups = [["x", "yy"], ["zzz"], ["uuuu", "v"]]
+    start = threading.Barrier(len(groups))
+
+    def embed(texts):
+        start.wait()
+        return batcher.embed_batched(texts)
+
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        results = list(executor.map(embed, groups))
+
+    assert len(embeddings.batches) == 1
+    for texts, vectors in zip(groups, results):
+        assert vectors == [CountingEmbeddings.vector(text) for text in texts]
+
+
+def test_model_error_is_raised_to_every_caller():
+    batcher = MicroBatchingEmbeddings(CountingEmbeddings(fail=True), max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.embed_query("a")
+    # Thread gom lo van chay sau loi
+    with pytest.raises(RuntimeError):
+        batcher.embed_query("b")
+
+
+def test_large_batches_bypass_batcher():
+    embeddings = CountingEmbeddings()
+    batcher = MicroBatchingEmbeddings(embeddings, max_batch_size=2, max_wait_ms=2000)
+    assert batcher.embed_documents(["a", "b", "c"]) == [CountingEmbeddings.vector(t) for t in ["a", "b", "c"]]
+    assert batcher.get_stats()["batches"] == 0
+    assert batcher.embed_documents([]) == [] and batcher.get_stats()["batches"] == 0
+
+
+def test_server_settings_require_authkey_and_loopback(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDING_SERVER_AUTHKEY", None)
+    monkeypatch.setattr(Config, "EMBEDDING_SERVER_ALLOW_REMOTE", False)
+    with pytest.raises(ValueError):
+        _server_settings("127.0.0.1:6390")
+    with pytest.raises(ValueError):
+        _server_settings("10.0.0.5:6390", "bi-mat")
+    assert _server_settings("localhost:6390", "bi-mat") == (("localhost", 6390), b"bi-mat")
+    assert _server_settings("[::1]:6390", "bi-mat")[0] == ("[::1]", 6390)
+
+    monkeypatch.setattr(Config, "EMBEDDING_SERVER_ALLOW_REMOTE", True)
+    assert _server_settings("10.0.0.5:6390", "bi-mat")[0] == ("10.0.0.5", 6390)
+
+
+def test_remote_embeddings_round_trip():
+    embeddings = CountingEmbeddings()
+    batcher = MicroBatchingEmbeddings(embeddings, max_batch_size=4, max_wait_ms=1)
+    with Listener(("127.0.0.1", 0), authkey=b"bi-mat") as listener:
+        port = listener.address[1]
+        threading.Thread(target=lambda: _handle_connection(listener.accept(), batcher), daemon=True).start()
+
+        remote = RemoteEmbeddings(address=f"127.0.0.1:{port}", authkey="bi-mat")
+        assert remote.embed_query("học bổng") == CountingEmbeddings.vector("học bổng")
+        assert remote.embed_documents(["a", "bb"]) == [CountingEmbeddings.vector(t) for t in ["a", "bb"]]
+        assert remote.get_stats()["requests"] == 2
+
+
+def test_remote_embeddings_fall_back_when_server_unreachable(monkeypatch):
+    monkeypatch.setattr(Config, "EMBEDDING_SERVER_RETRY_SECONDS", 30)
+    fallback = CountingEmbeddings()
+    factory_calls = []
+
+    def fallback_factory():
+        factory_calls.append(1)
+        return fallback
+
+    remote = RemoteEmbeddings(address=UNREACHABLE_ADDRESS, authkey="k", fallback_factory=fallback_factory)
+    server_requests = []
+    request = remote._request
+
+    def counting_request(texts):
+        server_requests.append(texts)
+        return request(texts)
+
+    monkeypatch.setattr(remote, "_request", counting_request)
+
+    assert remote.embed_query("học bổng") == CountingEmbeddings.vector("học bổng")
+    assert remote.embed_documents(["a"]) == [CountingEmbeddings.vector("a")]
+
+    # Chi thu server mot lan, lan sau dung thang model trong process cho den het thoi gian cho
+    assert len(server_requests) == 1
+    assert len(factory_calls) == 1
+    stats = remote.get_stats()
+    assert stats["fallback_requests"] == 2
+    assert stats["consecutive_failures"] == 1
+    assert not stats["server_available"]
+
+
+def test_remote_embeddings_without_fallback_raise():
+    remote = RemoteEmbeddings(address=UNREACHABLE_ADDRESS, authkey="k")
+    with pytest.raises(OSError):
+        remote.embed_query("học bổng")
+
+
+def test_remote_embeddings_raise_when_fallback_unavailable():
+    remote = RemoteEmbeddings(address=UNREACHABLE_ADDRESS, authkey="k", fallback_factory=lambda: None)
+    with pytest.raises(RuntimeError):
+        remote.embed_query("học bổng")
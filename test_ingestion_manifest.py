@@ -0,0 +1,87 @@
+# test_ingestion_manifest.py
+
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.rag.ingestion_manifest import compute_file_hash, is_manifest_compatible, load_manifest, new_manifest, \
+    plan_ingestion, save_manifest
+
+
+def manifest_with_files(files: dict) -> dict:
+    manifest = new_manifest()
+    manifest["files"] = {name: {"hash": file_hash, "chunk_ids": [f"{name}_chunk_0"]}
+                         for name, file_hash in files.items()}
+    return manifest
+
+
+def test_compute_file_hash(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"noi dung")
+    assert compute_file_hash(str(path)) == hashlib.sha256(b"noi dung").hexdigest()
+
+
+def test_plan_without_manifest_processes_every_file():
+    changed, deleted = plan_ingestion(None, {"b.pdf": "2", "a.pdf": "1"})
+    assert changed == ["a.pdf", "b.pdf"]
+    assert deleted == []
+
+
+def test_plan_with_manifest_only_processes_new_and_changed_files():
+    manifest = manifest_with_files({"a.pdf": "1", "b.pdf": "2", "c.pdf": "3"})
+    changed, deleted = plan_ingestion(manifest, {"a.pdf": "1", "b.pdf": "2-moi", "d.pdf": "4"})
+    assert changed == ["b.pdf", "d.pdf"]
+    assert deleted == ["c.pdf"]
+
+
+def test_plan_with_empty_directory_deletes_every_file():
+    manifest = manifest_with_files({"a.pdf": "1", "b.pdf": "2"})
+    assert plan_ingestion(manifest, {}) == ([], ["a.pdf", "b.pdf"])
+
+
+def test_manifest_compatibility():
+    assert not is_manifest_compatible(None)
+    assert is_manifest_compatible(new_manifest())
+
+    for key, value in (("model_name", "model-khac"), ("embedding_backend", "backend-khac"), ("chunk_size", -1),
+                       ("format_version", 0)):
+        manifest = new_manifest()
+        manifest[key] = value
+        assert not is_manifest_compatible(manifest), key
+
+    manifest = new_manifest()
+    manifest["hnsw"]["space"] = "l2" if manifest["hnsw"]["space"] != "l2" else "ip"
+    assert not is_manifest_compatible(manifest)
+
+    manifest = new_manifest()
+    manifest["extraction"]["ocr_dpi"] += 1
+    assert not is_manifest_compatible(manifest)
+
+    # Manifest format cu (chua ghi backend embedding) phai build lai
+    manifest = new_manifest()
+    del manifest["embedding_backend"]
+    assert not is_manifest_compatible(manifest)
+
+
+def test_incompatible_manifest_reprocesses_every_file():
+    manifest = manifest_with_files({"a.pdf": "1", "b.pdf": "2"})
+    manifest["chunk_size"] = -1
+    assert plan_ingestion(manifest, {"a.pdf": "1"}) == (["a.pdf"], [])
+
+
+def test_save_and_load_manifest(tmp_path):
+    manifest_path = str(tmp_path / "snapshot" / "manifest.json")
+    manifest = manifest_with_files({"tài liệu.pdf": "1"})
+    save_manifest(manifest, manifest_path)
+    assert load_manifest(manifest_path) == manifest
+    assert is_manifest_compatible(load_manifest(manifest_path))
+
+
+def test_load_missing_or_corrupt_manifest(tmp_path):
+    assert load_manifest(None) is None
+    assert load_manifest(str(tmp_path / "khong_co.json")) is None
+    corrupt_path = tmp_path / "manifest.json"
+    corrupt_path.write_text("{khong phai json", encoding="utf-8")
+    assert load_manifest(str(corrupt_path)) is None
@@ -0,0 +1,69 @@
+# test_metadata_filter.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.rag.metadata_filter import MetadataMaskCache, build_source_filter, metadata_matches
+
+METADATA = {"source_file": "quy_che.pdf", "page_number": 3, "collection": "dao_tao"}
+
+
+def test_empty_filter_matches_everything():
+    assert metadata_matches(METADATA, None)
+    assert metadata_matches(METADATA, {})
+    assert metadata_matches(None, None)
+
+
+def test_plain_equality_and_eq():
+    assert metadata_matches(METADATA, {"source_file": "quy_che.pdf"})
+    assert not metadata_matches(METADATA, {"source_file": "hoc_bong.pdf"})
+    assert metadata_matches(METADATA, {"page_number": {"$eq": 3}})
+    assert metadata_matches(METADATA, {"page_number": {"$ne": 4}})
+
+
+def test_in_and_nin():
+    assert metadata_matches(METADATA, {"source_file": {"$in": ["a.pdf", "quy_che.pdf"]}})
+    assert not metadata_matches(METADATA, {"source_file": {"$nin": ["a.pdf", "quy_che.pdf"]}})
+
+
+def test_range_operators_reject_missing_values():
+    assert metadata_matches(METADATA, {"page_number": {"$gte": 3, "$lt": 5}})
+    assert not metadata_matches(METADATA, {"page_number": {"$gt": 3}})
+    # Chunk khong co truong nay khong duoc thoa so sanh
+    assert not metadata_matches({"source_file": "a.pdf"}, {"page_number": {"$lte": 10}})
+
+
+def test_and_or():
+    where = {"$or": [{"source_file": "a.pdf"}, {"$and": [{"collection": "dao_tao"}, {"page_number": 3}]}]}
+    assert metadata_matches(METADATA, where)
+    assert not metadata_matches(METADATA, {"$and": [{"collection": "dao_tao"}, {"page_number": 4}]})
+
+
+def test_unsupported_operator_raises():
+    with pytest.raises(ValueError):
+        metadata_matches(METADATA, {"page_number": {"$regex": "3"}})
+
+
+def test_build_source_filter():
+    assert build_source_filter([]) is None
+    assert build_source_filter(["b.pdf", "b.pdf"]) == {"source_file": "b.pdf"}
+    assert build_source_filter(["b.pdf", "a.pdf"]) == {"source_file": {"$in": ["a.pdf", "b.pdf"]}}
+
+
+def test_mask_cache_matches_filter_and_reuses_mask():
+    metadatas = [{"source_file": "a.pdf"}, {"source_file": "b.pdf"}, {}, {"source_file": "a.pdf"}]
+    cache = MetadataMaskCache(metadatas, max_entries=1)
+
+    mask = cache.mask({"source_file": "a.pdf"})
+    assert mask.tolist() == [True, False, False, True]
+    assert cache.mask({"source_file": "a.pdf"}) is mask
+
+    # Vuot max_entries: mat na cu bi loai, tinh lai van dung
+    assert cache.mask({"source_file": "b.pdf"}).tolist() == [False, True, False, False]
+    recomputed = cache.mask({"source_file": "a.pdf"})
+    assert recomputed is not mask
+    assert recomputed.tolist() == mask.tolist()
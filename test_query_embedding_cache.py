@@ -0,0 +1,80 @@
+# test_query_embedding_cache.py
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.rag.query_embedding_cache import QueryEmbeddingCache
+
+
+class CountingEmbeddings:
+    """Embedding gia: vector phu thuoc noi dung, ghi lai cac lo duoc embed"""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[len(text) / 10.0, 0.123456789, -1.0] for text in texts]
+
+
+def test_embeds_only_missing_queries_once():
+    embeddings = CountingEmbeddings()
+    cache = QueryEmbeddingCache(max_entries=10, use_float16=False)
+
+    vectors = cache.embed_queries(["học bổng", "ký túc xá", "học bổng"], embeddings)
+    # Truy van trung lap trong cung lo chi embed mot lan
+    assert embeddings.batches == [["học bổng", "ký túc xá"]]
+    assert vectors[0] == vectors[2]
+
+    cache.embed_queries([" học bổng ", "điểm rèn luyện"], embeddings)
+    # Khoang trang hai dau khong tao khoa moi
+    assert embeddings.batches[-1] == ["điểm rèn luyện"]
+
+
+def test_lru_eviction():
+    embeddings = CountingEmbeddings()
+    cache = QueryEmbeddingCache(max_entries=2, use_float16=False)
+    cache.embed_queries(["a", "b"], embeddings)
+    # Doc "a": "b" tro thanh phan tu dung lau nhat
+    cache.get_many(["a"])
+    cache.embed_queries(["c"], embeddings)
+
+    assert cache.get_many(["a", "b", "c"])[1] is None
+    assert cache.get_stats()["entries"] == 2
+
+
+def test_float16_round_trip():
+    vector = [0.1, 0.123456789, -0.987654321]
+    cache = QueryEmbeddingCache(max_entries=10, use_float16=True)
+    cache.put_many(["q"], [vector])
+
+    cached = cache.get_many(["q"])[0]
+    assert isinstance(cached, list) and all(isinstance(value, float) for value in cached)
+    assert cached == pytest.approx(vector, abs=1e-3)
+    assert cache._entries["q"].dtype == np.float16
+
+    exact = QueryEmbeddingCache(max_entries=10, use_float16=False)
+    exact.put_many(["q"], [vector])
+    assert exact.get_many(["q"])[0] == pytest.approx(vector, abs=1e-7)
+
+
+def test_hit_ratio_stats():
+    cache = QueryEmbeddingCache(max_entries=10, use_float16=False)
+    assert cache.get_stats()["hit_ratio"] == 0.0
+
+    embeddings = CountingEmbeddings()
+    cache.embed_queries(["a", "b", "c"], embeddings)
+    cache.embed_queries(["a", "d"], embeddings)
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 4)
+    assert stats["hit_ratio"] == 0.2
+
+    cache.clear()
+    assert cache.get_stats()["entries"] == 0
+    assert cache.get_stats()["hits"] == 0
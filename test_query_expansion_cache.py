@@ -0,0 +1,108 @@
+# test_query_expansion_cache.py
+
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import Config
+from app.rag import query_expansion_cache
+from app.rag.query_expansion_cache import QueryExpansionCache
+
+EXPANSION = {"expanded_question": "Điều kiện xét học bổng khuyến khích", "keywords": "học bổng, điều kiện"}
+
+
+@pytest.fixture
+def atexit_callbacks(monkeypatch):
+    """Giu lai ham dang ky atexit thay vi dang ky that (tranh ghi file sau khi test ket thuc)"""
+    callbacks = []
+    monkeypatch.setattr(query_expansion_cache.atexit, "register", callbacks.append)
+    return callbacks
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    return str(tmp_path / "cache" / "query_expansion_cache.json")
+
+
+def wait_for_file(path: str, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_key_normalizes_question_and_depends_on_history():
+    cache = QueryExpansionCache(max_entries=10, cache_file="")
+    cache.put("Học bổng là gì?", "", EXPANSION)
+    assert cache.get("  học   BỔNG là gì ", "") == EXPANSION
+    assert cache.get("Học bổng là gì?", "Human: câu hỏi trước") is None
+    assert cache.get_stats() == {"entries": 1, "hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+
+def test_lru_eviction():
+    cache = QueryExpansionCache(max_entries=2, cache_file="")
+    cache.put("a", "", EXPANSION)
+    cache.put("b", "", EXPANSION)
+    # Doc "a": "b" tro thanh phan tu dung lau nhat
+    assert cache.get("a", "") is not None
+    cache.put("c", "", EXPANSION)
+    assert cache.get("b", "") is None
+    assert cache.get("a", "") is not None
+    assert cache.get("c", "") is not None
+
+
+def test_timer_flushes_changes_in_background(monkeypatch, atexit_callbacks, cache_file):
+    monkeypatch.setattr(Config, "QUERY_EXPANSION_CACHE_FLUSH_SECONDS", 0.05)
+    cache = QueryExpansionCache(max_entries=10, cache_file=cache_file)
+    cache.put("học bổng", "", EXPANSION)
+
+    assert wait_for_file(cache_file)
+    with open(cache_file, "r", encoding="utf-8") as f:
+        assert list(json.load(f).values()) == [EXPANSION]
+
+
+def test_atexit_writes_pending_changes(monkeypatch, atexit_callbacks, cache_file):
+    # Timer chua kip chay truoc khi process thoat
+    monkeypatch.setattr(Config, "QUERY_EXPANSION_CACHE_FLUSH_SECONDS", 60)
+    cache = QueryExpansionCache(max_entries=10, cache_file=cache_file)
+    assert atexit_callbacks == [cache.flush]
+
+    cache.put("học bổng", "", EXPANSION)
+    assert not os.path.exists(cache_file)
+
+    for callback in atexit_callbacks:
+        callback()
+    assert os.path.exists(cache_file)
+    # Khong con file tam cua process
+    assert os.listdir(os.path.dirname(cache_file)) == [os.path.basename(cache_file)]
+
+
+def test_reload_persisted_cache(monkeypatch, atexit_callbacks, cache_file):
+    monkeypatch.setattr(Config, "QUERY_EXPANSION_CACHE_FLUSH_SECONDS", 60)
+    cache = QueryExpansionCache(max_entries=10, cache_file=cache_file)
+    for question in ("a", "b", "c"):
+        cache.put(question, "", {"expanded_question": question})
+    cache.flush()
+
+    reloaded = QueryExpansionCache(max_entries=10, cache_file=cache_file)
+    assert reloaded.get("b", "") == {"expanded_question": "b"}
+
+    # Cache nho hon file: chi giu cac muc moi nhat
+    smaller = QueryExpansionCache(max_entries=2, cache_file=cache_file)
+    assert smaller.get("a", "") is None
+    assert smaller.get("c", "") == {"expanded_question": "c"}
+
+
+def test_corrupt_cache_file_is_ignored(atexit_callbacks, cache_file):
+    os.makedirs(os.path.dirname(cache_file))
+    with open(cache_file, "w", encoding="utf-8") as f:
+        f.write("{hong")
+    cache = QueryExpansionCache(max_entries=10, cache_file=cache_file)
+    assert cache.get_stats()["entries"] == 0
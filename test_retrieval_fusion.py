@@ -0,0 +1,67 @@
+# test_retrieval_fusion.py
+
+import os
+import sys
+
+import pytest
+from langchain_core.documents import Document
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.rag.retrieval_fusion import FUSION_RRF, FUSION_SCORE, fuse_retrieval_results
+
+
+def vector_doc(chunk_id: str, similarity: float) -> Document:
+    return Document(page_content=chunk_id, metadata={"chunk_id": chunk_id, "similarity": similarity})
+
+
+def bm25_doc(chunk_id: str, bm25_score: float) -> Document:
+    return Document(page_content=chunk_id, metadata={"chunk_id": chunk_id, "bm25_score": bm25_score})
+
+
+def chunk_ids(docs) -> list:
+    return [doc.metadata["chunk_id"] for doc in docs]
+
+
+def test_rrf_rewards_chunks_found_by_several_lists():
+    ranked_lists = [
+        ([vector_doc("a", 0.9), vector_doc("b", 0.8)], 1.0),
+        ([vector_doc("b", 0.7), vector_doc("c", 0.6)], 1.0),
+    ]
+    fused = fuse_retrieval_results(ranked_lists, top_k=3, method=FUSION_RRF, rrf_k=60)
+    assert chunk_ids(fused) == ["b", "a", "c"]
+    assert fused[0].metadata["fusion_score"] == pytest.approx(1 / 62 + 1 / 61)
+    # Giu ban co do tuong dong cao nhat cua chunk
+    assert fused[0].metadata["similarity"] == 0.8
+
+
+def test_top_k_and_min_similarity():
+    ranked_lists = [([vector_doc("a", 0.9), vector_doc("b", 0.1), vector_doc("c", 0.5)], 1.0)]
+    fused = fuse_retrieval_results(ranked_lists, top_k=5, method=FUSION_RRF, min_similarity=0.2)
+    assert chunk_ids(fused) == ["a", "c"]
+    assert len(fuse_retrieval_results(ranked_lists, top_k=1)) == 1
+
+
+def test_score_fusion_takes_weighted_maximum():
+    ranked_lists = [
+        ([vector_doc("a", 0.6), vector_doc("b", 0.5)], 1.0),
+        ([vector_doc("b", 0.8)], 0.5),
+    ]
+    fused = fuse_retrieval_results(ranked_lists, top_k=2, method=FUSION_SCORE)
+    assert chunk_ids(fused) == ["a", "b"]
+    assert fused[1].metadata["fusion_score"] == pytest.approx(0.5)
+
+
+def test_score_fusion_puts_bm25_on_cosine_scale():
+    ranked_lists = [
+        ([vector_doc("a", 0.6), vector_doc("b", 0.4)], 1.0),
+        ([bm25_doc("c", 12.0), bm25_doc("d", 3.0), bm25_doc("b", 6.0)], 1.0),
+    ]
+    fused = fuse_retrieval_results(ranked_lists, top_k=4, method=FUSION_SCORE)
+    scores = {doc.metadata["chunk_id"]: doc.metadata["fusion_score"] for doc in fused}
+
+    # Ket qua BM25 tot nhat ngang ket qua vector tot nhat, cac ket qua khac ti le theo diem BM25
+    assert scores["c"] == pytest.approx(0.6)
+    assert scores["d"] == pytest.approx(0.15)
+    # Chunk co ca hai diem lay diem lon hon, khong cong them
+    assert scores["b"] == pytest.approx(0.4)
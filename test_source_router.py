@@ -0,0 +1,51 @@
+# test_source_router.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.rag.source_router import SourceRouter, strip_vietnamese_accents
+
+TEXTS = [
+    "Sinh viên đăng ký học phần trong thời gian quy định. Điểm học phần được tính theo thang điểm 10.",
+    "Học bổng khuyến khích học tập được xét mỗi học kỳ cho sinh viên có kết quả học tập tốt.",
+    "Sinh viên ở ký túc xá phải tuân thủ nội quy ký túc xá và đóng phí ký túc xá đúng hạn.",
+]
+METADATAS = [
+    {"source_file": "quy_che_dao_tao.pdf"},
+    {"source_file": "hoc_bong.docx"},
+    {"source_file": "ky_tuc_xa.pdf"},
+]
+
+
+def build_router(**kwargs) -> SourceRouter:
+    return SourceRouter.build(TEXTS, METADATAS, **kwargs)
+
+
+def test_strip_vietnamese_accents():
+    assert strip_vietnamese_accents("Điều kiện Học Bổng") == "dieu kien hoc bong"
+
+
+def test_route_selects_matching_source():
+    router = build_router()
+    assert router.route("Điều kiện xét học bổng khuyến khích là gì?") == ["hoc_bong.docx"]
+    # Cau hoi khong dau van khop ten file va noi dung
+    assert router.route("noi quy ky tuc xa") == ["ky_tuc_xa.pdf"]
+
+
+def test_route_returns_none_without_signal():
+    router = build_router()
+    assert router.route("Xin chào") is None
+    # Tu khoa co mat o moi file khong phan biet duoc nguon
+    assert router.route("sinh viên") is None
+
+
+def test_route_returns_none_when_every_source_is_candidate():
+    router = build_router(min_score=0.0, relative_score=0.0)
+    assert router.route("học bổng") is None
+
+
+def test_single_source_is_never_routed():
+    router = SourceRouter.build(TEXTS[:1], METADATAS[:1])
+    assert router.route("đăng ký học phần") is None
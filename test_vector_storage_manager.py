@@ -0,0 +1,89 @@
+# test_vector_storage_manager.py
+
+import os
+import sys
+
+import chromadb
+import pytest
+from chromadb.api.client import SharedSystemClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import Config
+from app.rag import vector_storage_manager
+from app.rag.index_version import create_snapshot, publish_snapshot
+from app.rag.vector_storage_manager import VectorStoreManager, get_chroma_shared_system_cache, release_chroma_client
+
+COLLECTION_NAME = Config.DEFAULT_COLLECTION_NAME
+
+
+@pytest.fixture(autouse=True)
+def isolated_manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "INDEX_SNAPSHOT_ROOT", str(tmp_path / "index_snapshots"))
+    monkeypatch.setattr(Config, "VECTOR_DB_PATH", str(tmp_path / "chroma_db"))
+    monkeypatch.setattr(Config, "INDEX_SNAPSHOTS_KEEP", 3)
+    # Doc lai CURRENT o moi truy van va dong client cu ngay lap tuc
+    monkeypatch.setattr(Config, "INDEX_VERSION_CHECK_SECONDS", 0)
+    monkeypatch.setattr(Config, "INDEX_CLIENT_RELEASE_DELAY_SECONDS", 0)
+    for name in ("_client_instances", "_collection_instances", "_loaded_versions", "_version_checked_at",
+                 "_current_versions"):
+        monkeypatch.setattr(VectorStoreManager, name, {})
+    monkeypatch.setattr(VectorStoreManager, "_retired_clients", [])
+    # Khong tai model embedding that
+    monkeypatch.setattr(VectorStoreManager, "_embedding_model", object())
+
+
+def publish_chunks(n_chunks: int) -> str:
+    """Build mot snapshot co n_chunks chunk roi cong bo no"""
+    version, paths = create_snapshot(COLLECTION_NAME)
+    writer = chromadb.PersistentClient(path=paths["chroma"])
+    writer.create_collection(name=COLLECTION_NAME).add(
+        ids=[f"chunk_{i}" for i in range(n_chunks)],
+        embeddings=[[1.0, float(i)] for i in range(n_chunks)],
+        documents=[f"noi dung {i}" for i in range(n_chunks)])
+    release_chroma_client(writer)
+    publish_snapshot(version, COLLECTION_NAME)
+    return version
+
+
+def test_switches_snapshot_and_releases_old_client():
+    manager = VectorStoreManager()
+    first_version = publish_chunks(1)
+    assert manager.get_current_collection().count() == 1
+    first_client = VectorStoreManager._client_instances[COLLECTION_NAME]
+    assert first_client._identifier in SharedSystemClient._identifier_to_system
+
+    second_version = publish_chunks(2)
+    assert second_version != first_version
+    assert manager.get_current_collection().count() == 2
+    assert VectorStoreManager._loaded_versions[COLLECTION_NAME] == second_version
+    assert VectorStoreManager._client_instances[COLLECTION_NAME] is not first_client
+    assert [client for _, client in VectorStoreManager._retired_clients] == [first_client]
+
+    # Lan kiem tra phien ban ke tiep dong client cua snapshot cu
+    manager.current_index_version()
+    assert VectorStoreManager._retired_clients == []
+    assert first_client._identifier not in SharedSystemClient._identifier_to_system
+    assert VectorStoreManager._client_instances[COLLECTION_NAME]._identifier in SharedSystemClient._identifier_to_system
+    assert manager.get_current_collection().count() == 2
+
+
+def test_empty_snapshot_stops_serving_old_collection():
+    manager = VectorStoreManager()
+    publish_chunks(1)
+    assert manager.get_current_collection() is not None
+
+    manager.delete_vector_store()
+    assert manager.get_current_collection() is None
+    assert len(VectorStoreManager._retired_clients) == 1
+
+
+def test_shared_system_cache_requires_known_chromadb_version(monkeypatch):
+    assert isinstance(get_chroma_shared_system_cache(), dict)
+
+    monkeypatch.setattr(vector_storage_manager.chromadb, "__version__", "1.1.0")
+    with pytest.raises(RuntimeError):
+        get_chroma_shared_system_cache()
+    # release_chroma_client khong am tham bo qua loi nay
+    with pytest.raises(RuntimeError):
+        release_chroma_client(object())